@@ -10,7 +10,14 @@ from bson import ObjectId
 from config import DevelopmentConfig
 from utils.database import init_db, mongo
 from routes.auth import auth_bp, token_required
-from routes.face_auth import face_auth_bp
+from utils.auth_utils import lookup_token, forget_token, token_expired, revoke_principal
+from utils.sessions import create_session, find_session, session_expired, rotate_session, end_session
+from routes.face_auth import face_auth_bp, identify_face, bus_route, read_image, claimed_user
+from routes.edge import edge_bp
+from face_processing.quality import describe as describe_face_quality
+from face_processing.gallery import gallery
+from face_processing.jobs import registration_jobs
+from face_processing.governor import InferenceBusy
 from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
 from werkzeug.security import generate_password_hash
@@ -45,6 +52,15 @@ init_db(app)
 # Blueprints
 app.register_blueprint(auth_bp, url_prefix="/auth")
 app.register_blueprint(face_auth_bp, url_prefix="/api/face_auth")
+app.register_blueprint(edge_bp, url_prefix="/api/edge")
+
+@app.errorhandler(InferenceBusy)
+def inference_busy(e):
+    # Face models saturated in this worker: fail fast rather than queue
+    response = jsonify({"success": False, "message": "Face verification is busy, please retry", "retry_after": e.retry_after})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
 
 scheduler = BackgroundScheduler()
 # Email configuration
@@ -67,30 +83,7 @@ def generate_password(length=12):
     return ''.join(secrets.choice(alphabet) for i in range(length))
 password = generate_password()
 hashed_password = generate_password_hash(password)
-# Add this function to clean up expired tokens on startup
-def cleanup_expired_tokens():
-    """Remove expired tokens from database"""
-    try:
-        now = datetime.utcnow()
-        
-        # Clean users collection
-        mongo.db.users.update_many(
-            {"tokenExpiry": {"$lt": now}},
-            {"$unset": {"token": "", "tokenExpiry": ""}}
-        )
-        
-        # Clean conductors collection
-        mongo.db.conductors.update_many(
-            {"tokenExpiry": {"$lt": now}},
-            {"$unset": {"token": "", "tokenExpiry": ""}}
-        )
-        
-        print("Expired tokens cleaned up")
-    except Exception as e:
-        print(f"Error cleaning up expired tokens: {e}")
-
-# Then call it
-# cleanup_expired_tokens()  # REMOVE THIS LINE - it's being called later in the app context
+# Expired login sessions are removed by Mongo (TTL index on sessions.expires_at, see utils/database.py)
 # Add this before_request handler:
 
 def check_email_config():
@@ -113,7 +106,6 @@ def check_email_config():
 # Call this function during startup
 with app.app_context():
     check_email_config()
-    cleanup_expired_tokens()
 def validate_date_format(date_string):
     """Validate that a date string is in expected format"""
     if not date_string:
@@ -161,6 +153,13 @@ def format_verification_response(verification):
     
     return verification_data
 def token_required(f):
+    """
+    Session token auth. The view gets a slim principal (utils.auth_utils.lookup_token),
+    not the account document: _id (str), role ("user" or "conductor"), tokenExpiry and
+    whichever of name, email, user_type, conductorId, depot the account has. It is cached
+    per token for up to TOKEN_CACHE_TTL seconds, so views that need other fields, or must
+    see live values, re-read the account by _id.
+    """
     @wraps(f)
     def decorated(*args, **kwargs):
         token = None
@@ -175,34 +174,22 @@ def token_required(f):
             return jsonify({'message': 'Token is missing!'}), 401
         
         try:
-            # Check both collections
-            current_user = mongo.db.users.find_one({"token": token})
-            if not current_user:
-                current_user = mongo.db.conductors.find_one({"token": token})
+            # Users, then conductors; slim principal with a string _id (cached per token)
+            current_user = lookup_token(token)
             
             if not current_user:
                 return jsonify({'message': 'Token is invalid!'}), 401
                 
             # Check if token is expired
-            if (current_user.get("tokenExpiry") and 
-                current_user["tokenExpiry"] < datetime.utcnow()):
+            if token_expired(current_user):
                 return jsonify({'message': 'Token has expired!'}), 401
             
-            # Convert ObjectId to string for consistency
-            current_user['_id'] = str(current_user['_id'])
-            
         except Exception as e:
             return jsonify({'message': 'Token is invalid!'}), 401
         
         return f(current_user, *args, **kwargs)
     
     return decorated
-# Add this function to clean up expired tokens on startup
-# Move this function to be before the call to it
-
-# Then call it
-cleanup_expired_tokens()
-# Add this to your app.py to clean up expired tokens on startup
 @app.route('/api/debug/token-storage', methods=['GET'])
 def debug_token_storage():
     """Debug endpoint to check where tokens are stored"""
@@ -211,27 +198,17 @@ def debug_token_storage():
     if not token:
         return jsonify({'error': 'No token provided'}), 400
     
-    # Check users collection
-    user_with_token = mongo.db.users.find_one({"token": token})
-    conductor_with_token = mongo.db.conductors.find_one({"token": token})
-    
-    # Get all tokens in system for debugging
-    all_user_tokens = list(mongo.db.users.find({"token": {"$exists": True}}, {"token": 1, "email": 1, "_id": 1}))
-    all_conductor_tokens = list(mongo.db.conductors.find({"token": {"$exists": True}}, {"token": 1, "conductorId": 1, "_id": 1}))
-    
-    # Convert ObjectId to string
-    for item in all_user_tokens:
-        item['_id'] = str(item['_id'])
-    for item in all_conductor_tokens:
-        item['_id'] = str(item['_id'])
+    # Tokens live in the sessions collection (hashed), one per device
+    session = find_session(token)
     
     return jsonify({
         'provided_token': f"{token[:10]}...{token[-10:]}" if token else None,
         'token_length': len(token) if token else 0,
-        'found_in_users': user_with_token is not None,
-        'found_in_conductors': conductor_with_token is not None,
-        'all_user_tokens': all_user_tokens,
-        'all_conductor_tokens': all_conductor_tokens
+        'found_in_users': bool(session) and session['role'] == 'user',
+        'found_in_conductors': bool(session) and session['role'] == 'conductor',
+        'expires_at': session['expires_at'].isoformat() if session else None,
+        'user_sessions': mongo.db.sessions.count_documents({"role": "user"}),
+        'conductor_sessions': mongo.db.sessions.count_documents({"role": "conductor"})
     })
 def parse_date(date_value):
     """Parse various date formats into datetime object"""
@@ -376,6 +353,9 @@ def check_expired_passes():
 scheduler.add_job(func=check_expired_passes, trigger="interval", days=1)
 scheduler.start()
 
+# Face registration job workers for this process
+registration_jobs.start()
+
 # Shut down the scheduler when exiting the app
 atexit.register(lambda: scheduler.shutdown())
 def send_approval_email(recipient, student_name, pass_code, expiry_date, password=None):
@@ -587,24 +567,20 @@ def verify_token():
         if not token:
             return jsonify({'valid': False, 'message': 'Token is missing!'}), 401
         
-        # Check both users and conductors collections
-        user = mongo.db.users.find_one({"token": token})
-        conductor = mongo.db.conductors.find_one({"token": token})
-        
-        current_user = user or conductor
+        # One lookup covers users and conductors
+        current_user = lookup_token(token)
         
         if not current_user:
             return jsonify({'valid': False, 'message': 'Token is invalid!'}), 401
         
         # Check if token is expired
-        if (current_user.get("tokenExpiry") and 
-            current_user["tokenExpiry"] < datetime.utcnow()):
+        if token_expired(current_user):
             return jsonify({'valid': False, 'message': 'Token has expired!'}), 401
         
         return jsonify({
             'valid': True,
-            'user_type': 'user' if user else 'conductor',
-            'user_id': str(current_user['_id'])
+            'user_type': current_user['role'],
+            'user_id': current_user['_id']
         })
         
     except Exception as e:
@@ -613,7 +589,7 @@ def verify_token():
 @app.route('/api/users', methods=['GET'])
 def get_users():
     try:
-        users = list(mongo.db.users.find({}, {'password': 0}))  # Exclude password field
+        users = list(mongo.db.users.find({}, {'password': 0, 'face_embeddings': 0}))  # Exclude password and packed embeddings
         # Convert ObjectId to string for JSON serialization
         for user in users:
             user['_id'] = str(user['_id'])
@@ -712,7 +688,7 @@ def get_pending_applications():
         # Get users with Pass_Status = False (pending approval)
         pending_users = list(mongo.db.users.find(
             {"Pass_Status": False}, 
-            {'password': 0}  # Exclude password
+            {'password': 0, 'face_embeddings': 0}  # Exclude password and packed embeddings
         ))
         
         for user in pending_users:
@@ -722,6 +698,25 @@ def get_pending_applications():
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
 
+def queue_applicant_photo_enrolment(user):
+    """
+    Queue a face-registration job from the user's applicant photo.
+    Returns the job id, or None when there is no photo or the user is already enrolled.
+    """
+    if not app.config.get('FACE_ENROL_ON_APPROVAL') or not user or user.get('face_registered'):
+        return None
+    filename = user.get('applicant_photo_filename')
+    if not filename:
+        return None
+    path = os.path.join(app.config['UPLOAD_FOLDER'], 'applicantPhotos', filename)
+    if not os.path.exists(path):
+        return None
+    try:
+        return registration_jobs.submit_paths(str(user['_id']), [path], source="approval")
+    except Exception as e:
+        print(f"Error queueing face enrolment for {user['_id']}: {str(e)}")
+        return None
+
 @app.route('/api/admin/approve-application/<user_id>', methods=['POST'])
 def approve_application(user_id):
     try:
@@ -755,6 +750,8 @@ def approve_application(user_id):
         )
         
         if result.modified_count > 0:
+            gallery.refresh_pass(user_id)
+            
             # Create a bus pass record
             bus_pass_doc = {
                 'user_id': ObjectId(user_id),
@@ -770,6 +767,9 @@ def approve_application(user_id):
             # Get user details for email
             user = mongo.db.users.find_one({'_id': ObjectId(user_id)})
             
+            # Enrol the applicant photo in the background so boarding works straight away
+            face_job_id = queue_applicant_photo_enrolment(user)
+            
             email_sent = False
             if user and user.get('email'):
                 # Try to send approval email (but don't fail if email fails)
@@ -785,6 +785,7 @@ def approve_application(user_id):
                 'success': True, 
                 'pass_code': pass_code,
                 'email_sent': email_sent,
+                'face_job_id': face_job_id,
                 'message': 'Application approved successfully'
             })
         else:
@@ -793,6 +794,45 @@ def approve_application(user_id):
     except Exception as e:
         print(f"Error approving application: {str(e)}")
         return jsonify({'success': False, 'message': 'Failed to approve application'}), 500
+
+@app.route('/api/admin/enrol-applicant-photos', methods=['POST'])
+def enrol_applicant_photos():
+    """
+    Queue face registration for every approved pass holder who has an applicant
+    photo but no stored face yet (backfill for passes approved before auto-enrolment).
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        limit = int(data.get('limit', 0))
+        
+        pending = set(mongo.db.face_jobs.distinct('user_id', {'status': {'$in': ['queued', 'running']}}))
+        cursor = mongo.db.users.find(
+            {
+                'Pass_Status': True,
+                'face_registered': {'$ne': True},
+                'applicant_photo_filename': {'$nin': [None, '']}
+            },
+            {'applicant_photo_filename': 1, 'face_registered': 1}
+        )
+        
+        queued, skipped = 0, 0
+        for user in cursor:
+            if limit and queued >= limit:
+                break
+            if str(user['_id']) in pending or not queue_applicant_photo_enrolment(user):
+                skipped += 1
+                continue
+            queued += 1
+        
+        return jsonify({
+            'success': True,
+            'queued': queued,
+            'skipped': skipped,
+            'message': f'Queued face registration for {queued} pass holders'
+        })
+    except Exception as e:
+        print(f"Error queueing applicant photo enrolment: {str(e)}")
+        return jsonify({'success': False, 'message': 'Failed to queue face registration'}), 500
 @app.route('/api/admin/decline-application/<user_id>', methods=['POST'])
 def decline_application(user_id):
     try:
@@ -812,6 +852,8 @@ def decline_application(user_id):
         )
         
         if result.modified_count > 0:
+            gallery.refresh_pass(user_id)
+            
             # Get user details for email
             user = mongo.db.users.find_one({'_id': ObjectId(user_id)})
             
@@ -838,7 +880,7 @@ def get_all_applications():
         # Get all users regardless of status
         all_users = list(mongo.db.users.find(
             {}, 
-            {'password': 0}  # Exclude password
+            {'password': 0, 'face_embeddings': 0}  # Exclude password and packed embeddings
         ))
         
         for user in all_users:
@@ -918,7 +960,7 @@ def get_user_trip_history(current_user):
 @app.route('/api/users/<user_id>', methods=['GET'])
 def get_user_details(user_id):
     try:
-        user = mongo.db.users.find_one({'_id': ObjectId(user_id)}, {'password': 0})
+        user = mongo.db.users.find_one({'_id': ObjectId(user_id)}, {'password': 0, 'face_embeddings': 0})
         if not user:
             return jsonify({"success": False, "message": "User not found"}), 404
         
@@ -941,6 +983,10 @@ def delete_user(user_id):
         if result.deleted_count > 0:
             # Also delete any associated bus passes
             mongo.db.bus_passes.delete_many({'user_id': ObjectId(user_id)})
+            # Log them out everywhere
+            revoke_principal(user_id)
+            # Drop their embeddings from the in-memory face gallery
+            gallery.remove(user_id)
             
             return jsonify({"success": True, "message": "User deleted successfully"})
         else:
@@ -1031,18 +1077,18 @@ def get_conductor_profile():
         token = token.split(' ')[1]
         
         # Find conductor by token
-        conductor = mongo.db.conductors.find_one({"token": token})
-        if not conductor:
+        conductor = lookup_token(token)
+        if not conductor or conductor["role"] != "conductor":
             return jsonify({"success": False, "message": "Invalid token"}), 401
         
-        # Check token expiration if you implemented it
-        if 'tokenExpiry' in conductor and conductor['tokenExpiry'] < datetime.utcnow():
+        # Check token expiration
+        if token_expired(conductor):
             return jsonify({"success": False, "message": "Token expired"}), 401
         
         return jsonify({
             "success": True,
             "conductor": {
-                "_id": str(conductor["_id"]),
+                "_id": conductor["_id"],
                 "name": conductor.get("name", ""),
                 "conductorId": conductor["conductorId"],
                 "depot": str(conductor.get("depot", ""))
@@ -1058,13 +1104,21 @@ def get_conductor_profile():
 @token_required
 def verify_conductor_token(current_user):
     try:
+        # Live profile: the token principal may be up to TOKEN_CACHE_TTL old
+        conductor = None
+        if current_user["role"] == "conductor":
+            conductor = mongo.db.conductors.find_one(
+                {"_id": ObjectId(current_user["_id"])}, {"conductorId": 1, "name": 1, "depot": 1}
+            )
+        if not conductor:
+            return jsonify({"success": False, "message": "Token verification failed"}), 401
         return jsonify({
             "success": True,
             "conductor": {
-                "_id": str(current_user["_id"]),
-                "conductorId": current_user["conductorId"],
-                "name": current_user["name"],
-                "depot": current_user["depot"]
+                "_id": str(conductor["_id"]),
+                "conductorId": conductor["conductorId"],
+                "name": conductor.get("name", ""),
+                "depot": str(conductor.get("depot", ""))
             }
         })
     except Exception as e:
@@ -1081,28 +1135,22 @@ def refresh_conductor_token():
         
         current_token = auth_header.split(' ')[1]
         
-        # Find conductor by current token
-        conductor = mongo.db.conductors.find_one({"token": current_token})
+        # Find the conductor's session by current token
+        session = find_session(current_token)
         
-        if not conductor:
+        if not session or session["role"] != "conductor":
             return jsonify({"success": False, "message": "Invalid token"}), 401
         
-        # Check if token is expired (optional)
-        if conductor.get("tokenExpiry") and conductor["tokenExpiry"] < datetime.utcnow():
+        # Check if token is expired
+        if session_expired(session):
             return jsonify({"success": False, "message": "Token expired"}), 401
         
-        # Create new token
-        new_token = str(uuid.uuid4())
-        token_expiry = datetime.utcnow() + timedelta(hours=24)
-        
-        # Update conductor with new token
-        mongo.db.conductors.update_one(
-            {"_id": conductor["_id"]},
-            {"$set": {
-                "token": new_token,
-                "tokenExpiry": token_expiry
-            }}
-        )
+        # Swap in a new token on the same session
+        rotated = rotate_session(current_token)
+        forget_token(current_token)
+        if not rotated:
+            return jsonify({"success": False, "message": "Invalid token"}), 401
+        new_token, token_expiry = rotated
         
         return jsonify({
             "success": True,
@@ -1123,12 +1171,9 @@ def get_conductor_stats():
         
         token = token.replace('Bearer ', '')
         
-        conductor = mongo.db.conductors.find_one({
-            "token": token,
-            "tokenExpiry": {"$gt": datetime.utcnow()}
-        })
+        conductor = lookup_token(token)
         
-        if not conductor:
+        if not conductor or conductor["role"] != "conductor" or token_expired(conductor):
             return jsonify({"success": False, "message": "Invalid or expired token"}), 401
         
         # Get date parameter
@@ -1213,18 +1258,12 @@ def conductor_login():
         
         print("✅ Password verified successfully")
         
-        # Generate new token
-        token = str(uuid.uuid4())
-        token_expiry = datetime.utcnow() + timedelta(hours=24)
+        # Generate new token (a new session; other devices stay logged in)
+        token, token_expiry = create_session(conductor, "conductor")
         
-        # Update conductor with new token
         mongo.db.conductors.update_one(
             {"_id": conductor["_id"]},
-            {"$set": {
-                "token": token,
-                "tokenExpiry": token_expiry,
-                "lastLogin": datetime.utcnow()
-            }}
+            {"$set": {"lastLogin": datetime.utcnow()}}
         )
         
         print(f"✅ Login successful, generated token: {token}")
@@ -1361,6 +1400,7 @@ def create_test_conductor():
         existing = mongo.db.conductors.find_one({"conductorId": "test123"})
         if existing:
             mongo.db.conductors.delete_one({"_id": existing["_id"]})
+            revoke_principal(existing["_id"])
         
         # Get any depot ID to use
         depot = mongo.db.depots.find_one()
@@ -1487,7 +1527,10 @@ def conductor_profile():
         if not token:
             return jsonify({"success": False, "message": "Missing token"}), 401
 
-        conductor = mongo.db.conductors.find_one({"token": token})
+        session = find_session(token)
+        if not session or session["role"] != "conductor" or session_expired(session):
+            return jsonify({"success": False, "message": "Unauthorized"}), 401
+        conductor = mongo.db.conductors.find_one({"_id": session["principal_id"]})
         if not conductor:
             return jsonify({"success": False, "message": "Unauthorized"}), 401
 
@@ -1555,17 +1598,17 @@ def debug_check_token():
     if not token:
         return jsonify({'has_token': False, 'message': 'No token provided'})
     
-    # Check both collections
-    user = mongo.db.users.find_one({"token": token})
-    conductor = mongo.db.conductors.find_one({"token": token})
+    # One session lookup covers users and conductors
+    session = find_session(token)
+    role = session['role'] if session else None
     
     return jsonify({
         'has_token': True,
         'token_length': len(token),
-        'found_in_users': user is not None,
-        'found_in_conductors': conductor is not None,
-        'user_id': str(user['_id']) if user else None,
-        'conductor_id': str(conductor['_id']) if conductor else None
+        'found_in_users': role == 'user',
+        'found_in_conductors': role == 'conductor',
+        'user_id': str(session['principal_id']) if role == 'user' else None,
+        'conductor_id': str(session['principal_id']) if role == 'conductor' else None
     })
 
 @app.route('/api/debug/routes-with-auth', methods=['GET'])
@@ -1643,56 +1686,6 @@ def get_user_profile_by_id(current_user, user_id):
     except Exception as e:
         print(f"Error in get_user_profile: {str(e)}")
         return jsonify({"success": False, "message": str(e)}), 500
-@app.route('/api/face_auth/verify', methods=['POST'])
-def face_auth_verify():
-    try:
-        # Check if image file is present
-        if 'image' not in request.files:
-            return jsonify({"success": False, "message": "No image provided"}), 400
-        
-        image_file = request.files['image']
-        user_id = request.form.get('userId')
-        
-        if image_file.filename == '':
-            return jsonify({"success": False, "message": "No image selected"}), 400
-        
-        # In a real implementation, you would process the face image
-        # For demo: Find the user and verify
-        user = mongo.db.users.find_one({"_id": ObjectId(user_id)})
-        
-        if not user:
-            return jsonify({"success": False, "message": "User not found"}), 404
-        
-        # Check if user has valid pass
-        current_time = datetime.utcnow()
-        pass_expiry = user.get('pass_expiry')
-        
-        is_valid = (user.get('Pass_Status') and 
-                   pass_expiry and 
-                   (isinstance(pass_expiry, datetime) and pass_expiry > current_time or 
-                    isinstance(pass_expiry, str) and datetime.strptime(pass_expiry, '%Y-%m-%d') > current_time))
-        
-        if is_valid:
-            return jsonify({
-                "success": True,
-                "valid": True,
-                "message": "Face verification successful",
-                "user": {
-                    "name": user.get('name', ''),
-                    "email": user.get('email', ''),
-                    "passId": user.get('pass_code', '')
-                }
-            })
-        else:
-            return jsonify({
-                "success": True,
-                "valid": False,
-                "message": "Pass is invalid or expired"
-            })
-            
-    except Exception as e:
-        print(f"Error in face auth: {str(e)}")
-        return jsonify({"success": False, "message": str(e)}), 500
 @app.route('/auth/refresh', methods=['POST'])
 def refresh_token():
     try:
@@ -1703,32 +1696,22 @@ def refresh_token():
         
         current_token = auth_header.split(' ')[1]
         
-        # Find user by current token
-        user = mongo.db.users.find_one({"token": current_token})
-        if not user:
-            # Try conductors collection
-            user = mongo.db.conductors.find_one({"token": current_token})
+        # Find the session (user or conductor) by current token
+        session = find_session(current_token)
         
-        if not user:
+        if not session:
             return jsonify({"success": False, "message": "Invalid token"}), 401
         
         # Check if token is expired
-        if user.get("tokenExpiry") and user["tokenExpiry"] < datetime.utcnow():
+        if session_expired(session):
             return jsonify({"success": False, "message": "Token expired"}), 401
         
-        # Create new token
-        new_token = str(uuid.uuid4())
-        token_expiry = datetime.utcnow() + timedelta(hours=24)
-        
-        # Update user with new token
-        collection = mongo.db.users if 'email' in user else mongo.db.conductors
-        collection.update_one(
-            {"_id": user["_id"]},
-            {"$set": {
-                "token": new_token,
-                "tokenExpiry": token_expiry
-            }}
-        )
+        # Swap in a new token on the same session
+        rotated = rotate_session(current_token)
+        forget_token(current_token)
+        if not rotated:
+            return jsonify({"success": False, "message": "Invalid token"}), 401
+        new_token, token_expiry = rotated
         
         return jsonify({
             "success": True,
@@ -1739,6 +1722,23 @@ def refresh_token():
     except Exception as e:
         print(f"Token refresh error: {str(e)}")
         return jsonify({"success": False, "message": "Internal server error"}), 500
+@app.route('/auth/logout', methods=['POST'])
+def logout():
+    """End the session for this token; the account's other devices stay logged in"""
+    try:
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({"success": False, "message": "Authorization header required"}), 401
+        
+        token = auth_header.split(' ')[1]
+        ended = end_session(token)
+        forget_token(token)
+        
+        return jsonify({"success": ended, "message": "Logged out" if ended else "No such session"})
+        
+    except Exception as e:
+        print(f"Logout error: {str(e)}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
 @app.route('/api/test/create-conductor', methods=['POST'])
 def create_conductor_test():
     """Create a test conductor for development"""
@@ -1796,6 +1796,8 @@ def delete_conductor(conductor_id):
         result = mongo.db.conductors.delete_one({"_id": ObjectId(conductor_id)})
         
         if result.deleted_count > 0:
+            # Log them out everywhere
+            revoke_principal(conductor_id)
             return jsonify({"success": True, "message": "Conductor deleted successfully"})
         else:
             return jsonify({"success": False, "message": "Failed to delete conductor"}), 500
@@ -2127,12 +2129,39 @@ def verify_face_image():
         if image_file.filename == '':
             return jsonify({"success": False, "message": "No image selected"}), 400
         
-        # In a real implementation, you would process the face image
-        # For demo: Find a user with valid pass
-        valid_user = mongo.db.users.find_one({
-            "Pass_Status": True,
-            "pass_expiry": {"$gt": datetime.utcnow()}
-        })
+        # Only compare against valid pass holders on this bus's route
+        route = bus_route(bus_id)
+        if bus_id and route is None:
+            return jsonify({"success": False, "message": "Unknown bus or bus has no route"}), 404
+        image = read_image(image_file)
+        if image is None:
+            return jsonify({"success": False, "message": "Could not decode image"}), 400
+        
+        # QR / pass code / userId hint: check that one user instead of searching everyone
+        claim = claimed_user(request.form)
+        if claim == "":
+            return jsonify({"success": True, "valid": False, "message": "Claimed pass holder not found"})
+        
+        valid_user = None
+        matched_id, reasons = identify_face(image, route=route, active_only=True, claim=claim)
+        if reasons:
+            # Rejected by the quality gate before any embedding was computed
+            mongo.db.verification_logs.insert_one({
+                "bus_id": ObjectId(bus_id) if bus_id and ObjectId.is_valid(bus_id) else None,
+                "type": "face",
+                "status": "rejected",
+                "reason": ", ".join(reasons),
+                "timestamp": datetime.utcnow()
+            })
+            return jsonify({
+                "success": True,
+                "valid": False,
+                "retry": True,
+                "reasons": reasons,
+                "message": describe_face_quality(reasons)
+            })
+        if matched_id:
+            valid_user = mongo.db.users.find_one({"_id": ObjectId(matched_id)})
         
         if valid_user:
             user_data = {
@@ -2147,7 +2176,7 @@ def verify_face_image():
             # Log the verification
             mongo.db.verification_logs.insert_one({
                 "user_id": valid_user['_id'],
-                "bus_id": ObjectId(bus_id) if bus_id else None,
+                "bus_id": ObjectId(bus_id) if bus_id and ObjectId.is_valid(bus_id) else None,
                 "type": "face",
                 "status": "success",
                 "timestamp": datetime.utcnow()
@@ -2162,7 +2191,7 @@ def verify_face_image():
         else:
             # No valid user found
             mongo.db.verification_logs.insert_one({
-                "bus_id": ObjectId(bus_id) if bus_id else None,
+                "bus_id": ObjectId(bus_id) if bus_id and ObjectId.is_valid(bus_id) else None,
                 "type": "face",
                 "status": "failed",
                 "reason": "No matching valid pass found",
@@ -2175,6 +2204,8 @@ def verify_face_image():
                 "message": "No valid pass holder found"
             })
             
+    except InferenceBusy:
+        raise  # inference_busy() -> 503 + Retry-After
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
 # Add these routes to your app.py
@@ -2472,6 +2503,8 @@ def fix_invalid_dates():
                     {"_id": user_id},
                     {"$set": update_data}
                 )
+                if 'pass_expiry' in update_data:
+                    gallery.refresh_pass(user_id)
         
         return jsonify({
             "success": True, 
@@ -2484,7 +2517,6 @@ def fix_invalid_dates():
 with app.app_context():
     print("Running startup checks...")
     check_email_config()
-    cleanup_expired_tokens()
     print("Startup checks completed")
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", 5000)), debug=os.getenv("FLASK_DEBUG", "True")=="True")
\ No newline at end of file
@@ -0,0 +1,307 @@
+# backend/benchmarks/face_pipeline.py
+"""
+Face pipeline benchmark: per-stage latency, throughput under concurrency,
+gallery scaling and peak RSS, written to JSON so runs can be compared.
+
+    cd backend && python -m benchmarks.face_pipeline [--sizes 1000 10000 100000]
+        [--concurrency 1 4 8] [--images registered_faces] [--index exact]
+        [--skip-models] [--out FILE] [--compare OLD.json]
+
+Runs offline: galleries are synthetic (clustered unit vectors, FACE_MAX_TEMPLATES
+per user, spread over a few routes) and live in memory, so no Mongo is needed.
+Sample images in registered_faces/ are replayed through decode -> detect ->
+quality gate -> embed -> search. The detection/embedding result cache is
+bypassed so repeated images are measured for real. --skip-models measures
+decode and search only (synthetic queries), e.g. on machines without the models.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from config import Config
+from face_processing.detection import Face
+from face_processing.enrol import FACE_DIR, largest_face, crop_face
+from face_processing.gallery import FaceGallery, route_key, ID_DTYPE
+from face_processing.governor import InferenceBusy
+from face_processing.ingest import decode_image
+from face_processing.quality import check_face
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+ROUTES = [route_key(f"Stop {i}", f"Stop {i + 1}") for i in range(20)]
+DIM = 512
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def summarize(seconds: list) -> dict:
+    if not seconds:
+        return {"n": 0}
+    ms = np.asarray(seconds) * 1000.0
+    return {
+        "n": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+# --- synthetic galleries -------------------------------------------------
+
+def synthetic_gallery(size: int, index_backend: str, seed: int = 0):
+    """
+    size embeddings = size / FACE_MAX_TEMPLATES users, each a cluster of
+    templates around its own centre. Returns (gallery, centres, user_ids, build seconds).
+    """
+    rng = np.random.default_rng(seed)
+    per_user = max(1, Config.FACE_MAX_TEMPLATES)
+    users = max(1, size // per_user)
+    centres = rng.standard_normal((users, DIM)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    owner = np.repeat(np.arange(users), per_user)[:size]
+    rows = centres[owner] + 0.35 * rng.standard_normal((len(owner), DIM)).astype(np.float32) / np.sqrt(DIM)
+
+    user_ids = np.asarray([f"{i:024x}" for i in range(users)], dtype=ID_DTYPE)
+    routes = np.asarray([ROUTES[i % len(ROUTES)] for i in owner], dtype=object)
+    expiry = np.full(len(owner), time.time() + 365 * 24 * 3600, dtype=np.float64)
+    expiry[owner % 10 == 0] = 0.0  # a tenth of passes expired, so active_only filters something
+
+    g = FaceGallery(index_backend=index_backend, snapshot_dir="")
+    start = time.perf_counter()
+    g._install(FaceGallery._normalize(rows), user_ids[owner], routes, expiry, 0)
+    return g, centres, user_ids, time.perf_counter() - start
+
+def synthetic_queries(centres, count: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    who = rng.integers(0, len(centres), count)
+    q = centres[who] + 0.45 * rng.standard_normal((count, DIM)).astype(np.float32) / np.sqrt(DIM)
+    return q, who
+
+def bench_gallery(size: int, index_backend: str, queries: int) -> dict:
+    g, centres, user_ids, build = synthetic_gallery(size, index_backend)
+    q, who = synthetic_queries(centres, queries)
+    out = {"rows": len(g), "users": len(centres), "build_s": round(build, 3),
+           "matrix_mb": round(g._base.nbytes / 1e6, 1), "index": index_backend}
+
+    # Whole gallery, then scoped like a bus scan (the query's route, active passes only)
+    for name, scoped in (("search", False), ("search_route_active", True)):
+        times, hits = [], 0
+        for vec, user in zip(q, who):
+            route = ROUTES[int(user) % len(ROUTES)] if scoped else None
+            (user_id, sim), dt = timed(g.search, vec, route, scoped)
+            times.append(dt)
+            hits += user_id == user_ids[user] and sim >= Config.FACE_THRESHOLD
+        out[name] = summarize(times)
+        out[name]["top1_at_threshold"] = round(hits / len(q), 4)
+
+    batch = min(8, len(q))
+    _, dt = timed(g.search_many, list(q[:batch]))
+    out["search_many_8_ms"] = round(dt * 1000, 3)
+    out["peak_rss_mb"] = peak_rss_mb()
+    return out, g, centres
+
+# --- image pipeline ------------------------------------------------------
+
+def load_samples(directory: str) -> list:
+    paths = sorted(p for ext in ("jpg", "jpeg", "png") for p in glob.glob(os.path.join(directory, f"*.{ext}")))
+    samples = []
+    for p in paths:
+        with open(p, "rb") as f:
+            samples.append((os.path.basename(p), f.read()))
+    return samples
+
+def run_pipeline(data: bytes, engine, g, query=None):
+    """
+    One verification: decode -> detect -> gate -> embed -> search.
+    Returns {stage: seconds} plus the outcome.
+    """
+    t = {}
+    image, t["decode"] = timed(decode_image, data)
+    if image is None:
+        return t, "undecodable"
+    if engine is None:
+        (_, _), t["search"] = timed(g.search, query)
+        return t, "synthetic"
+
+    faces, t["detect"] = timed(lambda im: engine.detect([im])[0], image)
+    face = largest_face(faces)
+    start = time.perf_counter()
+    if face is None:
+        # registered_faces previews are already tight crops
+        face = Face(0, 0, image.shape[1], image.shape[0], 1.0)
+        outcome = "no_face"
+    else:
+        outcome = "rejected" if check_face(image, face) else "ok"
+    crop = crop_face(image, face)
+    t["quality"] = time.perf_counter() - start
+    embs, t["embed"] = timed(engine.embed, [crop])
+    if embs[0] is None:
+        return t, "no_embedding"
+    (_, _), t["search"] = timed(g.search, embs[0])
+    return t, outcome
+
+def bench_stages(samples, engine, g, centres, repeat: int) -> dict:
+    stages, outcomes = {}, {}
+    q, _ = synthetic_queries(centres, len(samples) * repeat, seed=2)
+    k = 0
+    for _ in range(repeat):
+        for _, data in samples:
+            t, outcome = run_pipeline(data, engine, g, q[k])
+            k += 1
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            for stage, dt in t.items():
+                stages.setdefault(stage, []).append(dt)
+            stages.setdefault("total", []).append(sum(t.values()))
+    out = {stage: summarize(v) for stage, v in stages.items()}
+    out["outcomes"] = outcomes
+    out["peak_rss_mb"] = peak_rss_mb()
+    return out
+
+def bench_concurrency(samples, engine, g, centres, levels, requests: int) -> dict:
+    q, _ = synthetic_queries(centres, requests, seed=3)
+    out = {}
+    for level in levels:
+        latencies, rejected = [], 0
+
+        def one(i):
+            start = time.perf_counter()
+            try:
+                run_pipeline(samples[i % len(samples)][1], engine, g, q[i])
+            except InferenceBusy:
+                return None
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            for dt in pool.map(one, range(requests)):
+                if dt is None:
+                    rejected += 1
+                else:
+                    latencies.append(dt)
+        wall = time.perf_counter() - start
+        out[str(level)] = {
+            "requests": requests,
+            "rejected_busy": rejected,
+            "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+            "latency": summarize(latencies),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    return out
+
+# --- reporting -----------------------------------------------------------
+
+def compare(old: dict, new: dict):
+    """
+    Print p50/p95 changes between two result files, stage by stage.
+    """
+    def rows(result):
+        for stage, s in result.get("stages", {}).items():
+            if isinstance(s, dict) and "p50_ms" in s:
+                yield f"stage {stage}", s
+        for size, r in result.get("galleries", {}).items():
+            for name in ("search", "search_route_active"):
+                if name in r:
+                    yield f"gallery {size} {name}", r[name]
+        for level, r in result.get("concurrency", {}).items():
+            yield f"concurrency {level}", r["latency"]
+
+    before = dict(rows(old))
+    for name, s in rows(new):
+        b = before.get(name)
+        if not b or "p50_ms" not in b or "p50_ms" not in s:
+            continue
+        delta = (s["p50_ms"] - b["p50_ms"]) / b["p50_ms"] * 100 if b["p50_ms"] else 0.0
+        print(f"{name:40s} p50 {b['p50_ms']:9.3f} -> {s['p50_ms']:9.3f} ms ({delta:+6.1f}%)"
+              f"   p95 {b['p95_ms']:9.3f} -> {s['p95_ms']:9.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the face pipeline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="synthetic gallery sizes (embeddings)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--images", default=FACE_DIR, help="directory of sample images to replay")
+    parser.add_argument("--index", default=Config.FACE_INDEX_BACKEND, help="exact | ivf | hnsw | centroid")
+    parser.add_argument("--queries", type=int, default=500, help="synthetic searches per gallery size")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the sample images")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--skip-models", action="store_true", help="decode + search only")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--compare", default=None, help="earlier result file to diff against")
+    args = parser.parse_args()
+
+    samples = load_samples(args.images)
+    if not samples:
+        parser.error(f"no sample images in {args.images}")
+
+    result = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "host": platform.node(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpus": os.cpu_count(),
+            "samples": len(samples),
+            "skip_models": args.skip_models,
+            "config": {k: getattr(Config, k) for k in (
+                "FACE_BACKEND", "FACE_INFERENCE_MODE", "DEEPFACE_MODEL", "FACE_MODEL_TAG",
+                "FACE_EMBEDDING_FORMAT", "FACE_MAX_TEMPLATES", "FACE_THRESHOLD",
+                "FACE_INTRA_OP_THREADS", "FACE_INFERENCE_CONCURRENCY", "FACE_REDUCED_DECODE")},
+        },
+        "galleries": {},
+    }
+
+    gallery_size = max(args.sizes)
+    largest = None
+    for size in sorted(args.sizes):
+        print(f"Gallery {size}: building and searching...")
+        stats, g, centres = bench_gallery(size, args.index, args.queries)
+        result["galleries"][str(size)] = stats
+        if size == gallery_size:
+            largest = (g, centres)
+        del g
+
+    engine = None
+    if not args.skip_models:
+        from face_processing.inference import LocalEngine
+        print("Loading models...")
+        (engine, load_s) = timed(LocalEngine)
+        result["meta"]["model_load_s"] = round(load_s, 3)
+        engine.embed([decode_image(samples[0][1])])  # warm-up: first call builds the graph
+
+    g, centres = largest
+    print(f"Replaying {len(samples)} images x {args.repeat} against the {gallery_size} gallery...")
+    result["stages"] = bench_stages(samples, engine, g, centres, args.repeat)
+    print("Concurrency levels:", args.concurrency)
+    result["concurrency"] = bench_concurrency(samples, engine, g, centres, args.concurrency, args.requests)
+    result["peak_rss_mb"] = peak_rss_mb()
+
+    out = args.out or os.path.join(RESULTS_DIR, f"face_pipeline-{datetime.utcnow():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Wrote {out} (peak RSS {result['peak_rss_mb']} MB)")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,98 @@ class Config:
     YOLO_MODEL_PATH = os.getenv("YOLO_MODEL_PATH", "models/yolov8n-face.pt")
     DEEPFACE_MODEL = os.getenv("DEEPFACE_MODEL", "ArcFace")
     FACE_THRESHOLD = float(os.getenv("FACE_THRESHOLD", 0.60))  # cosine similarity threshold
+    # Warp crops onto the ArcFace 5-point template using the detector's landmarks
+    # (face_processing/alignment.py). Changes the embeddings: re-embed after enabling.
+    FACE_ALIGN = os.getenv("FACE_ALIGN", "False").lower() == "true"
+    # Stored embeddings are tagged with the model that produced them; the gallery
+    # ignores other tags. Bump FACE_MODEL_VERSION when preprocessing changes and
+    # re-embed with scripts/reembed_faces.py.
+    FACE_MODEL_VERSION = os.getenv("FACE_MODEL_VERSION", "1")
+    FACE_MODEL_TAG = os.getenv("FACE_MODEL_TAG") or f"{DEEPFACE_MODEL}@{FACE_MODEL_VERSION}" + ("+align" if FACE_ALIGN else "")
+    # Pre-tagging embeddings were made from unaligned crops
+    FACE_ACCEPT_UNTAGGED = os.getenv("FACE_ACCEPT_UNTAGGED", "False" if FACE_ALIGN else "True").lower() == "true"
+    FACE_MAX_TEMPLATES = int(os.getenv("FACE_MAX_TEMPLATES", 5))  # embeddings kept per user (k-medoids)
+    # 1:1 verification template cache (per worker)
+    FACE_TEMPLATE_CACHE_SIZE = int(os.getenv("FACE_TEMPLATE_CACHE_SIZE", 2048))       # users
+    FACE_TEMPLATE_CACHE_TTL = float(os.getenv("FACE_TEMPLATE_CACHE_TTL", 300))       # seconds
+    # Pre-embedding quality gate (face_processing/quality.py)
+    FACE_QUALITY_GATE = os.getenv("FACE_QUALITY_GATE", "True").lower() == "true"
+    FACE_MIN_SIZE = int(os.getenv("FACE_MIN_SIZE", 60))                  # px, shorter box side
+    FACE_MIN_CONFIDENCE = float(os.getenv("FACE_MIN_CONFIDENCE", 0.5))   # detector score
+    FACE_MIN_SHARPNESS = float(os.getenv("FACE_MIN_SHARPNESS", 40))      # Laplacian variance at 112x112
+    FACE_MIN_BRIGHTNESS = float(os.getenv("FACE_MIN_BRIGHTNESS", 40))    # mean gray level
+    FACE_MAX_BRIGHTNESS = float(os.getenv("FACE_MAX_BRIGHTNESS", 220))
+    # Streaming verification (/api/face_auth/stream)
+    FACE_STREAM_DETECT_EVERY = int(os.getenv("FACE_STREAM_DETECT_EVERY", 3))      # run the detector on every Nth frame
+    FACE_STREAM_IOU = float(os.getenv("FACE_STREAM_IOU", 0.3))                    # min IoU to continue a track
+    FACE_STREAM_MAX_MISSES = int(os.getenv("FACE_STREAM_MAX_MISSES", 3))          # detection rounds before a track is dropped
+    FACE_STREAM_MAX_EMBEDS = int(os.getenv("FACE_STREAM_MAX_EMBEDS", 3))          # embedding passes per track
+    FACE_STREAM_REEMBED_GAIN = float(os.getenv("FACE_STREAM_REEMBED_GAIN", 0.25)) # quality gain needed to re-embed
+    FACE_STREAM_IDLE_SECONDS = float(os.getenv("FACE_STREAM_IDLE_SECONDS", 60))
+    # Upload decoding (face_processing/ingest.py)
+    FACE_REDUCED_DECODE = os.getenv("FACE_REDUCED_DECODE", "True").lower() == "true"  # JPEG IMREAD_REDUCED_* decode
+    FACE_INGEST_MIN_SIDE = int(os.getenv("FACE_INGEST_MIN_SIDE", 800))    # long side kept for detection
+    FACE_INGEST_CROP_SIDE = int(os.getenv("FACE_INGEST_CROP_SIDE", 112))  # face pixels wanted for quality + embedding
+    # Offline gallery bundles for conductor devices (face_processing/edge.py)
+    EDGE_BUNDLE_SECRET = os.getenv("EDGE_BUNDLE_SECRET", "")  # HMAC key shared with the devices; /api/edge answers 503 without it
+    EDGE_BUNDLE_CACHE_TTL = int(os.getenv("EDGE_BUNDLE_CACHE_TTL", 300))  # seconds a built full bundle is reused
+    # Login sessions (utils/sessions.py) and the token principal cache (utils/auth_utils.py)
+    SESSION_HOURS = float(os.getenv("SESSION_HOURS", 24))
+    TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 4096))
+    TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", 60))  # seconds; bounds how long a token revoked elsewhere keeps working
+    # Background registration jobs (face_processing/jobs.py)
+    FACE_REGISTRATION_ASYNC = os.getenv("FACE_REGISTRATION_ASYNC", "True").lower() == "true"
+    FACE_JOB_SPOOL_DIR = os.getenv("FACE_JOB_SPOOL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'face_jobs'))
+    FACE_JOB_WORKERS = int(os.getenv("FACE_JOB_WORKERS", 2))              # concurrent jobs per process
+    FACE_JOB_POLL_SECONDS = float(os.getenv("FACE_JOB_POLL_SECONDS", 2))
+    FACE_JOB_STALE_SECONDS = int(os.getenv("FACE_JOB_STALE_SECONDS", 300))  # running this long = worker died
+    FACE_JOB_MAX_ATTEMPTS = int(os.getenv("FACE_JOB_MAX_ATTEMPTS", 2))
+    FACE_JOB_TTL = int(os.getenv("FACE_JOB_TTL", 7 * 24 * 3600))            # finished jobs kept (seconds)
+    FACE_JOB_BATCH = int(os.getenv("FACE_JOB_BATCH", 8))                    # jobs claimed per inference pass
+    FACE_ENROL_ON_APPROVAL = os.getenv("FACE_ENROL_ON_APPROVAL", "True").lower() == "true"  # enrol applicant photo on approval
+    # Inference runtime: "native" (ultralytics + DeepFace/TensorFlow) or "onnx" (ONNX Runtime)
+    FACE_BACKEND = os.getenv("FACE_BACKEND", "native")
+    FACE_ONNX_DETECTOR_PATH = os.getenv("FACE_ONNX_DETECTOR_PATH", "models/yolov8n-face.onnx")
+    FACE_ONNX_EMBEDDER_PATH = os.getenv("FACE_ONNX_EMBEDDER_PATH", "models/arcface.onnx")
+    FACE_ONNX_INT8 = os.getenv("FACE_ONNX_INT8", "False").lower() == "true"  # use the *.int8.onnx exports
+    FACE_ONNX_THREADS = int(os.getenv("FACE_ONNX_THREADS", 0))  # intra-op threads, 0 = FACE_INTRA_OP_THREADS
+    FACE_ONNX_PROVIDERS = os.getenv("FACE_ONNX_PROVIDERS", "CPUExecutionProvider")  # e.g. OpenVINOExecutionProvider,CPUExecutionProvider
+    # Stored embedding format: "float16", "int8" (per-vector scale) or "float32" (legacy BSON array)
+    FACE_EMBEDDING_FORMAT = os.getenv("FACE_EMBEDDING_FORMAT", "float16")
+    # Face search index: "exact" (brute-force), "ivf" (NumPy IVF) or "hnsw" (needs hnswlib)
+    FACE_INDEX_BACKEND = os.getenv("FACE_INDEX_BACKEND", "exact")   # exact | ivf | hnsw | centroid
+    FACE_ANN_MIN_ROWS = int(os.getenv("FACE_ANN_MIN_ROWS", 20000))   # below this, exact search is faster
+    FACE_ANN_RERANK_K = int(os.getenv("FACE_ANN_RERANK_K", 32))      # candidates re-scored exactly
+    FACE_IVF_NLIST = int(os.getenv("FACE_IVF_NLIST", 0))             # 0 = sqrt(rows)
+    FACE_IVF_NPROBE = int(os.getenv("FACE_IVF_NPROBE", 8))           # recall/latency knob for ivf
+    FACE_HNSW_M = int(os.getenv("FACE_HNSW_M", 16))
+    FACE_HNSW_EF_CONSTRUCTION = int(os.getenv("FACE_HNSW_EF_CONSTRUCTION", 200))
+    FACE_HNSW_EF_SEARCH = int(os.getenv("FACE_HNSW_EF_SEARCH", 64))  # recall/latency knob for hnsw
+    # Gallery snapshot (memory-mapped by every worker) and change-log replay
+    FACE_GALLERY_SNAPSHOT_DIR = os.getenv("FACE_GALLERY_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gallery_snapshot'))
+    FACE_GALLERY_SYNC_SECONDS = float(os.getenv("FACE_GALLERY_SYNC_SECONDS", 5))
+    FACE_GALLERY_CHANGELOG_TTL = int(os.getenv("FACE_GALLERY_CHANGELOG_TTL", 7 * 24 * 3600))  # seconds
+    # Micro-batching of concurrent verify requests (detection + embedding)
+    FACE_BATCHING = os.getenv("FACE_BATCHING", "True").lower() == "true"
+    FACE_BATCH_MAX_SIZE = int(os.getenv("FACE_BATCH_MAX_SIZE", 16))
+    FACE_BATCH_MAX_WAIT_MS = float(os.getenv("FACE_BATCH_MAX_WAIT_MS", 5))
+    # "local" loads the models in each web worker; "remote" uses the
+    # face_processing.inference_server pool over a local socket
+    FACE_INFERENCE_MODE = os.getenv("FACE_INFERENCE_MODE", "local")
+    FACE_INFERENCE_ADDRESS = os.getenv("FACE_INFERENCE_ADDRESS", "/tmp/smart_bus_pass_inference.sock")  # or host:port
+    FACE_INFERENCE_AUTHKEY = os.getenv("FACE_INFERENCE_AUTHKEY", "dev-inference")
+    FACE_INFERENCE_WORKERS = int(os.getenv("FACE_INFERENCE_WORKERS", 2))
+    FACE_INFERENCE_TIMEOUT = float(os.getenv("FACE_INFERENCE_TIMEOUT", 30))  # seconds
+    # Content-addressed detection/embedding results (identical resubmissions skip the models)
+    FACE_RESULT_CACHE = os.getenv("FACE_RESULT_CACHE", "True").lower() == "true"
+    FACE_RESULT_CACHE_SIZE = int(os.getenv("FACE_RESULT_CACHE_SIZE", 1024))  # entries per cache
+    FACE_RESULT_CACHE_TTL = int(os.getenv("FACE_RESULT_CACHE_TTL", 120))     # seconds
+    # Inference governor (face_processing/governor.py): per-process thread budget and admission control
+    FACE_INTRA_OP_THREADS = int(os.getenv("FACE_INTRA_OP_THREADS", 2))       # OpenMP/MKL/OpenBLAS, torch, TF, ORT, OpenCV
+    FACE_INTER_OP_THREADS = int(os.getenv("FACE_INTER_OP_THREADS", 1))
+    FACE_INFERENCE_CONCURRENCY = int(os.getenv("FACE_INFERENCE_CONCURRENCY", 1))  # forward passes at once per process
+    FACE_INFERENCE_MAX_QUEUE = int(os.getenv("FACE_INFERENCE_MAX_QUEUE", 8))      # callers waiting before 503
+    FACE_INFERENCE_QUEUE_TIMEOUT = float(os.getenv("FACE_INFERENCE_QUEUE_TIMEOUT", 2))  # seconds waiting before 503
     # Uploads
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
@@ -0,0 +1,37 @@
+# backend/face_processing/alignment.py
+"""
+Similarity-transform alignment of a detected face onto the canonical
+112x112 ArcFace 5-point template (eyes, nose tip, mouth corners), using the
+landmarks yolov8-face already predicts. Rotation, scale and translation only,
+so the face is never sheared.
+"""
+import cv2
+import numpy as np
+
+from face_processing.ingest import source_for
+
+# insightface arcface_dst, for a 112x112 output
+ARCFACE_TEMPLATE = np.array([
+    [38.2946, 51.6963],
+    [73.5318, 51.5014],
+    [56.0252, 71.7366],
+    [41.5493, 92.3655],
+    [70.7299, 92.2041],
+], dtype=np.float32)
+
+def align_face(image, face, size: int = 112):
+    """
+    size x size crop of the face warped onto the template, or None when the
+    face has no usable landmarks (the caller falls back to the box crop).
+    """
+    if face is None or not face.landmarks or len(face.landmarks) != 5:
+        return None
+    src, sx, sy = source_for(image, face, size)
+    points = np.asarray(face.landmarks, dtype=np.float32) * np.float32([sx, sy])
+    if not np.isfinite(points).all() or np.ptp(points[:, 0]) < 2:
+        return None
+    dst = ARCFACE_TEMPLATE * (size / 112.0)
+    matrix, _ = cv2.estimateAffinePartial2D(points, dst, method=cv2.LMEDS)
+    if matrix is None:
+        return None
+    return cv2.warpAffine(src, matrix, (size, size), flags=cv2.INTER_LINEAR, borderValue=0)
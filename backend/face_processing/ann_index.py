@@ -0,0 +1,216 @@
+# backend/face_processing/ann_index.py
+import threading
+import numpy as np
+
+from config import Config
+
+class IVFIndex:
+    """
+    Inverted-file index in plain NumPy.
+    Rows are bucketed by their nearest k-means centroid (spherical, so cosine);
+    a query only scores the rows in its FACE_IVF_NPROBE nearest buckets.
+    Row ids are the gallery's row numbers; vectors stay in the gallery matrix.
+    """
+    def __init__(self, nlist: int = Config.FACE_IVF_NLIST, nprobe: int = Config.FACE_IVF_NPROBE,
+                 train_iters: int = 10):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iters = train_iters
+        self.centroids = None
+        self.lists = []
+
+    def _assign(self, vectors: np.ndarray, chunk: int = 16384) -> np.ndarray:
+        out = np.empty(len(vectors), dtype=np.int64)
+        for i in range(0, len(vectors), chunk):
+            out[i:i+chunk] = np.argmax(vectors[i:i+chunk] @ self.centroids.T, axis=1)
+        return out
+
+    def _train(self, matrix: np.ndarray, nlist: int):
+        rng = np.random.default_rng(0)
+        sample_size = min(len(matrix), max(nlist * 40, 10000))
+        sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+        self.centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.train_iters):
+            labels = self._assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # Re-seed dead centroids from random sample points
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.centroids = (sums / norms).astype(np.float32)
+
+    def build(self, vectors: np.ndarray, rows: np.ndarray, ids=None):
+        """
+        vectors[i] is the normalised vector for gallery row rows[i], owned by user ids[i].
+        """
+        nlist = self.nlist or max(1, int(np.sqrt(len(rows))))
+        nlist = min(nlist, len(rows))
+        self._train(vectors, nlist)
+        labels = self._assign(vectors)
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(nlist + 1))
+        sorted_rows = rows[order]
+        self.lists = [sorted_rows[bounds[c]:bounds[c+1]].copy() for c in range(nlist)]
+
+    def add(self, vectors: np.ndarray, rows: np.ndarray, ids=None):
+        labels = self._assign(vectors)
+        for c in np.unique(labels):
+            # Rebind rather than mutate so concurrent searches see a consistent list
+            self.lists[c] = np.concatenate([self.lists[c], rows[labels == c]])
+
+    def remove(self, rows: np.ndarray):
+        rows = np.asarray(rows)
+        for c, lst in enumerate(self.lists):
+            if len(lst) and np.isin(lst, rows).any():
+                self.lists[c] = lst[~np.isin(lst, rows)]
+
+    def candidates(self, q: np.ndarray, k: int) -> np.ndarray:
+        nprobe = min(self.nprobe, len(self.lists))
+        scores = self.centroids @ q
+        probe = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        # IVF-Flat: every row in the probed lists is re-ranked exactly by the caller
+        return np.concatenate([self.lists[c] for c in probe])
+
+class HNSWIndex:
+    """
+    HNSW graph via the optional `hnswlib` package (pip install hnswlib).
+    FACE_HNSW_EF_SEARCH is the recall/latency knob.
+    """
+    def __init__(self, m: int = Config.FACE_HNSW_M, ef_construction: int = Config.FACE_HNSW_EF_CONSTRUCTION,
+                 ef_search: int = Config.FACE_HNSW_EF_SEARCH):
+        import hnswlib  # optional dependency
+        self._hnswlib = hnswlib
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._index = None
+        self._lock = threading.Lock()
+
+    def build(self, vectors: np.ndarray, rows: np.ndarray, ids=None):
+        index = self._hnswlib.Index(space="ip", dim=vectors.shape[1])
+        index.init_index(max_elements=max(len(rows) * 2, 1024), ef_construction=self.ef_construction,
+                         M=self.m, allow_replace_deleted=True)
+        index.add_items(vectors, rows)
+        index.set_ef(self.ef_search)
+        self._index = index
+
+    def add(self, vectors: np.ndarray, rows: np.ndarray, ids=None):
+        with self._lock:
+            needed = self._index.get_current_count() + len(rows)
+            if needed > self._index.get_max_elements():
+                self._index.resize_index(needed * 2)
+            self._index.add_items(vectors, rows, replace_deleted=True)
+
+    def remove(self, rows: np.ndarray):
+        with self._lock:
+            for r in rows:
+                try:
+                    self._index.mark_deleted(int(r))
+                except RuntimeError:
+                    pass
+
+    def candidates(self, q: np.ndarray, k: int) -> np.ndarray:
+        with self._lock:
+            k = min(max(k, self.ef_search), self._index.get_current_count())
+            try:
+                labels, _ = self._index.knn_query(q.reshape(1, -1), k=k)
+            except RuntimeError:
+                # Fewer live elements than k; let the caller fall back to exact search
+                return np.empty(0, dtype=np.int64)
+        return labels[0].astype(np.int64)
+
+class CentroidIndex:
+    """
+    One normalised mean embedding per user as a first-pass filter.
+    A query ranks users by centroid similarity and returns every row of the
+    top k users for exact re-ranking; with templates capped at
+    FACE_MAX_TEMPLATES that is at most k * FACE_MAX_TEMPLATES rows.
+    The gallery always removes a user's rows together, so an emptied user's
+    running sum is reset and re-registration starts a fresh centroid.
+    """
+    def __init__(self):
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+        self.sums = np.empty((0, 0), dtype=np.float64)
+        self.lists = []
+        self.slots = {}
+        self.row_slot = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(sums):
+        norms = np.linalg.norm(sums, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (sums / norms).astype(np.float32)
+
+    def build(self, vectors: np.ndarray, rows: np.ndarray, ids=None):
+        users, inverse = np.unique(np.asarray(ids).astype(str), return_inverse=True)
+        sums = np.zeros((len(users), vectors.shape[1]), dtype=np.float64)
+        np.add.at(sums, inverse, vectors)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(len(users) + 1))
+        sorted_rows = rows[order]
+        self.lists = [sorted_rows[bounds[u]:bounds[u+1]].copy() for u in range(len(users))]
+        self.slots = {u: i for i, u in enumerate(users)}
+        self.row_slot = {int(r): int(i) for r, i in zip(rows, inverse)}
+        self.sums = sums
+        self.centroids = self._unit(sums)
+
+    def add(self, vectors: np.ndarray, rows: np.ndarray, ids=None):
+        with self._lock:
+            sums, centroids = self.sums, self.centroids
+            for v, r, u in zip(vectors, rows, np.asarray(ids).astype(str)):
+                slot = self.slots.get(u)
+                if slot is None:
+                    slot = len(self.lists)
+                    self.slots[u] = slot
+                    self.lists.append(np.empty(0, dtype=np.int64))
+                    sums = np.vstack([sums, np.zeros((1, len(v)))]) if len(sums) else np.zeros((1, len(v)))
+                    centroids = np.vstack([centroids, np.zeros((1, len(v)), dtype=np.float32)]) if len(centroids) \
+                        else np.zeros((1, len(v)), dtype=np.float32)
+                sums[slot] += v
+                centroids[slot] = self._unit(sums[slot])
+                self.lists[slot] = np.append(self.lists[slot], int(r))
+                self.row_slot[int(r)] = slot
+            # Rebind so concurrent searches see matching shapes
+            self.sums, self.centroids = sums, centroids
+
+    def remove(self, rows: np.ndarray):
+        with self._lock:
+            touched = {self.row_slot.pop(int(r)) for r in rows if int(r) in self.row_slot}
+            for slot in touched:
+                lst = self.lists[slot]
+                lst = lst[~np.isin(lst, rows)]
+                self.lists[slot] = lst
+                if not len(lst):
+                    self.sums[slot] = 0.0
+                    self.centroids[slot] = 0.0
+
+    def candidates(self, q: np.ndarray, k: int) -> np.ndarray:
+        centroids, lists = self.centroids, self.lists
+        if not len(centroids):
+            return np.empty(0, dtype=np.int64)
+        k = min(k, len(centroids))
+        scores = centroids @ q
+        top = np.argpartition(-scores, k - 1)[:k]
+        return np.concatenate([lists[u] for u in top]).astype(np.int64)
+
+def make_index(backend: str = Config.FACE_INDEX_BACKEND):
+    """
+    Returns an empty ANN index for the configured backend, or None for exact search.
+    """
+    backend = (backend or "exact").lower()
+    if backend == "ivf":
+        return IVFIndex()
+    if backend == "centroid":
+        return CentroidIndex()
+    if backend == "hnsw":
+        try:
+            return HNSWIndex()
+        except ImportError:
+            print("hnswlib not installed; falling back to IVF index")
+            return IVFIndex()
+    return None
@@ -0,0 +1,94 @@
+# backend/face_processing/batcher.py
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from config import Config
+from face_processing.governor import governor, InferenceBusy
+
+class InferenceBatcher:
+    """
+    Micro-batching scheduler for model calls.
+    Concurrent request threads submit single items; a background thread collects
+    them for up to max_wait_ms (or until max_batch are waiting) and runs
+    fn(list_of_items) -> list_of_results once for the whole batch.
+    At most max_pending items wait; beyond that submit() raises InferenceBusy.
+    """
+    def __init__(self, fn, max_batch: int = Config.FACE_BATCH_MAX_SIZE,
+                 max_wait_ms: float = Config.FACE_BATCH_MAX_WAIT_MS, name: str = "inference",
+                 max_pending: int = Config.FACE_BATCH_MAX_SIZE * max(1, Config.FACE_INFERENCE_MAX_QUEUE)):
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.max_pending = max(1, max_pending)
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_thread(self):
+        # (Re)start after fork: threads don't survive into gunicorn workers
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                if self._pid != os.getpid():
+                    # Items queued in the parent belong to its threads; a restart in
+                    # the same process keeps the queue so waiting callers get served
+                    self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._loop, name=f"{self.name}-batcher", daemon=True)
+                self._thread.start()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, item) -> Future:
+        self._ensure_thread()
+        if self._queue.qsize() >= self.max_pending:
+            raise InferenceBusy(governor.retry_after())
+        fut = Future()
+        self._queue.put((item, fut))
+        return fut
+
+    def __call__(self, item, timeout: float | None = None):
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            # Skip items whose caller cancelled; the rest can no longer be cancelled
+            batch = [(item, fut) for item, fut in self._collect() if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            try:
+                results = list(self.fn(items))
+            except Exception as e:
+                print(f"{self.name} batch of {len(items)} failed:", e)
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for (_, fut), res in zip(batch, results):
+                fut.set_result(res)
+            if len(results) < len(batch):
+                # Every caller must hear back, or it blocks in result() forever
+                err = RuntimeError(f"{self.name} batch returned {len(results)} results for {len(batch)} items")
+                print(err)
+                for _, fut in batch[len(results):]:
+                    fut.set_exception(err)
@@ -1,40 +1,77 @@
 # backend/face_processing/detection.py
+from collections import namedtuple
+
 import cv2
-from ultralytics import YOLO
 from config import Config
 
+# One detected face: box in original image coordinates plus the detector score, and
+# the 5 landmarks as (x, y) when the detector predicts them: eyes, nose tip, mouth
+# corners, image-left first in each pair (the ArcFace template order)
+Face = namedtuple("Face", ["x", "y", "w", "h", "confidence", "landmarks"], defaults=(None,))
+
 class FaceDetector:
     """
     YOLOv8-face detector.
-    Returns list of (x, y, w, h) for each detected face.
+    Returns list of Face(x, y, w, h, confidence, landmarks) for each detected face.
     """
     _shared = None
 
     def __init__(self, model_path: str = Config.YOLO_MODEL_PATH):
         if FaceDetector._shared is None:
+            from ultralytics import YOLO
             FaceDetector._shared = YOLO(model_path)
         self.model = FaceDetector._shared
 
-    def detect_faces(self, image):
-        if image is None:
-            return []
-        # Ensure 3-ch
+    MAX_SIDE = 1024
+
+    def _prepare(self, image):
+        """
+        Ensure 3-channel BGR and downscale for speed.
+        Returns (image, scale) where scale maps original -> prepared coordinates.
+        """
         if len(image.shape) == 2:
             image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
         elif image.shape[2] == 1:
             image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
 
-        # (Optional) downscale for speed
         h, w = image.shape[:2]
         max_side = max(h, w)
-        if max_side > 1024:
-            scale = 1024 / max_side
+        scale = 1.0
+        if max_side > self.MAX_SIDE:
+            scale = self.MAX_SIDE / max_side
             image = cv2.resize(image, (int(w*scale), int(h*scale)))
+        return image, scale
+
+    def detect_faces(self, image):
+        if image is None:
+            return []
+        return self.detect_faces_batch([image])[0]
+
+    def detect_faces_batch(self, images):
+        """
+        Run YOLO once over a list of images.
+        Returns one list of Face per input, in that image's original coordinates.
+        """
+        out = [[] for _ in images]
+        prepared, scales, idx = [], [], []
+        for i, image in enumerate(images):
+            if image is None:
+                continue
+            img, scale = self._prepare(image)
+            prepared.append(img)
+            scales.append(scale)
+            idx.append(i)
+        if not prepared:
+            return out
 
-        results = self.model(image, verbose=False)
-        faces = []
-        for r in results:
-            for box in r.boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-                faces.append((x1, y1, x2 - x1, y2 - y1))
-        return faces
+        results = self.model(prepared, verbose=False)
+        for i, scale, r in zip(idx, scales, results):
+            points = r.keypoints.xy.tolist() if getattr(r, "keypoints", None) is not None else []
+            for j, box in enumerate(r.boxes):
+                x1, y1, x2, y2 = (v / scale for v in box.xyxy[0].tolist())
+                x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+                landmarks = None
+                if j < len(points) and len(points[j]) == 5:
+                    landmarks = tuple((px / scale, py / scale) for px, py in points[j])
+                out[i].append(Face(x1, y1, x2 - x1, y2 - y1, float(box.conf[0]), landmarks))
+        return out
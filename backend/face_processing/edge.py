@@ -0,0 +1,148 @@
+# backend/face_processing/edge.py
+"""
+Offline gallery bundles for conductor devices.
+
+A bundle holds the currently valid pass holders on one route: int8-quantised,
+unit-normalised embeddings (embedding_codec layout: 8-byte header with a float32
+scale, then int8 values; base64 in JSON) plus the few fields a conductor screen
+shows. Bundles are versioned by the gallery change-log seq, so a device that has
+version N asks for the delta since N: users to add/replace and user ids to drop.
+A device should also stop matching an entry once its pass_expiry has passed.
+
+Every payload is signed with HMAC-SHA256 (EDGE_BUNDLE_SECRET) over its canonical
+JSON without the "signature" key: json.dumps(payload, sort_keys=True,
+separators=(",", ":")). Nothing is signed while the secret is unset or a
+known placeholder (see signing_ready).
+"""
+import base64
+import hashlib
+import hmac
+import json
+import re
+import time
+from datetime import datetime
+
+import numpy as np
+from bson import ObjectId
+
+from config import Config
+from utils.cache import LRUCache
+from utils.database import mongo
+from face_processing.embedding_codec import encode_embedding, decode_embedding
+from face_processing.gallery import route_key, model_ok, current_change_seq, _pass_expiry_ts, PASS_FIELDS, MODEL_FIELDS
+
+BUNDLE_FORMAT = 1
+# Secrets that must never sign a bundle: unset, or the old development default
+PLACEHOLDER_SECRETS = {"", "dev-edge"}
+EXPORT_FIELDS = {"name": 1, "pass_code": 1, "face_embeddings": 1, **PASS_FIELDS, **MODEL_FIELDS}
+
+# Full bundles by (route, version); any gallery edit bumps the version
+bundles = LRUCache(64, ttl=Config.EDGE_BUNDLE_CACHE_TTL)
+
+def _canonical(payload: dict) -> bytes:
+    body = {k: v for k, v in payload.items() if k != "signature"}
+    return json.dumps(body, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+def signing_ready() -> bool:
+    return (Config.EDGE_BUNDLE_SECRET or "") not in PLACEHOLDER_SECRETS
+
+def _key() -> bytes:
+    if not signing_ready():
+        raise RuntimeError("EDGE_BUNDLE_SECRET is unset or a placeholder; refusing to sign gallery bundles")
+    return Config.EDGE_BUNDLE_SECRET.encode("utf-8")
+
+def sign(payload: dict) -> dict:
+    payload["signature"] = hmac.new(_key(), _canonical(payload), hashlib.sha256).hexdigest()
+    return payload
+
+def verify_signature(payload: dict) -> bool:
+    expected = hmac.new(_key(), _canonical(payload), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, payload.get("signature", ""))
+
+def _quantise(value) -> str | None:
+    vec = decode_embedding(value).ravel()
+    norm = float(np.linalg.norm(vec))
+    if not vec.size or norm == 0:
+        return None
+    return base64.b64encode(bytes(encode_embedding(vec / norm, "int8"))).decode("ascii")
+
+def _entry(user: dict, route: str, now: float) -> dict | None:
+    """
+    Bundle entry for a user, or None if they shouldn't be on this route's device.
+    """
+    if route_key(user.get("From"), user.get("To")) != route or not model_ok(user):
+        return None
+    expiry = _pass_expiry_ts(user)
+    if expiry <= now:
+        return None
+    embeddings = [e for e in (_quantise(v) for v in user.get("face_embeddings", [])) if e]
+    if not embeddings:
+        return None
+    return {
+        "user_id": str(user["_id"]),
+        "name": user.get("name", ""),
+        "pass_code": user.get("pass_code", ""),
+        "pass_expiry": int(expiry),
+        "embeddings": embeddings,
+    }
+
+def _route_query(route: str) -> dict:
+    # Narrow on From/To in Mongo; route_key() equality is re-checked per user
+    start, _, end = route.partition("|")
+    return {
+        "From": {"$regex": rf"^\s*{re.escape(start)}\s*$", "$options": "i"},
+        "To": {"$regex": rf"^\s*{re.escape(end)}\s*$", "$options": "i"},
+    }
+
+def _header(kind: str, route: str, version: int) -> dict:
+    return {
+        "format": BUNDLE_FORMAT,
+        "kind": kind,
+        "route": route,
+        "version": version,
+        "model": Config.FACE_MODEL_TAG,
+        "threshold": Config.FACE_THRESHOLD,
+        "quantization": "int8",
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+    }
+
+def build_bundle(route: str) -> dict:
+    """
+    Signed full bundle of valid pass holders on a route.
+    """
+    version = current_change_seq()  # read first: edits racing the scan come back in the next delta
+    cached = bundles.get((route, version))
+    if cached is not None:
+        return cached
+
+    now = time.time()
+    query = {"Pass_Status": True, "face_embeddings": {"$exists": True, "$ne": []}, **_route_query(route)}
+    entries = [e for e in (_entry(u, route, now) for u in mongo.db.users.find(query, EXPORT_FIELDS)) if e]
+    bundle = sign({**_header("full", route, version), "entries": entries})
+    bundles.put((route, version), bundle)
+    return bundle
+
+def build_delta(route: str, since: int) -> dict | None:
+    """
+    Signed changes on a route after version `since`: "upserts" (full entries that
+    replace any the device has) and "revoked" user ids. None when the change log
+    no longer reaches back to `since` (or the device is ahead of it): the device
+    must download a full bundle.
+    """
+    db = mongo.db
+    version = current_change_seq()
+    if since > version:
+        return None
+    if since < version:
+        oldest = db.gallery_changes.find_one({}, {"seq": 1}, sort=[("seq", 1)])
+        if oldest is None or oldest["seq"] > since + 1:
+            return None
+
+    changed = {c["user_id"] for c in db.gallery_changes.find({"seq": {"$gt": since, "$lte": version}}, {"user_id": 1})}
+    ids = [ObjectId(u) for u in changed if ObjectId.is_valid(u)]
+    now = time.time()
+    upserts = [e for e in (_entry(u, route, now) for u in db.users.find({"_id": {"$in": ids}}, EXPORT_FIELDS)) if e] if ids else []
+    kept = {e["user_id"] for e in upserts}
+    # Users who left the route, lost their pass or their faces; unknown ids are harmless to a device
+    revoked = sorted(changed - kept)
+    return sign({**_header("delta", route, version), "since": since, "upserts": upserts, "revoked": revoked})
@@ -0,0 +1,58 @@
+# backend/face_processing/embedding_codec.py
+import struct
+import numpy as np
+from bson.binary import Binary
+
+from config import Config
+
+# User-defined BSON binary subtype for packed embeddings
+EMBEDDING_SUBTYPE = 0x80
+
+# 8-byte header: format code, 3 reserved bytes, float32 scale (int8 only).
+# Keeping it 8 bytes keeps the payload aligned for np.frombuffer.
+_HEADER = struct.Struct("<B3xf")
+_FORMATS = {"float16": 1, "int8": 2}
+_DTYPES = {1: np.float16, 2: np.int8}
+
+def encode_embedding(emb: np.ndarray, fmt: str = Config.FACE_EMBEDDING_FORMAT):
+    """
+    Pack one embedding for storage in users.face_embeddings.
+    fmt: "float16", "int8" (symmetric, per-vector scale) or "float32"
+    (legacy plain BSON array of doubles).
+    """
+    emb = np.asarray(emb, dtype=np.float32).ravel()
+    if fmt == "float32":
+        return emb.tolist()
+    code = _FORMATS[fmt]
+    if code == 2:
+        peak = float(np.abs(emb).max())
+        scale = peak / 127.0 if peak > 0 else 1.0
+        payload = np.clip(np.rint(emb / scale), -127, 127).astype(np.int8)
+    else:
+        scale = 1.0
+        payload = emb.astype(np.float16)
+    return Binary(_HEADER.pack(code, scale) + payload.tobytes(), EMBEDDING_SUBTYPE)
+
+def decode_embedding(value) -> np.ndarray:
+    """
+    Inverse of encode_embedding; also accepts legacy float arrays.
+    Returns float32 (the packed payload itself is read with np.frombuffer).
+    """
+    if isinstance(value, (bytes, Binary)):
+        code, scale = _HEADER.unpack_from(value)
+        raw = np.frombuffer(value, dtype=_DTYPES[code], offset=_HEADER.size)
+        if code == 2:
+            return raw.astype(np.float32) * np.float32(scale)
+        return raw.astype(np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+def is_packed(value) -> bool:
+    return isinstance(value, (bytes, Binary))
+
+def embedding_format(value) -> str:
+    """
+    Storage format of a stored embedding: "float16", "int8" or "float32".
+    """
+    if not is_packed(value):
+        return "float32"
+    return next(name for name, code in _FORMATS.items() if code == value[0])
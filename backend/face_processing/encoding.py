@@ -1,8 +1,10 @@
 from deepface import DeepFace
 import numpy as np
 
+from config import Config
+
 class FaceRecognizer:
-    def __init__(self, model_name="Facenet"):
+    def __init__(self, model_name=Config.DEEPFACE_MODEL):
         self.model_name = model_name
 
     def get_embedding(self, face_img):
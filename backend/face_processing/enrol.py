@@ -0,0 +1,96 @@
+# backend/face_processing/enrol.py
+import os
+import cv2
+from bson import ObjectId
+
+from config import Config
+from utils.database import mongo
+from face_processing.inference import get_engine
+from face_processing.quality import check_face
+from face_processing.ingest import crop_region
+from face_processing.alignment import align_face
+
+FACE_DIR = os.path.join(os.getcwd(), "registered_faces")
+os.makedirs(FACE_DIR, exist_ok=True)
+
+def largest_face(faces):
+    if not faces:
+        return None
+    return max(faces, key=lambda f: f.w * f.h)
+
+def crop_face(image, face):
+    """
+    The crop to embed: warped onto the ArcFace template when FACE_ALIGN is on
+    and the detector gave landmarks, else the box.
+    """
+    if Config.FACE_ALIGN:
+        aligned = align_face(image, face)
+        if aligned is not None:
+            return aligned
+    return crop_region(image, face)
+
+def gated_crops(images):
+    """
+    One detector pass, then the largest face per image through the quality gate.
+    Returns (crops, reasons) aligned with images; crop is None when rejected.
+    """
+    crops, reasons = [], []
+    for img, faces in zip(images, get_engine().detect(images)):
+        face = largest_face(faces)
+        why = check_face(img, face)
+        crop = None if why else crop_face(img, face)
+        if crop is None and not why:
+            why = ["no_face"]
+        crops.append(crop)
+        reasons.append(why)
+    return crops, reasons
+
+def extract_faces(images):
+    """
+    One detector pass and one embedding pass over images (any number of users).
+    Returns (crops, embeddings, reasons) aligned with images; crop/embedding
+    are None where the image had no usable face.
+    """
+    crops, reasons = gated_crops(images)
+    usable = [i for i, c in enumerate(crops) if c is not None]
+    embeddings = [None] * len(images)
+    if usable:
+        for i, emb in zip(usable, get_engine().embed([crops[i] for i in usable])):
+            embeddings[i] = emb
+    return crops, embeddings, reasons
+
+def store_enrolment(user_id: str, crops, embeddings, reasons, recognizer) -> dict:
+    """
+    Store one user's extracted faces (users + gallery) and a preview crop.
+    Returns {count, rejected, reasons, face_path}; count 0 means nothing was stored.
+    """
+    rejected = sorted({r for why in reasons for r in why})
+    kept, last_path = [], None
+    for crop, emb in zip(crops, embeddings):
+        if crop is None or emb is None:
+            continue
+        kept.append(emb)
+        # Save last crop preview
+        last_path = os.path.join(FACE_DIR, f"{user_id}.jpg")
+        cv2.imwrite(last_path, crop)
+
+    result = {"count": 0, "rejected": sum(c is None for c in crops), "reasons": rejected, "face_path": last_path}
+    if not kept:
+        return result
+    if not recognizer.store_faces(user_id, kept):
+        raise RuntimeError("Failed to store embeddings")
+
+    update = {"face_registered": True}
+    if last_path:
+        update["face_path"] = last_path
+    mongo.db.users.update_one({"_id": ObjectId(user_id)}, {"$set": update})
+    result["count"] = len(kept)
+    return result
+
+def enrol_images(user_id: str, images: list, recognizer) -> dict:
+    """
+    Detect, quality-gate and embed the largest face in each decoded image,
+    then store the embeddings (users + gallery) and a preview crop.
+    Returns {count, rejected, reasons, face_path}; count 0 means nothing was stored.
+    """
+    return store_enrolment(user_id, *extract_faces(images), recognizer)
@@ -0,0 +1,680 @@
+# backend/face_processing/gallery.py
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+import numpy as np
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from config import Config
+from utils.database import mongo
+from face_processing.ann_index import make_index
+from face_processing.embedding_codec import decode_embedding
+
+PASS_FIELDS = {"From": 1, "To": 1, "Pass_Status": 1, "pass_expiry": 1}
+MODEL_FIELDS = {"face_model": 1}
+ID_DTYPE = "<U24"  # ObjectId hex
+
+def route_key(from_location, to_location) -> str | None:
+    """
+    Normalised "from|to" key used to partition the gallery by bus route.
+    """
+    if not from_location or not to_location:
+        return None
+    return f"{str(from_location).strip().lower()}|{str(to_location).strip().lower()}"
+
+def _pass_expiry_ts(user: dict) -> float:
+    """
+    Pass expiry as a UTC epoch timestamp; -inf when the user has no active pass.
+    """
+    if not user.get("Pass_Status"):
+        return -np.inf
+    expiry = user.get("pass_expiry")
+    if isinstance(expiry, str):
+        for fmt in ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"):
+            try:
+                expiry = datetime.strptime(expiry, fmt)
+                break
+            except ValueError:
+                continue
+    if not isinstance(expiry, datetime):
+        return -np.inf
+    if expiry.tzinfo is None:
+        expiry = expiry.replace(tzinfo=timezone.utc)
+    return expiry.timestamp()
+
+def model_ok(user: dict) -> bool:
+    """
+    True if the user's stored embeddings come from the configured model.
+    """
+    tag = user.get("face_model")
+    if tag is None:
+        return Config.FACE_ACCEPT_UNTAGGED
+    return tag == Config.FACE_MODEL_TAG
+
+def current_change_seq() -> int:
+    doc = mongo.db.counters.find_one({"_id": "gallery_changes"})
+    return doc["seq"] if doc else 0
+
+def record_change(user_id: str, op: str) -> int:
+    """
+    Append to the gallery change log so other workers (and snapshots) pick up
+    the edit. op: "upsert" (re-read the user) or "remove". Returns the seq.
+    """
+    db = mongo.db
+    doc = db.counters.find_one_and_update(
+        {"_id": "gallery_changes"},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    db.gallery_changes.insert_one({
+        "seq": doc["seq"],
+        "user_id": str(user_id),
+        "op": op,
+        "ts": datetime.utcnow()
+    })
+    return doc["seq"]
+
+def record_changes(user_ids: list, op: str) -> int:
+    """
+    record_change for many users with one counter bump (bulk jobs). Returns the last seq.
+    """
+    if not user_ids:
+        return current_change_seq()
+    db = mongo.db
+    doc = db.counters.find_one_and_update(
+        {"_id": "gallery_changes"},
+        {"$inc": {"seq": len(user_ids)}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    first, now = doc["seq"] - len(user_ids) + 1, datetime.utcnow()
+    db.gallery_changes.insert_many([
+        {"seq": first + i, "user_id": str(u), "op": op, "ts": now}
+        for i, u in enumerate(user_ids)
+    ], ordered=False)
+    return doc["seq"]
+
+def _gather(base, delta, rows):
+    # Vectors for global row numbers spanning the base and delta segments
+    rows = np.asarray(rows, dtype=np.int64)
+    nb = len(base)
+    if not len(delta):
+        return np.asarray(base[rows])
+    out = np.empty((len(rows), delta.shape[1]), dtype=np.float32)
+    in_base = rows < nb
+    if in_base.any():
+        out[in_base] = base[rows[in_base]]
+    out[~in_base] = delta[rows[~in_base] - nb]
+    return out
+
+def _id_at(base_ids, delta_ids, row):
+    return str(base_ids[row]) if row < len(base_ids) else delta_ids[row - len(base_ids)]
+
+def _ids_at(base_ids, delta_ids, rows):
+    return np.concatenate([np.asarray(base_ids, dtype=ID_DTYPE), delta_ids.astype(ID_DTYPE)])[rows]
+
+class FaceGallery:
+    """
+    Resident copy of every stored face embedding, loaded once per worker.
+    Rows are L2-normalised float32, so a cosine search is one mat-vec + argmax.
+    Mutations build new arrays and swap them in, so searches only hold the lock
+    long enough to grab a consistent snapshot.
+    Deleted rows are tombstoned and compacted away once they pile up.
+
+    Vectors live in two segments: a read-only base (memory-mapped from the
+    on-disk snapshot when FACE_GALLERY_SNAPSHOT_DIR is set, so every worker
+    shares the same page-cache pages) and a small private delta for rows added
+    since. Edits go through the Mongo change log (gallery_changes), which
+    workers replay every FACE_GALLERY_SYNC_SECONDS.
+
+    Each row also carries its owner's route key (From/To) and pass expiry, so a
+    scan from a bus can be restricted to the pass holders valid on that route.
+
+    Past FACE_ANN_MIN_ROWS rows an optional ANN index (Config.FACE_INDEX_BACKEND)
+    proposes candidates, which are then re-scored exactly against the matrix,
+    so FACE_THRESHOLD keeps its meaning.
+    """
+    COMPACT_FRACTION = 0.25
+
+    def __init__(self, index_backend: str = Config.FACE_INDEX_BACKEND,
+                 snapshot_dir: str = Config.FACE_GALLERY_SNAPSHOT_DIR):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._index_backend = index_backend
+        self._snapshot_dir = snapshot_dir
+        self._base = np.empty((0, 0), dtype=np.float32)
+        self._base_ids = np.empty(0, dtype=ID_DTYPE)
+        self._delta = np.empty((0, 0), dtype=np.float32)
+        self._delta_ids = np.empty(0, dtype=object)
+        self._alive = np.empty(0, dtype=bool)
+        self._routes = np.empty(0, dtype=object)
+        self._expiry = np.empty(0, dtype=np.float64)
+        self._partitions = {}
+        self._index = None
+        self._indexed_rows = 0
+        self._version = 0
+        self._last_sync = 0.0
+        self._loaded = False
+        self._listeners = []
+
+    def __len__(self):
+        return int(self._alive.sum())
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _rows_for(self, user_id: str, embeddings, dim: int | None):
+        rows = []
+        for e in embeddings:
+            if e is None:
+                continue
+            arr = decode_embedding(e).ravel()
+            if dim is not None and arr.shape[0] != dim:
+                print(f"Gallery: skipping {arr.shape[0]}-d embedding for {user_id} (expected {dim})")
+                continue
+            dim = arr.shape[0]
+            rows.append(arr)
+        return rows, dim
+
+    def _dim(self):
+        if len(self._base):
+            return self._base.shape[1]
+        if len(self._delta):
+            return self._delta.shape[1]
+        return None
+
+    def _ids_equal(self, user_id: str) -> np.ndarray:
+        # Caller holds self._lock
+        return np.concatenate([self._base_ids == user_id, self._delta_ids == user_id])
+
+    def _rebuild_index(self):
+        # Caller holds self._lock
+        live_rows = np.flatnonzero(self._alive)
+        if len(live_rows) < Config.FACE_ANN_MIN_ROWS:
+            self._index = None
+            self._indexed_rows = 0
+            return
+        index = make_index(self._index_backend)
+        if index is not None:
+            index.build(_gather(self._base, self._delta, live_rows), live_rows,
+                        _ids_at(self._base_ids, self._delta_ids, live_rows))
+            print(f"Face gallery: built {type(index).__name__} over {len(live_rows)} rows")
+        self._index = index
+        self._indexed_rows = len(live_rows)
+
+    def _maybe_reindex(self):
+        # Caller holds self._lock. Build once the gallery is big enough, and retrain
+        # after it has doubled so the coarse quantiser tracks the data.
+        live = int(self._alive.sum())
+        if self._index is None:
+            if live >= Config.FACE_ANN_MIN_ROWS and (self._index_backend or "exact").lower() != "exact":
+                self._rebuild_index()
+        elif live > 2 * self._indexed_rows:
+            self._rebuild_index()
+
+    def _compact(self):
+        # Caller holds self._lock. A memory-mapped base is left alone (its
+        # tombstones go away with the next snapshot); only private rows move.
+        nb = len(self._base)
+        if isinstance(self._base, np.memmap):
+            keep_delta = self._alive[nb:]
+            self._delta = self._delta[keep_delta]
+            self._delta_ids = self._delta_ids[keep_delta]
+            keep = np.concatenate([np.ones(nb, dtype=bool), keep_delta])
+            self._alive = np.concatenate([self._alive[:nb], np.ones(len(self._delta_ids), dtype=bool)])
+        else:
+            keep = self._alive
+            live = np.flatnonzero(keep)
+            self._base = _gather(self._base, self._delta, live)
+            self._base_ids = _ids_at(self._base_ids, self._delta_ids, live)
+            self._delta = np.empty((0, 0), dtype=np.float32)
+            self._delta_ids = np.empty(0, dtype=object)
+            self._alive = np.ones(len(live), dtype=bool)
+        self._routes = self._routes[keep]
+        self._expiry = self._expiry[keep]
+        self._partitions = {}
+        self._rebuild_index()
+
+    def _append(self, user_id: str, rows: list, user: dict):
+        # Caller holds self._lock
+        new = self._normalize(np.stack(rows))
+        start = len(self._alive)
+        self._delta = np.vstack([self._delta, new]) if len(self._delta) else new
+        self._delta_ids = np.concatenate([self._delta_ids, np.asarray([user_id] * len(rows), dtype=object)])
+        self._alive = np.concatenate([self._alive, np.ones(len(rows), dtype=bool)])
+        self._routes = np.concatenate([self._routes, np.asarray([route_key(user.get("From"), user.get("To"))] * len(rows), dtype=object)])
+        self._expiry = np.concatenate([self._expiry, np.full(len(rows), _pass_expiry_ts(user))])
+        self._partitions = {}
+        if self._index is not None:
+            self._index.add(new, np.arange(start, start + len(rows)), [user_id] * len(rows))
+        self._maybe_reindex()
+
+    def _tombstone(self, user_id: str):
+        # Caller holds self._lock
+        rows = np.flatnonzero(self._ids_equal(user_id) & self._alive)
+        if not len(rows):
+            return
+        alive = self._alive.copy()
+        alive[rows] = False
+        self._alive = alive
+        self._partitions = {}
+        if self._index is not None:
+            self._index.remove(rows)
+        if self._should_compact(alive):
+            self._compact()
+
+    def _should_compact(self, alive) -> bool:
+        # Caller holds self._lock. Count only rows _compact() can drop: tombstones
+        # in a memory-mapped base stay until the next snapshot, so counting them
+        # would re-run the compaction (and index rebuild) on every later edit.
+        if isinstance(self._base, np.memmap):
+            alive = alive[len(self._base):]
+        return (~alive).sum() > self.COMPACT_FRACTION * len(alive)
+
+    def _set_pass(self, user_id: str, user: dict):
+        # Caller holds self._lock
+        rows = np.flatnonzero(self._ids_equal(user_id))
+        if not len(rows):
+            return
+        routes, expiry = self._routes.copy(), self._expiry.copy()
+        routes[rows] = route_key(user.get("From"), user.get("To"))
+        expiry[rows] = _pass_expiry_ts(user)
+        self._routes, self._expiry = routes, expiry
+        self._partitions = {}
+
+    def _advance(self, seq: int):
+        # Caller holds self._lock. Our own edit: skip it on the next sync if nothing came in between.
+        if seq == self._version + 1:
+            self._version = seq
+
+    def _install(self, base, base_ids, routes, expiry, version):
+        with self._lock:
+            self._base = base
+            self._base_ids = base_ids
+            self._delta = np.empty((0, 0), dtype=np.float32)
+            self._delta_ids = np.empty(0, dtype=object)
+            self._alive = np.ones(len(base_ids), dtype=bool)
+            self._routes = routes
+            self._expiry = expiry
+            self._partitions = {}
+            self._version = version
+            self._rebuild_index()
+            self._loaded = True
+        self._last_sync = time.monotonic()
+
+    def load_from_db(self):
+        """
+        Build the gallery straight from db.users.
+        """
+        db = mongo.db
+        version = current_change_seq()  # edits racing this read get replayed by sync()
+        users = db.users.find(
+            {"face_embeddings": {"$exists": True, "$ne": []}},
+            {"face_embeddings": 1, **PASS_FIELDS, **MODEL_FIELDS}
+        )
+        rows, ids, routes, expiry, dim = [], [], [], [], None
+        for u in users:
+            if not model_ok(u):
+                continue
+            user_rows, dim = self._rows_for(str(u["_id"]), u.get("face_embeddings", []), dim)
+            rows.extend(user_rows)
+            ids.extend([str(u["_id"])] * len(user_rows))
+            routes.extend([route_key(u.get("From"), u.get("To"))] * len(user_rows))
+            expiry.extend([_pass_expiry_ts(u)] * len(user_rows))
+
+        matrix = self._normalize(np.stack(rows)) if rows else np.empty((0, 0), dtype=np.float32)
+        self._install(matrix, np.asarray(ids, dtype=ID_DTYPE), np.asarray(routes, dtype=object),
+                      np.asarray(expiry, dtype=np.float64), version)
+        print(f"Face gallery loaded from Mongo: {len(ids)} embeddings (version {version})")
+
+    def load(self):
+        """
+        (Re)build the gallery: from the on-disk snapshot plus change-log deltas if
+        one exists, else from Mongo (writing a fresh snapshot for the next worker).
+        A snapshot older than the change-log TTL is rewritten either way.
+        """
+        if self._snapshot_dir and self.load_snapshot(self._snapshot_dir):
+            self.sync(force=True)
+            self._refresh_stale_snapshot()
+            return
+        self.load_from_db()
+        if self._snapshot_dir:
+            try:
+                self.save_snapshot(self._snapshot_dir)
+            except OSError as e:
+                print("Failed to write gallery snapshot:", e)
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self.load()
+        elif time.monotonic() - self._last_sync >= Config.FACE_GALLERY_SYNC_SECONDS:
+            self.sync()
+
+    # --- snapshots -------------------------------------------------------
+
+    def save_snapshot(self, directory: str) -> str:
+        """
+        Write live rows to <directory>/v<version>-<pid>/ and point CURRENT at it.
+        Returns the snapshot path.
+        """
+        with self._lock:
+            live = np.flatnonzero(self._alive)
+            vectors = _gather(self._base, self._delta, live) if len(live) else np.empty((0, 0), dtype=np.float32)
+            ids = _ids_at(self._base_ids, self._delta_ids, live)
+            routes = np.asarray([r or "" for r in self._routes[live]], dtype=str)
+            expiry = self._expiry[live]
+            version = self._version
+
+        os.makedirs(directory, exist_ok=True)
+        name = f"v{version}-{os.getpid()}"
+        path = os.path.join(directory, name)
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "embeddings.npy"), np.ascontiguousarray(vectors, dtype=np.float32))
+        np.save(os.path.join(path, "ids.npy"), ids)
+        np.save(os.path.join(path, "routes.npy"), routes)
+        np.save(os.path.join(path, "expiry.npy"), expiry)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"version": version, "rows": len(ids), "model": Config.FACE_MODEL_TAG,
+                       "created_at": datetime.utcnow().isoformat()}, f)
+
+        tmp = os.path.join(directory, f"CURRENT.{os.getpid()}")
+        with open(tmp, "w") as f:
+            f.write(name)
+        os.replace(tmp, os.path.join(directory, "CURRENT"))
+
+        # Keep the previous snapshot around for workers that still have it mapped
+        snapshots = sorted(
+            (d for d in os.listdir(directory) if d.startswith("v") and os.path.isdir(os.path.join(directory, d))),
+            key=lambda d: os.path.getmtime(os.path.join(directory, d))
+        )
+        for old in snapshots[:-2]:
+            if old != name:
+                shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+        print(f"Face gallery snapshot written: {path} ({len(ids)} rows, version {version})")
+        return path
+
+    def load_snapshot(self, directory: str) -> bool:
+        """
+        Memory-map the CURRENT snapshot. Returns False if there is none.
+        """
+        try:
+            with open(os.path.join(directory, "CURRENT")) as f:
+                path = os.path.join(directory, f.read().strip())
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+            base = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+            base_ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+            routes = np.load(os.path.join(path, "routes.npy"))
+            expiry = np.load(os.path.join(path, "expiry.npy"))
+        except (OSError, ValueError) as e:
+            print("No usable gallery snapshot:", e)
+            return False
+        if meta.get("model", Config.FACE_MODEL_TAG) != Config.FACE_MODEL_TAG:
+            print(f"Gallery snapshot {path} is for model {meta['model']}, not {Config.FACE_MODEL_TAG}")
+            return False
+        routes = np.asarray([r or None for r in routes.tolist()], dtype=object)
+        self._install(base, base_ids, routes, np.array(expiry, dtype=np.float64), int(meta["version"]))
+        print(f"Face gallery mapped from snapshot {path}: {len(base_ids)} embeddings (version {meta['version']})")
+        return True
+
+    @staticmethod
+    def _snapshot_age(directory: str) -> float | None:
+        """
+        Seconds since the CURRENT snapshot was written, or None if there is none.
+        """
+        try:
+            with open(os.path.join(directory, "CURRENT")) as f:
+                path = os.path.join(directory, f.read().strip())
+            with open(os.path.join(path, "meta.json")) as f:
+                created_at = datetime.fromisoformat(json.load(f)["created_at"])
+        except (OSError, ValueError, KeyError):
+            return None
+        return (datetime.utcnow() - created_at).total_seconds()
+
+    def _refresh_stale_snapshot(self):
+        """
+        Rewrite the snapshot once the change log no longer covers it, so the next
+        worker to start maps something it can catch up from instead of reloading.
+        """
+        if not self._snapshot_dir:
+            return
+        age = self._snapshot_age(self._snapshot_dir)
+        if age is not None and age <= Config.FACE_GALLERY_CHANGELOG_TTL:
+            return
+        if age is not None:
+            print(f"Warning: face gallery snapshot is {age / 3600:.1f}h old, past the change-log TTL "
+                  f"({Config.FACE_GALLERY_CHANGELOG_TTL / 3600:.1f}h); writing a fresh one")
+        try:
+            self.save_snapshot(self._snapshot_dir)
+        except OSError as e:
+            print("Failed to write gallery snapshot:", e)
+
+    # --- change log ------------------------------------------------------
+
+    def subscribe(self, fn):
+        """
+        fn(user_id) is called whenever a user's faces or pass change, locally or
+        via the change log; fn(None) means anything may have changed (full reload).
+        """
+        self._listeners.append(fn)
+
+    def _notify(self, user_id):
+        for fn in self._listeners:
+            try:
+                fn(user_id)
+            except Exception as e:
+                print("Face gallery listener failed:", e)
+
+    def sync(self, force: bool = False):
+        """
+        Replay gallery_changes newer than our version. Falls back to a full
+        reload if the log no longer reaches back that far.
+        """
+        if not self._sync_lock.acquire(blocking=force):
+            return  # another thread is already syncing
+        try:
+            self._last_sync = time.monotonic()
+            db = mongo.db
+            latest = current_change_seq()
+            if latest <= self._version:
+                return
+            oldest = db.gallery_changes.find_one({}, {"seq": 1}, sort=[("seq", 1)])
+            if oldest is None or oldest["seq"] > self._version + 1:
+                print("Face gallery change log has been pruned past our version; reloading")
+                self.load_from_db()
+                self._notify(None)
+                self._refresh_stale_snapshot()
+                return
+
+            ops, version = {}, self._version
+            for c in db.gallery_changes.find({"seq": {"$gt": self._version}}).sort("seq", 1):
+                ops[c["user_id"]] = c["op"]
+                version = c["seq"]
+            upserts = [ObjectId(u) for u, op in ops.items() if op == "upsert"]
+            docs = {
+                str(u["_id"]): u
+                for u in db.users.find({"_id": {"$in": upserts}}, {"face_embeddings": 1, **PASS_FIELDS, **MODEL_FIELDS})
+            } if upserts else {}
+
+            with self._lock:
+                for user_id, op in ops.items():
+                    self._tombstone(user_id)
+                    user = docs.get(user_id)
+                    if op == "upsert" and user and model_ok(user):
+                        rows, _ = self._rows_for(user_id, user.get("face_embeddings", []), self._dim())
+                        if rows:
+                            self._append(user_id, rows, user)
+                self._version = max(self._version, version)
+            for user_id in ops:
+                self._notify(user_id)
+        except Exception as e:
+            print("Face gallery sync failed:", e)
+        finally:
+            self._sync_lock.release()
+
+    # --- public edits ----------------------------------------------------
+
+    def add(self, user_id: str, embeddings: list[np.ndarray], user: dict | None = None):
+        """
+        Append embeddings for a user and log the change for other workers.
+        user: the user's pass fields (From/To/Pass_Status/pass_expiry); fetched if omitted.
+        """
+        user_id = str(user_id)
+        seq = record_change(user_id, "upsert")
+        self._notify(user_id)
+        if not self._loaded:
+            return
+        if user is None:
+            user = mongo.db.users.find_one({"_id": ObjectId(user_id)}, PASS_FIELDS) or {}
+        with self._lock:
+            rows, _ = self._rows_for(user_id, embeddings, self._dim())
+            if rows:
+                self._append(user_id, rows, user)
+            self._advance(seq)
+
+    def replace(self, user_id: str, embeddings: list[np.ndarray], user: dict | None = None):
+        """
+        Swap all of a user's embeddings for a new set (template updates) and log the change.
+        """
+        user_id = str(user_id)
+        seq = record_change(user_id, "upsert")
+        self._notify(user_id)
+        if not self._loaded:
+            return
+        if user is None:
+            user = mongo.db.users.find_one({"_id": ObjectId(user_id)}, PASS_FIELDS) or {}
+        with self._lock:
+            self._tombstone(user_id)
+            rows, _ = self._rows_for(user_id, embeddings, self._dim())
+            if rows:
+                self._append(user_id, rows, user)
+            self._advance(seq)
+
+    def remove(self, user_id: str):
+        """
+        Drop every embedding belonging to user_id.
+        """
+        user_id = str(user_id)
+        seq = record_change(user_id, "remove")
+        self._notify(user_id)
+        if not self._loaded:
+            return
+        with self._lock:
+            self._tombstone(user_id)
+            self._advance(seq)
+
+    def refresh_pass(self, user_id: str, user: dict | None = None):
+        """
+        Re-read a user's route and pass status after approval/decline/expiry edits.
+        """
+        user_id = str(user_id)
+        seq = record_change(user_id, "upsert")
+        self._notify(user_id)
+        if not self._loaded:
+            return
+        if user is None:
+            user = mongo.db.users.find_one({"_id": ObjectId(user_id)}, PASS_FIELDS) or {}
+        with self._lock:
+            self._set_pass(user_id, user)
+            self._advance(seq)
+
+    # --- search ----------------------------------------------------------
+
+    def _partition(self, route: str) -> np.ndarray:
+        # Caller holds self._lock. Row numbers on a route; rebuilt lazily after any mutation.
+        rows = self._partitions.get(route)
+        if rows is None:
+            rows = np.flatnonzero(self._routes == route)
+            self._partitions[route] = rows
+        return rows
+
+    def search(self, query_embedding: np.ndarray, route: str | None = None,
+               active_only: bool = False) -> tuple[str | None, float]:
+        """
+        Returns (user_id, cosine similarity) of the closest stored embedding.
+        route: a route_key(); only rows of users on that route are compared.
+        active_only: only compare users whose pass is active and unexpired.
+        """
+        return self.search_many([query_embedding], route=route, active_only=active_only)[0]
+
+    def search_many(self, query_embeddings, route: str | None = None,
+                    active_only: bool = False) -> list[tuple[str | None, float]]:
+        """
+        search() for several queries at once (e.g. every face in a frame):
+        one matrix-matrix product against the gallery instead of a mat-vec per face.
+        Returns one (user_id, cosine similarity) per query.
+        """
+        with self._lock:
+            base, base_ids, delta, delta_ids = self._base, self._base_ids, self._delta, self._delta_ids
+            alive, expiry, index = self._alive, self._expiry, self._index
+            dim = self._dim()
+            scoped = self._partition(route) if route is not None else None
+        if not len(query_embeddings):
+            return []
+        miss = [(None, -1.0)] * len(query_embeddings)
+        if not alive.any():
+            return miss
+        Q = self._normalize(np.stack([np.asarray(q, dtype=np.float32).reshape(-1) for q in query_embeddings]))
+        if Q.shape[1] != dim:
+            print(f"Gallery: query is {Q.shape[1]}-d but gallery is {dim}-d")
+            return miss
+
+        if route is not None or active_only:
+            rows = scoped if scoped is not None else np.arange(len(alive))
+            mask = alive[rows]
+            if active_only:
+                mask &= expiry[rows] > time.time()
+            rows = rows[mask]
+            if not len(rows):
+                return miss
+            sims = Q @ _gather(base, delta, rows).T
+            best = np.argmax(sims, axis=1)
+            return [(_id_at(base_ids, delta_ids, rows[b]), float(sims[i, b])) for i, b in enumerate(best)]
+
+        if index is not None:
+            out = []
+            for q in Q:
+                cand = index.candidates(q, Config.FACE_ANN_RERANK_K)
+                # Drop rows appended/tombstoned after this search took its snapshot
+                cand = cand[cand < len(alive)]
+                cand = cand[alive[cand]]
+                if not len(cand):
+                    break
+                sims = _gather(base, delta, cand) @ q
+                best = int(np.argmax(sims))
+                out.append((_id_at(base_ids, delta_ids, cand[best]), float(sims[best])))
+            else:
+                return out
+
+        parts = [Q @ base.T] if len(base) else []
+        if len(delta):
+            parts.append(Q @ delta.T)
+        sims = np.concatenate(parts, axis=1)
+        sims[:, ~alive] = -np.inf
+        best = np.argmax(sims, axis=1)
+        return [(_id_at(base_ids, delta_ids, b), float(sims[i, b])) for i, b in enumerate(best)]
+
+# One gallery per worker process
+gallery = FaceGallery()
@@ -0,0 +1,163 @@
+# backend/face_processing/governor.py
+"""
+Process-wide inference governor.
+
+configure_threads() sizes the math libraries' thread pools (OpenMP/MKL/OpenBLAS,
+PyTorch, TensorFlow, OpenCV) from FACE_INTRA_OP_THREADS / FACE_INTER_OP_THREADS
+before the models load, so each gunicorn worker doesn't start pools sized to
+every core. OpenBLAS reads its variable when numpy is imported, so for the web
+workers also export OPENBLAS_NUM_THREADS in the environment.
+
+InferenceGovernor caps concurrent forward passes per process. A request thread
+that finds FACE_INFERENCE_MAX_QUEUE callers already waiting, or can't get a slot
+within FACE_INFERENCE_QUEUE_TIMEOUT, gets InferenceBusy (503 + Retry-After)
+instead of queueing. Background work (registration jobs) waits for its turn.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import cv2
+
+from config import Config
+
+_configured = False
+
+def configure_threads(intra: int = None, inter: int = None, frameworks: bool = True):
+    """
+    Apply the thread budget once per process. frameworks=False skips importing
+    torch/TensorFlow (ONNX Runtime takes its budget from the session options).
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    intra = max(1, intra or Config.FACE_INTRA_OP_THREADS)
+    inter = max(1, inter or Config.FACE_INTER_OP_THREADS)
+
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"):
+        os.environ[var] = str(intra)
+    os.environ["TF_NUM_INTEROP_THREADS"] = str(inter)
+    cv2.setNumThreads(intra)
+    if not frameworks:
+        return
+
+    try:
+        import torch
+        torch.set_num_threads(intra)
+        torch.set_num_interop_threads(inter)
+    except (ImportError, RuntimeError) as e:
+        # RuntimeError: inter-op pool already started
+        print("Could not set torch thread budget:", e)
+    try:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(intra)
+        tf.config.threading.set_inter_op_parallelism_threads(inter)
+    except (ImportError, RuntimeError) as e:
+        # RuntimeError: TensorFlow runtime already initialised
+        print("Could not set TensorFlow thread budget:", e)
+
+class InferenceBusy(Exception):
+    """
+    No inference slot available; retry_after is a whole number of seconds.
+    """
+    def __init__(self, retry_after: int = 1):
+        super().__init__(f"Inference busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class InferenceGovernor:
+    """
+    Semaphore around forward passes with a bounded, timed wait and metrics.
+    """
+    def __init__(self, max_concurrent: int = Config.FACE_INFERENCE_CONCURRENCY,
+                 max_queue: int = Config.FACE_INFERENCE_MAX_QUEUE,
+                 queue_timeout: float = Config.FACE_INFERENCE_QUEUE_TIMEOUT):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._slots = threading.Semaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._running = 0
+        self._waiting = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._pass_avg = 0.0  # moving average of forward-pass seconds
+        self._waits = deque(maxlen=1024)
+
+    @contextmanager
+    def background(self):
+        """
+        Forward passes inside this block wait for a slot instead of being rejected.
+        """
+        previous = getattr(self._local, "background", False)
+        self._local.background = True
+        try:
+            yield
+        finally:
+            self._local.background = previous
+
+    def _retry_after(self) -> int:
+        backlog = self._waiting + self._running
+        return max(1, math.ceil(self._pass_avg * backlog / self.max_concurrent))
+
+    def retry_after(self) -> int:
+        with self._lock:
+            return self._retry_after()
+
+    @contextmanager
+    def slot(self):
+        background = getattr(self._local, "background", False)
+        with self._lock:
+            if not background and self._waiting >= self.max_queue:
+                self._rejected += 1
+                raise InferenceBusy(self._retry_after())
+            self._waiting += 1
+
+        start = time.monotonic()
+        acquired = self._slots.acquire(timeout=None if background else self.queue_timeout)
+        with self._lock:
+            self._waiting -= 1
+            self._waits.append(time.monotonic() - start)
+            if not acquired:
+                self._rejected += 1
+                raise InferenceBusy(self._retry_after())
+            self._running += 1
+            self._admitted += 1
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            self._slots.release()
+            with self._lock:
+                self._running -= 1
+                self._pass_avg = elapsed if not self._pass_avg else 0.8 * self._pass_avg + 0.2 * elapsed
+
+    def run(self, fn, *args, **kwargs):
+        with self.slot():
+            return fn(*args, **kwargs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "concurrency": self.max_concurrent,
+                "running": self._running,
+                "waiting": self._waiting,
+                "max_queue": self.max_queue,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "wait_ms_avg": round(1000 * sum(waits) / len(waits), 2) if waits else 0.0,
+                "wait_ms_p95": round(1000 * waits[int(0.95 * (len(waits) - 1))], 2) if waits else 0.0,
+                "wait_ms_max": round(1000 * waits[-1], 2) if waits else 0.0,
+                "pass_ms_avg": round(1000 * self._pass_avg, 2),
+                "retry_after": self._retry_after(),
+            }
+
+# One governor per process
+governor = InferenceGovernor()
@@ -0,0 +1,197 @@
+# backend/face_processing/inference.py
+import hashlib
+import threading
+from multiprocessing.connection import Client
+
+import cv2
+import numpy as np
+
+from config import Config
+from utils.cache import LRUCache
+from face_processing.governor import governor, configure_threads, InferenceBusy
+
+# Results by image content, shared by every engine in this process
+detection_cache = LRUCache(Config.FACE_RESULT_CACHE_SIZE, ttl=Config.FACE_RESULT_CACHE_TTL)
+embedding_cache = LRUCache(Config.FACE_RESULT_CACHE_SIZE, ttl=Config.FACE_RESULT_CACHE_TTL)
+
+class LocalEngine:
+    """
+    Runs detection and embedding in this process, either through
+    YOLO + DeepFace or the ONNX Runtime exports (FACE_BACKEND).
+    Forward passes go through the process's inference governor.
+    """
+    def __init__(self, backend: str = Config.FACE_BACKEND):
+        configure_threads(frameworks=backend != "onnx")
+        if backend == "onnx":
+            from face_processing.onnx_backend import OnnxFaceDetector, OnnxFaceEmbedder
+            self.detector = OnnxFaceDetector()
+            self.recognizer = OnnxFaceEmbedder()
+        else:
+            from face_processing.detection import FaceDetector
+            from face_processing.recognition import FaceRecognizer
+            self.detector = FaceDetector()
+            self.recognizer = FaceRecognizer()
+
+    def detect(self, images):
+        return governor.run(self.detector.detect_faces_batch, images)
+
+    def embed(self, crops):
+        return governor.run(self.recognizer.generate_embeddings, crops)
+
+def parse_address(address: str):
+    """
+    "host:port" -> (host, port) for TCP, anything else is a unix socket path.
+    """
+    if ":" in address and not address.startswith("/"):
+        host, port = address.rsplit(":", 1)
+        return host, int(port)
+    return address
+
+class RemoteEngine:
+    """
+    Client for face_processing.inference_server. The web worker never imports
+    torch/TensorFlow; images are downscaled to the detector's working size
+    before they go over the socket.
+    """
+    def __init__(self, address: str = Config.FACE_INFERENCE_ADDRESS,
+                 authkey: str = Config.FACE_INFERENCE_AUTHKEY,
+                 timeout: float = Config.FACE_INFERENCE_TIMEOUT):
+        self.address = parse_address(address)
+        self.authkey = authkey.encode("utf-8")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(self.address, authkey=self.authkey)
+            self._local.conn = conn
+        return conn
+
+    def _drop(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+        self._local.conn = None
+
+    def _call(self, op, payload):
+        for attempt in range(2):
+            try:
+                conn = self._conn()
+                conn.send((op, payload))
+                if not conn.poll(self.timeout):
+                    self._drop()
+                    raise TimeoutError(f"inference server did not answer {op} within {self.timeout}s")
+                status, result = conn.recv()
+                break
+            except TimeoutError:
+                # The server is slow, not gone: sending again would only double its load
+                raise
+            except (EOFError, OSError):
+                # Server restarted or connection went stale; reconnect once
+                self._drop()
+                if attempt:
+                    raise
+        if status == "busy":
+            raise InferenceBusy(result)
+        if status != "ok":
+            raise RuntimeError(f"inference server {op} failed: {result}")
+        return result
+
+    def detect(self, images):
+        from face_processing.detection import Face, FaceDetector
+        small, scales = [], []
+        for image in images:
+            if image is None:
+                small.append(None)
+                scales.append(1.0)
+                continue
+            h, w = image.shape[:2]
+            scale = min(1.0, FaceDetector.MAX_SIDE / max(h, w))
+            small.append(cv2.resize(image, (int(w*scale), int(h*scale))) if scale < 1.0 else image)
+            scales.append(scale)
+        faces = self._call("detect", small)
+        return [
+            [Face(int(f.x / s), int(f.y / s), int(f.w / s), int(f.h / s), f.confidence,
+                  tuple((px / s, py / s) for px, py in f.landmarks) if f.landmarks else None)
+             for f in boxes]
+            for boxes, s in zip(faces, scales)
+        ]
+
+    def embed(self, crops):
+        return self._call("embed", crops)
+
+def content_key(image):
+    """
+    128-bit hash of a decoded image or crop (pixels, shape and dtype), or None.
+    """
+    if image is None or not getattr(image, "size", 0):
+        return None
+    arr = np.ascontiguousarray(image)
+    h = hashlib.blake2b(f"{arr.shape}{arr.dtype.str}".encode(), digest_size=16)
+    h.update(arr.data)
+    return h.digest()
+
+def _freeze_faces(faces):
+    return None if faces is None else tuple(faces)
+
+def _freeze_embedding(emb):
+    if emb is None:
+        return None
+    emb = np.array(emb, dtype=np.float32)
+    emb.setflags(write=False)  # shared between requests
+    return emb
+
+class CachedEngine:
+    """
+    Content-addressed cache in front of another engine: an identical frame or
+    crop (client retries, kiosks resubmitting the same frame) costs a hash
+    instead of a detector or embedding pass. Misses go to the wrapped engine
+    in one batch.
+    """
+    def __init__(self, engine, detections: LRUCache = detection_cache, embeddings: LRUCache = embedding_cache):
+        self.engine = engine
+        self.detections = detections
+        self.embeddings = embeddings
+
+    @staticmethod
+    def _through(cache, fn, items, freeze):
+        keys = [content_key(item) for item in items]
+        out = [cache.get(k) if k is not None else None for k in keys]
+        missing = [i for i, r in enumerate(out) if r is None]
+        if missing:
+            for i, result in zip(missing, fn([items[i] for i in missing])):
+                out[i] = freeze(result)
+                if keys[i] is not None and out[i] is not None:
+                    cache.put(keys[i], out[i])
+        return out
+
+    def detect(self, images):
+        faces = self._through(self.detections, self.engine.detect, images, _freeze_faces)
+        return [list(f) if f is not None else [] for f in faces]
+
+    def embed(self, crops):
+        return self._through(self.embeddings, self.engine.embed, crops, _freeze_embedding)
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """
+    The process-wide inference engine, built on first use.
+    FACE_INFERENCE_MODE=remote sends work to the inference server pool;
+    FACE_RESULT_CACHE puts the content-addressed result cache in front.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if Config.FACE_INFERENCE_MODE == "remote":
+                    engine = RemoteEngine()
+                else:
+                    engine = LocalEngine()
+                _engine = CachedEngine(engine) if Config.FACE_RESULT_CACHE else engine
+    return _engine
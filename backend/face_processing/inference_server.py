@@ -0,0 +1,114 @@
+# backend/face_processing/inference_server.py
+"""
+Face inference worker pool.
+
+    cd backend && python -m face_processing.inference_server [--workers N] [--address ADDR]
+
+The parent opens one listening socket and forks N workers that each load the
+models once and accept connections from the web workers (FACE_INFERENCE_MODE=remote).
+Inside a worker, requests from all connections are micro-batched together.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import signal
+import threading
+import time
+from multiprocessing.connection import Listener
+
+from config import Config
+from face_processing.batcher import InferenceBatcher
+from face_processing.governor import InferenceBusy
+from face_processing.inference import LocalEngine, parse_address
+
+def _flattening(fn):
+    """
+    Adapt fn(list) -> list into a batcher function over lists of lists,
+    so several clients' requests go through one model call.
+    """
+    def run(requests):
+        flat = [item for req in requests for item in req]
+        results = fn(flat) if flat else []
+        out, i = [], 0
+        for req in requests:
+            out.append(results[i:i+len(req)])
+            i += len(req)
+        return out
+    return run
+
+def _handle(conn, ops):
+    try:
+        while True:
+            try:
+                op, payload = conn.recv()
+            except EOFError:
+                return
+            fn = ops.get(op)
+            if fn is None:
+                conn.send(("err", f"unknown op {op!r}"))
+                continue
+            try:
+                conn.send(("ok", fn(payload)))
+            except InferenceBusy as e:
+                conn.send(("busy", e.retry_after))
+            except Exception as e:
+                conn.send(("err", str(e)))
+    finally:
+        conn.close()
+
+def _serve(listener):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    engine = LocalEngine()
+    detect = InferenceBatcher(_flattening(engine.detect), name="detect")
+    embed = InferenceBatcher(_flattening(engine.embed), name="embed")
+    ops = {"detect": detect, "embed": embed, "ping": lambda _: os.getpid()}
+    print(f"Inference worker {os.getpid()} ready")
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            # Includes failed authkey handshakes
+            print(f"Inference worker {os.getpid()} accept failed:", e)
+            continue
+        threading.Thread(target=_handle, args=(conn, ops), daemon=True).start()
+
+def main():
+    parser = argparse.ArgumentParser(description="Face inference worker pool")
+    parser.add_argument("--workers", type=int, default=Config.FACE_INFERENCE_WORKERS)
+    parser.add_argument("--address", default=Config.FACE_INFERENCE_ADDRESS)
+    args = parser.parse_args()
+
+    address = parse_address(args.address)
+    if isinstance(address, str) and os.path.exists(address):
+        os.unlink(address)
+    listener = Listener(address, authkey=Config.FACE_INFERENCE_AUTHKEY.encode("utf-8"))
+    print(f"Face inference pool listening on {args.address} with {args.workers} workers")
+
+    # Fork so every worker accepts on the same socket; models load after the fork
+    ctx = mp.get_context("fork")
+    workers = []
+
+    def spawn():
+        p = ctx.Process(target=_serve, args=(listener,), daemon=True)
+        p.start()
+        return p
+
+    def stop(*_):
+        for p in workers:
+            p.terminate()
+        listener.close()
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    workers.extend(spawn() for _ in range(max(1, args.workers)))
+    while True:
+        time.sleep(1)
+        for i, p in enumerate(workers):
+            if not p.is_alive():
+                print(f"Inference worker {p.pid} exited ({p.exitcode}); restarting")
+                workers[i] = spawn()
+
+if __name__ == "__main__":
+    main()
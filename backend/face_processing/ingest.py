@@ -0,0 +1,158 @@
+# backend/face_processing/ingest.py
+"""
+Image ingest: decode uploads near the detector's working size.
+
+The JPEG/PNG header gives the full size without decoding; JPEGs are then decoded
+with IMREAD_REDUCED_COLOR_2/4/8 so the long side stays at or above
+FACE_INGEST_MIN_SIDE (a 12 MP photo becomes ~1000x750). The result is an
+IngestedImage: the reduced pixels, plus the encoded bytes so crop_region() can
+re-decode at a finer scale when a face is too small in the reduced image.
+Face boxes from the detector are in the reduced image's coordinates;
+scale_of() maps them back to original pixels.
+"""
+import struct
+
+import cv2
+import numpy as np
+
+from config import Config
+
+_REDUCED = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+# SOFn markers carry the frame size; C4/C8/CC are DHT/JPG/DAC
+_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def _jpeg_size(buf):
+    i, n = 2, len(buf)
+    while i + 9 < n:
+        if buf[i] != 0xFF:
+            return None
+        marker = buf[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:  # no length field
+            i += 2
+            continue
+        length = struct.unpack(">H", bytes(buf[i + 2:i + 4]))[0]
+        if marker in _SOF:
+            h, w = struct.unpack(">HH", bytes(buf[i + 5:i + 9]))
+            return w, h
+        i += 2 + length
+    return None
+
+def image_size(buf):
+    """
+    (width, height) from a JPEG or PNG header, or None (unknown format / truncated).
+    Width and height are as stored, before any EXIF rotation.
+    """
+    if len(buf) > 24 and bytes(buf[:8]) == b"\x89PNG\r\n\x1a\n":
+        return struct.unpack(">II", bytes(buf[16:24]))
+    if len(buf) > 4 and buf[0] == 0xFF and buf[1] == 0xD8:
+        return _jpeg_size(buf)
+    return None
+
+def reduction_for(side: float, target: float) -> int:
+    """
+    Largest of 8/4/2/1 that keeps side / factor >= target.
+    """
+    for factor in (8, 4, 2):
+        if side / factor >= target:
+            return factor
+    return 1
+
+class IngestedImage(np.ndarray):
+    """
+    Reduced-resolution decode of an upload that remembers its encoded bytes.
+    factor = original pixels per array pixel. Slices and cv2 results are
+    plain arrays as far as re-decoding is concerned.
+    """
+    def __new__(cls, pixels, encoded, factor: int):
+        obj = np.asarray(pixels).view(cls)
+        obj.encoded = encoded
+        obj.factor = factor
+        return obj
+
+    def __array_finalize__(self, obj):
+        self.encoded = None
+        self.factor = 1
+        self._decoded = {}
+
+    def at(self, factor: int):
+        """
+        The full image decoded at a given reduction (cached per factor).
+        """
+        if factor == self.factor or self.encoded is None:
+            return self.view(np.ndarray)
+        img = self._decoded.get(factor)
+        if img is None:
+            img = cv2.imdecode(self.encoded, _REDUCED[factor])
+            self._decoded[factor] = img
+        return img
+
+def decode_image(data, min_side: int = Config.FACE_INGEST_MIN_SIDE):
+    """
+    Encoded bytes -> BGR image, reduced at decode time when that is safe.
+    Returns None when the data can't be decoded.
+    """
+    buf = np.frombuffer(data, np.uint8)
+    if not buf.size:
+        return None
+    factor = 1
+    size = image_size(buf)
+    if Config.FACE_REDUCED_DECODE and size and buf[0] == 0xFF:
+        # libjpeg scales during the IDCT; other formats would decode full size anyway
+        factor = reduction_for(max(size), min_side)
+    img = cv2.imdecode(buf, _REDUCED[factor])
+    if img is None:
+        return None
+    return IngestedImage(img, buf, factor) if factor > 1 else img
+
+def read_file(path: str):
+    try:
+        with open(path, "rb") as f:
+            return decode_image(f.read())
+    except OSError:
+        return None
+
+def scale_of(image) -> int:
+    """
+    Original pixels per image pixel (1 for anything that wasn't reduced).
+    """
+    return getattr(image, "factor", 1)
+
+def original_box(image, face) -> list:
+    """
+    [x, y, w, h] of a detected face in the original upload's pixels.
+    """
+    s = scale_of(image)
+    return [int(v) * s for v in face[:4]]
+
+def source_for(image, face, min_side: int = Config.FACE_INGEST_CROP_SIDE):
+    """
+    Pixels to cut a face out of: for an IngestedImage, the coarsest re-decode
+    that still gives min_side pixels across the face. Returns (pixels, sx, sy),
+    the scale from image coordinates to pixel coordinates.
+    """
+    factor = scale_of(image)
+    if factor > 1:
+        fine = min(factor, reduction_for(min(face.w, face.h) * factor, min_side))
+        if fine < factor:
+            src = image.at(fine)
+            if src is not None:
+                return src, src.shape[1] / image.shape[1], src.shape[0] / image.shape[0]
+    return np.asarray(image), 1.0, 1.0
+
+def crop_region(image, face, min_side: int = Config.FACE_INGEST_CROP_SIDE):
+    """
+    Crop a detected face (box in image coordinates), from a finer re-decode
+    when the face is small in a reduced image (see source_for).
+    """
+    src, sx, sy = source_for(image, face, min_side)
+    x, y = max(face.x, 0), max(face.y, 0)
+    crop = src[int(y * sy):int((y + face.h) * sy), int(x * sx):int((x + face.w) * sx)]
+    return crop if crop.size else None
@@ -0,0 +1,247 @@
+# backend/face_processing/jobs.py
+"""
+Background face-registration jobs.
+
+Uploads are written to a spool directory and a face_jobs document is queued;
+files already on disk (applicant photos at approval) are queued by path. Worker
+threads claim up to FACE_JOB_BATCH jobs from Mongo at a time, run one detection
++ embedding pass across all of them, store each user's result and delete the
+spooled files. Any process that calls start()
+(the web app, or `python -m face_processing.jobs` on its own) works the queue.
+Jobs whose worker died are picked up again after FACE_JOB_STALE_SECONDS, up to
+FACE_JOB_MAX_ATTEMPTS claims in all; after that they are marked failed.
+
+    cd backend && python -m face_processing.jobs [--workers N]
+"""
+import argparse
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from config import Config
+from utils.database import mongo
+from face_processing.governor import governor
+from face_processing.ingest import read_file
+
+class RegistrationJobs:
+    """
+    Mongo-backed queue with a bounded pool of worker threads per process.
+    """
+    def __init__(self, spool_dir: str = Config.FACE_JOB_SPOOL_DIR, workers: int = Config.FACE_JOB_WORKERS):
+        self.spool_dir = spool_dir
+        self.workers = max(1, workers)
+        self._wake = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._recognizer = None
+
+    # --- producer side ---------------------------------------------------
+
+    def submit(self, user_id: str, files: list, source: str = "upload") -> str:
+        """
+        Spool the raw image bytes and queue a job. files: bytes or file-like objects.
+        Returns the job id.
+        """
+        job_id = ObjectId()
+        job_dir = os.path.join(self.spool_dir, str(job_id))
+        os.makedirs(job_dir, exist_ok=True)
+        paths = []
+        for i, f in enumerate(files):
+            data = f if isinstance(f, (bytes, bytearray)) else f.read()
+            if not data:
+                continue
+            path = os.path.join(job_dir, f"{i}.img")
+            with open(path, "wb") as out:
+                out.write(data)
+            paths.append(path)
+
+        return self._queue(job_id, user_id, paths, source)
+
+    def submit_paths(self, user_id: str, paths: list, source: str = "approval") -> str:
+        """
+        Queue a job for images already on disk. The files are read in place and
+        never deleted by the worker. Returns the job id.
+        """
+        return self._queue(ObjectId(), user_id, list(paths), source)
+
+    def _queue(self, job_id, user_id, paths, source):
+        mongo.db.face_jobs.insert_one({
+            "_id": job_id,
+            "user_id": str(user_id),
+            "source": source,
+            "status": "queued",
+            "files": paths,
+            "attempts": 0,
+            "created_at": datetime.utcnow(),
+        })
+        self.start()
+        self._wake.set()
+        return str(job_id)
+
+    def get(self, job_id: str):
+        if not ObjectId.is_valid(job_id):
+            return None
+        return mongo.db.face_jobs.find_one({"_id": ObjectId(job_id)}, {"files": 0})
+
+    # --- worker side -----------------------------------------------------
+
+    def start(self):
+        """
+        Start this process's worker threads (again after a fork).
+        """
+        if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            self._pid = os.getpid()
+            self._wake = threading.Event()
+            self._threads = [
+                threading.Thread(target=self._loop, name=f"face-job-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for t in self._threads:
+                t.start()
+            self._wake.set()  # pick up anything queued while we were down
+
+    def _fail_abandoned(self):
+        # Stale jobs that have used up their attempts (the worker keeps dying on them)
+        now = datetime.utcnow()
+        query = {
+            "status": "running",
+            "started_at": {"$lt": now - timedelta(seconds=Config.FACE_JOB_STALE_SECONDS)},
+            "attempts": {"$gte": Config.FACE_JOB_MAX_ATTEMPTS},
+        }
+        for job in mongo.db.face_jobs.find(query, {"_id": 1, "attempts": 1}):
+            res = mongo.db.face_jobs.update_one({"_id": job["_id"], **query}, {"$set": {
+                "status": "failed",
+                "message": f"Worker stopped during each of {job['attempts']} attempts",
+                "finished_at": now,
+            }})
+            if res.modified_count:
+                print(f"Face job {job['_id']} abandoned after {job['attempts']} attempts")
+                shutil.rmtree(os.path.join(self.spool_dir, str(job["_id"])), ignore_errors=True)
+
+    def _claim(self):
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=Config.FACE_JOB_STALE_SECONDS)
+        return mongo.db.face_jobs.find_one_and_update(
+            {"$or": [
+                {"status": "queued"},
+                {"status": "running", "started_at": {"$lt": stale},
+                 "attempts": {"$lt": Config.FACE_JOB_MAX_ATTEMPTS}},
+            ]},
+            {"$set": {"status": "running", "started_at": now, "worker": os.getpid()}, "$inc": {"attempts": 1}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _claim_batch(self):
+        self._fail_abandoned()
+        jobs = []
+        while len(jobs) < Config.FACE_JOB_BATCH:
+            job = self._claim()
+            if job is None:
+                break
+            jobs.append(job)
+        return jobs
+
+    def _loop(self):
+        while True:
+            try:
+                jobs = self._claim_batch()
+            except Exception as e:
+                print("Face job claim failed:", e)
+                jobs = []
+            if not jobs:
+                self._wake.wait(Config.FACE_JOB_POLL_SECONDS)
+                self._wake.clear()
+                continue
+            # No client is waiting on a job: queue for an inference slot, never 503
+            with governor.background():
+                self._run(jobs)
+
+    def _run(self, jobs):
+        from face_processing.enrol import extract_faces, store_enrolment
+        from face_processing.recognition import FaceRecognizer
+        if self._recognizer is None:
+            self._recognizer = FaceRecognizer()
+
+        # One detector + embedding pass across every claimed job
+        images, owners = [], []
+        for n, job in enumerate(jobs):
+            for p in job.get("files", []):
+                img = read_file(p)
+                if img is not None:
+                    images.append(img)
+                    owners.append(n)
+        try:
+            crops, embeddings, reasons = extract_faces(images) if images else ([], [], [])
+        except Exception as e:
+            for job in jobs:
+                self._finish(job, error=e)
+            return
+
+        for n, job in enumerate(jobs):
+            mine = [i for i, o in enumerate(owners) if o == n]
+            try:
+                result = store_enrolment(
+                    job["user_id"],
+                    [crops[i] for i in mine], [embeddings[i] for i in mine], [reasons[i] for i in mine],
+                    self._recognizer,
+                )
+            except Exception as e:
+                self._finish(job, error=e)
+                continue
+            self._finish(job, result=result)
+
+    def _finish(self, job, result=None, error=None):
+        update = {"finished_at": datetime.utcnow()}
+        if error is not None:
+            print(f"Face job {job['_id']} failed:", error)
+            if job.get("attempts", 1) < Config.FACE_JOB_MAX_ATTEMPTS:
+                mongo.db.face_jobs.update_one(
+                    {"_id": job["_id"]}, {"$set": {"status": "queued", "error": str(error)}}
+                )
+                return
+            update.update(status="failed", message=str(error))
+        else:
+            update.update(result)
+            if result["count"]:
+                update.update(status="done", message=f"Stored {result['count']} face embeddings")
+            else:
+                update.update(status="failed", message="No valid faces detected in uploads")
+
+        mongo.db.face_jobs.update_one({"_id": job["_id"]}, {"$set": update})
+        # Only the job's own spool directory; path jobs reference files we don't own
+        shutil.rmtree(os.path.join(self.spool_dir, str(job["_id"])), ignore_errors=True)
+
+# One queue per worker process
+registration_jobs = RegistrationJobs()
+
+def main():
+    from flask import Flask
+    from utils.database import init_db
+
+    parser = argparse.ArgumentParser(description="Face registration job worker")
+    parser.add_argument("--workers", type=int, default=Config.FACE_JOB_WORKERS)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    init_db(app)
+    with app.app_context():
+        jobs = RegistrationJobs(workers=args.workers)
+        jobs.start()
+        print(f"Face job worker {os.getpid()} running {jobs.workers} threads")
+        while True:
+            time.sleep(60)
+
+if __name__ == "__main__":
+    main()
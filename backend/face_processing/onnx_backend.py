@@ -0,0 +1,151 @@
+# backend/face_processing/onnx_backend.py
+import cv2
+import numpy as np
+
+from config import Config
+from face_processing.detection import Face
+
+def _session(path: str):
+    import onnxruntime as ort  # optional dependency (pip install onnxruntime or onnxruntime-openvino)
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    opts.intra_op_num_threads = Config.FACE_ONNX_THREADS or Config.FACE_INTRA_OP_THREADS
+    opts.inter_op_num_threads = Config.FACE_INTER_OP_THREADS
+    providers = [p.strip() for p in Config.FACE_ONNX_PROVIDERS.split(",") if p.strip()]
+    return ort.InferenceSession(path, sess_options=opts, providers=providers)
+
+def model_path(path: str, int8: bool = Config.FACE_ONNX_INT8) -> str:
+    """
+    models/x.onnx -> models/x.int8.onnx when dynamic INT8 quantisation is on.
+    """
+    return path[:-len(".onnx")] + ".int8.onnx" if int8 and path.endswith(".onnx") else path
+
+class OnnxFaceDetector:
+    """
+    yolov8n-face exported to ONNX (see scripts/export_onnx.py), run through ONNX Runtime.
+    Same interface as FaceDetector.
+    """
+    MAX_SIDE = 1024
+    _shared = None
+
+    def __init__(self, model_path_: str = Config.FACE_ONNX_DETECTOR_PATH,
+                 conf: float = 0.25, iou: float = 0.7,
+                 int8: bool = Config.FACE_ONNX_INT8):
+        if OnnxFaceDetector._shared is None:
+            OnnxFaceDetector._shared = _session(model_path(model_path_, int8))
+        self.session = OnnxFaceDetector._shared
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        size = inp.shape[2] if isinstance(inp.shape[2], int) else 640
+        self.size = size
+        self.conf = conf
+        self.iou = iou
+
+    def _letterbox(self, image):
+        if len(image.shape) == 2 or image.shape[2] == 1:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        h, w = image.shape[:2]
+        r = self.size / max(h, w)
+        nh, nw = int(round(h * r)), int(round(w * r))
+        resized = cv2.resize(image, (nw, nh), interpolation=cv2.INTER_LINEAR)
+        top, left = (self.size - nh) // 2, (self.size - nw) // 2
+        canvas = np.full((self.size, self.size, 3), 114, dtype=np.uint8)
+        canvas[top:top+nh, left:left+nw] = resized
+        blob = canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+        return blob, r, left, top
+
+    def detect_faces(self, image):
+        if image is None:
+            return []
+        return self.detect_faces_batch([image])[0]
+
+    def detect_faces_batch(self, images):
+        out = [[] for _ in images]
+        blobs, meta, idx = [], [], []
+        for i, image in enumerate(images):
+            if image is None:
+                continue
+            blob, r, left, top = self._letterbox(image)
+            blobs.append(blob)
+            meta.append((r, left, top))
+            idx.append(i)
+        if not blobs:
+            return out
+
+        # (B, 4 + 1 + 3*K, anchors): cx, cy, w, h, face score, optional keypoints
+        preds = self.session.run(None, {self.input_name: np.stack(blobs)})[0]
+        for i, (r, left, top), pred in zip(idx, meta, preds):
+            scores = pred[4]
+            keep = scores >= self.conf
+            if not keep.any():
+                continue
+            cx, cy, bw, bh = pred[0][keep], pred[1][keep], pred[2][keep], pred[3][keep]
+            x1 = (cx - bw / 2 - left) / r
+            y1 = (cy - bh / 2 - top) / r
+            boxes = np.stack([x1, y1, bw / r, bh / r], axis=1)
+            kept = scores[keep]
+            # 5 keypoints as (x, y, visibility) rows after the score
+            kpts = pred[5:20, keep] if pred.shape[0] >= 20 else None
+            picked = cv2.dnn.NMSBoxes(boxes.tolist(), kept.tolist(), self.conf, self.iou)
+            for j in np.asarray(picked).reshape(-1):
+                x, y, w, h = boxes[j]
+                landmarks = None
+                if kpts is not None:
+                    landmarks = tuple(((kpts[3*k, j] - left) / r, (kpts[3*k + 1, j] - top) / r) for k in range(5))
+                    landmarks = tuple((float(px), float(py)) for px, py in landmarks)
+                out[i].append(Face(int(x), int(y), int(w), int(h), float(kept[j]), landmarks))
+        return out
+
+class OnnxFaceEmbedder:
+    """
+    ArcFace (or whichever Config.DEEPFACE_MODEL was exported) through ONNX Runtime.
+    Preprocessing mirrors DeepFace.represent(detector_backend="skip") so
+    embeddings stay comparable with the ones already stored.
+    """
+    _shared = None
+
+    def __init__(self, model_path_: str = Config.FACE_ONNX_EMBEDDER_PATH,
+                 int8: bool = Config.FACE_ONNX_INT8):
+        if OnnxFaceEmbedder._shared is None:
+            OnnxFaceEmbedder._shared = _session(model_path(model_path_, int8))
+        self.session = OnnxFaceEmbedder._shared
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        # Keras export: NHWC
+        self.height, self.width = inp.shape[1], inp.shape[2]
+
+    def _preprocess(self, img):
+        if len(img.shape) == 2:
+            img = np.stack([img, img, img], axis=-1)
+        elif img.shape[2] == 1:
+            img = np.repeat(img, 3, axis=2)
+        # Crops stay BGR, which is what the native batched path feeds the network.
+        # Same letterbox-with-zeros as deepface.modules.preprocessing.resize_image
+        th, tw = self.height, self.width
+        factor = min(th / img.shape[0], tw / img.shape[1])
+        img = cv2.resize(np.ascontiguousarray(img), (int(img.shape[1] * factor), int(img.shape[0] * factor)))
+        d0, d1 = th - img.shape[0], tw - img.shape[1]
+        img = np.pad(img, ((d0 // 2, d0 - d0 // 2), (d1 // 2, d1 - d1 // 2), (0, 0)), "constant")
+        if img.shape[:2] != (th, tw):
+            img = cv2.resize(img, (tw, th))
+        img = img.astype(np.float32)
+        if img.max() > 1:
+            img /= 255.0
+        return img
+
+    def generate_embedding(self, face_image):
+        return self.generate_embeddings([face_image])[0]
+
+    def generate_embeddings(self, face_images: list) -> list:
+        out = [None] * len(face_images)
+        idx = [i for i, f in enumerate(face_images) if f is not None and getattr(f, "size", 0)]
+        if not idx:
+            return out
+        try:
+            batch = np.stack([self._preprocess(face_images[i]) for i in idx])
+            embs = self.session.run(None, {self.input_name: batch})[0]
+            for i, emb in zip(idx, embs):
+                out[i] = np.asarray(emb, dtype=np.float32)
+        except Exception as e:
+            print("ONNX embedding failed:", e)
+        return out
@@ -0,0 +1,64 @@
+# backend/face_processing/quality.py
+import cv2
+import numpy as np
+
+from config import Config
+from face_processing.ingest import crop_region, scale_of
+
+# Reason codes returned to clients, with the hint shown to the user
+REASONS = {
+    "no_face": "No face detected",
+    "face_too_small": "Face is too small; move closer to the camera",
+    "low_confidence": "Face not clearly visible",
+    "blurry": "Image is blurry; hold the camera steady",
+    "too_dark": "Image is too dark",
+    "too_bright": "Image is overexposed",
+}
+
+def assess(image, face) -> tuple[list, float]:
+    """
+    Cheap checks on a detected face before it is worth an embedding pass.
+    face is a Face from the detector (sizes are judged in original pixels for
+    reduced-decode uploads). Returns (reason codes, score): no reasons
+    means usable; score ranks usable views of the same face (bigger, sharper,
+    more confident is better) and is 0.0 when there is no usable crop.
+    """
+    if face is None:
+        return ["no_face"], 0.0
+
+    reasons = []
+    size = min(face.w, face.h) * scale_of(image)
+    if size < Config.FACE_MIN_SIZE:
+        reasons.append("face_too_small")
+    if face.confidence < Config.FACE_MIN_CONFIDENCE:
+        reasons.append("low_confidence")
+
+    crop = crop_region(image, face)
+    if crop is None:
+        return ["no_face"], 0.0
+    gray = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    # Fixed size so the blur score does not depend on how big the face is in frame
+    gray = cv2.resize(gray, (112, 112), interpolation=cv2.INTER_AREA)
+
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    if sharpness < Config.FACE_MIN_SHARPNESS:
+        reasons.append("blurry")
+    brightness = float(np.mean(gray))
+    if brightness < Config.FACE_MIN_BRIGHTNESS:
+        reasons.append("too_dark")
+    elif brightness > Config.FACE_MAX_BRIGHTNESS:
+        reasons.append("too_bright")
+
+    score = face.confidence * size * min(sharpness / max(Config.FACE_MIN_SHARPNESS, 1.0), 3.0)
+    if not Config.FACE_QUALITY_GATE:
+        reasons = []
+    return reasons, score
+
+def check_face(image, face) -> list:
+    """
+    Reason codes from assess(); empty means the face is usable.
+    """
+    return assess(image, face)[0]
+
+def describe(reasons) -> str:
+    return "; ".join(REASONS.get(r, r) for r in reasons)
@@ -1,21 +1,66 @@
 # backend/face_processing/recognition.py
+import threading
+import time
 import numpy as np
-from deepface import DeepFace
 from bson import ObjectId
-from sklearn.metrics.pairwise import cosine_similarity
 
 from config import Config
 from utils.database import mongo
+from utils.cache import LRUCache
+from face_processing.gallery import FaceGallery, gallery, route_key, model_ok, current_change_seq, _pass_expiry_ts, PASS_FIELDS, MODEL_FIELDS
+from face_processing.embedding_codec import encode_embedding, decode_embedding
+from face_processing.templates import select_templates
+
+# Per-user templates for 1:1 verification: user_id -> (normalized matrix, route_key, expiry ts)
+templates = LRUCache(Config.FACE_TEMPLATE_CACHE_SIZE, ttl=Config.FACE_TEMPLATE_CACHE_TTL)
+gallery.subscribe(lambda user_id: templates.clear() if user_id is None else templates.pop(user_id))
+_template_sync = {"seq": None, "checked": 0.0}
+_template_sync_lock = threading.Lock()
+
+def sync_templates():
+    """
+    Evict templates of users changed by other processes. With the gallery
+    resident its change-log replay does this (listener above); otherwise read
+    the new gallery_changes entries here, at most every FACE_GALLERY_SYNC_SECONDS.
+    """
+    if gallery.loaded:
+        gallery.ensure_loaded()
+        return
+    if time.monotonic() - _template_sync["checked"] < Config.FACE_GALLERY_SYNC_SECONDS:
+        return
+    if not _template_sync_lock.acquire(blocking=False):
+        return  # another thread is already syncing
+    try:
+        _template_sync["checked"] = time.monotonic()
+        db = mongo.db
+        seq, latest = _template_sync["seq"], current_change_seq()
+        if seq is None:
+            templates.clear()  # anything cached before we knew our position may be stale
+        elif latest > seq:
+            oldest = db.gallery_changes.find_one({}, {"seq": 1}, sort=[("seq", 1)])
+            if oldest is None or oldest["seq"] > seq + 1:
+                templates.clear()  # log pruned past our position
+            else:
+                for c in db.gallery_changes.find({"seq": {"$gt": seq, "$lte": latest}}, {"user_id": 1}):
+                    templates.pop(c["user_id"])
+        _template_sync["seq"] = latest
+    except Exception as e:
+        print("Face template sync failed:", e)
+    finally:
+        _template_sync_lock.release()
 
 class FaceRecognizer:
     """
     Uses DeepFace (ArcFace by default) to generate embeddings and verify.
     Stores multiple embeddings per user (face_embeddings: [ [..], [..], ... ]).
+    DeepFace/TensorFlow is only imported when an embedding is generated, so
+    processes that just store and search embeddings stay light.
     """
     def __init__(self):
         self.model_name = Config.DEEPFACE_MODEL  # "ArcFace"
         self.threshold = Config.FACE_THRESHOLD   # 0.60 (cosine sim)
-        # DeepFace caches models internally; no manual preload needed
+        # DeepFace caches models internally; the batched path keeps its own handle
+        self._client = None
 
     def _ensure_rgb(self, img):
         if img is None:
@@ -32,6 +77,7 @@ class FaceRecognizer:
         returns: np.ndarray float32
         """
         try:
+            from deepface import DeepFace
             img = self._ensure_rgb(face_image)
             if img is None:
                 return None
@@ -53,65 +99,164 @@ class FaceRecognizer:
             print("Embedding generation failed:", e)
             return None
 
+    def generate_embeddings(self, face_images: list) -> list:
+        """
+        Batched generate_embedding: one forward pass over every crop.
+        Returns a list aligned with face_images (None where a crop was unusable).
+        Falls back to one DeepFace.represent call per crop if the batch path fails.
+        """
+        out = [None] * len(face_images)
+        idx = [i for i, f in enumerate(face_images) if f is not None and getattr(f, "size", 0)]
+        if not idx:
+            return out
+        try:
+            from deepface import DeepFace
+            from deepface.modules import preprocessing
+            if self._client is None:
+                self._client = DeepFace.build_model(self.model_name)
+            target_size = self._client.input_shape
+            batch = []
+            for i in idx:
+                # generate_embedding hands DeepFace RGB and DeepFace flips it back,
+                # so the network sees BGR; mirror that to keep embeddings comparable.
+                img = np.ascontiguousarray(self._ensure_rgb(face_images[i]))
+                img = preprocessing.resize_image(img=img, target_size=(target_size[1], target_size[0]))
+                batch.append(preprocessing.normalize_input(img=img, normalization="base")[0])
+            embs = np.asarray(self._client.model(np.stack(batch), training=False), dtype=np.float32)
+            for i, emb in zip(idx, embs):
+                out[i] = emb
+            return out
+        except Exception as e:
+            print("Batched embedding failed, falling back to per-image:", e)
+            for i in idx:
+                out[i] = self.generate_embedding(face_images[i])
+            return out
+
     def store_faces(self, user_id: str, embeddings: list[np.ndarray]) -> bool:
         """
-        Append multiple embeddings. Also set face_registered = True.
+        Add embeddings to a user's templates, keeping at most Config.FACE_MAX_TEMPLATES
+        of old + new (see templates.select_templates). Also set face_registered = True.
+        Embeddings are packed per Config.FACE_EMBEDDING_FORMAT (see embedding_codec).
         """
         try:
             db = mongo.db
-            payload = [emb.astype(np.float32).tolist() for emb in embeddings if emb is not None]
-            if not payload:
+            new = [np.asarray(e, dtype=np.float32).reshape(-1) for e in embeddings if e is not None]
+            if not new:
                 return False
-            res = db.users.update_one(
-                {"_id": ObjectId(user_id)},
-                {
-                    "$set": {"face_registered": True},
-                    "$push": {"face_embeddings": {"$each": payload}}
-                },
-                upsert=False
-            )
-            return res.modified_count == 1
+            for _ in range(3):
+                user = db.users.find_one({"_id": ObjectId(user_id)}, {"face_embeddings": 1, **MODEL_FIELDS})
+                if not user:
+                    return False
+                existing = user.get("face_embeddings")
+                # Stored values are kept as-is (no re-quantisation); other models' embeddings are dropped
+                stored = [(e, decode_embedding(e)) for e in (existing or []) if model_ok(user)]
+                stored = [(e, v) for e, v in stored if v is not None and v.shape == new[0].shape]
+                packed = [e for e, _ in stored] + [encode_embedding(e) for e in new]
+                vectors = [v for _, v in stored] + new
+                keep = select_templates(vectors, Config.FACE_MAX_TEMPLATES)
+
+                # Guard on what we read so concurrent registrations don't drop each other's faces
+                guard = {"face_embeddings": existing} if existing is not None else {"face_embeddings": {"$exists": False}}
+                res = db.users.update_one(
+                    {"_id": ObjectId(user_id), **guard},
+                    {"$set": {
+                        "face_registered": True,
+                        "face_embeddings": [packed[i] for i in keep],
+                        "face_model": Config.FACE_MODEL_TAG
+                    }}
+                )
+                if res.matched_count == 1:
+                    gallery.replace(user_id, [vectors[i] for i in keep])
+                    return True
+            print(f"Failed to store faces for {user_id}: embeddings kept changing underneath us")
+            return False
         except Exception as e:
             print("Failed to store faces:", e)
             return False
 
-    def verify_face(self, query_embedding: np.ndarray) -> str | None:
+    def match_face(self, query_embedding: np.ndarray, route: str | None = None,
+                   active_only: bool = False) -> tuple[str | None, float]:
         """
-        Returns best-matching user_id if cosine similarity >= threshold, else None.
+        Like verify_face but also returns the cosine similarity of the best row.
+        user_id is None when nothing clears the threshold.
         """
         try:
-            db = mongo.db
-            users = db.users.find(
-                {"face_embeddings": {"$exists": True, "$ne": []}},
-                {"face_embeddings": 1}
-            )
-
-            q = query_embedding.reshape(1, -1)
-            best_user = None
-            best_sim = -1.0
-
-            for u in users:
-                emb_list = u.get("face_embeddings", [])
-                if not emb_list:
-                    continue
+            gallery.ensure_loaded()
+            best_user, best_sim = gallery.search(query_embedding, route=route, active_only=active_only)
+            if best_user is not None and best_sim >= self.threshold:
+                return best_user, best_sim
+            return None, best_sim
+        except Exception as e:
+            print("Face verify failed:", e)
+            return None, -1.0
 
-                # max similarity among that user's stored embeddings
-                sims = []
-                for e in emb_list:
-                    e_arr = np.asarray(e, dtype=np.float32).reshape(1, -1)
-                    sim = float(cosine_similarity(q, e_arr)[0][0])
-                    sims.append(sim)
-                if not sims:
-                    continue
+    def _templates_for(self, user_id: str):
+        entry = templates.get(user_id)
+        if entry is None:
+            user = mongo.db.users.find_one({"_id": ObjectId(user_id)}, {"face_embeddings": 1, **PASS_FIELDS, **MODEL_FIELDS})
+            if not user:
+                return None
+            vecs = [decode_embedding(e) for e in user.get("face_embeddings", [])] if model_ok(user) else []
+            vecs = [v for v in vecs if v is not None and v.size]
+            vecs = [v for v in vecs if v.shape == vecs[0].shape]
+            matrix = FaceGallery._normalize(np.stack(vecs)) if vecs else np.empty((0, 0), dtype=np.float32)
+            entry = (matrix, route_key(user.get("From"), user.get("To")), _pass_expiry_ts(user))
+            templates.put(user_id, entry)
+        return entry
 
-                max_user_sim = max(sims)
-                if max_user_sim > best_sim:
-                    best_sim = max_user_sim
-                    best_user = str(u["_id"])
+    def verify_claim(self, query_embedding: np.ndarray, user_id: str, route: str | None = None,
+                     active_only: bool = False) -> tuple[bool, float]:
+        """
+        1:1 check of a face against the user it claims to be (QR, pass code, user id).
+        Only that user's embeddings are compared, from a small LRU cache, so the cost
+        does not depend on gallery size. route/active_only behave like verify_face:
+        a user outside the scope never matches. Returns (matched, similarity).
+        """
+        try:
+            sync_templates()
+            entry = self._templates_for(str(user_id))
+            if entry is None:
+                return False, -1.0
+            matrix, user_route, expiry = entry
+            if route is not None and user_route != route:
+                return False, -1.0
+            if active_only and expiry <= time.time():
+                return False, -1.0
+            q = FaceGallery._normalize(query_embedding)[0]
+            if not len(matrix) or matrix.shape[1] != q.shape[0]:
+                return False, -1.0
+            sim = float(np.max(matrix @ q))
+            return sim >= self.threshold, sim
+        except Exception as e:
+            print("Face claim verify failed:", e)
+            return False, -1.0
 
-            if best_sim >= self.threshold:
-                return best_user
-            return None
+    def match_faces(self, query_embeddings: list, route: str | None = None,
+                    active_only: bool = False) -> list[tuple[str | None, float]]:
+        """
+        match_face for every face in one frame, searched as a single batch.
+        A user can only be one of the faces: if several faces pick the same
+        user, only the most similar keeps the match.
+        """
+        try:
+            gallery.ensure_loaded()
+            results = gallery.search_many(query_embeddings, route=route, active_only=active_only)
         except Exception as e:
             print("Face verify failed:", e)
-            return None
+            return [(None, -1.0)] * len(query_embeddings)
+        best = {}
+        for i, (user_id, sim) in enumerate(results):
+            if user_id is not None and sim >= self.threshold:
+                if user_id not in best or sim > results[best[user_id]][1]:
+                    best[user_id] = i
+        winners = set(best.values())
+        return [(uid if i in winners else None, sim) for i, (uid, sim) in enumerate(results)]
+
+    def verify_face(self, query_embedding: np.ndarray, route: str | None = None,
+                    active_only: bool = False) -> str | None:
+        """
+        Returns best-matching user_id if cosine similarity >= threshold, else None.
+        Searches the resident in-memory gallery (loaded from Mongo on first use),
+        optionally scoped to one route_key() and/or to active pass holders.
+        """
+        return self.match_face(query_embedding, route=route, active_only=active_only)[0]
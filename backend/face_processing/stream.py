@@ -0,0 +1,126 @@
+# backend/face_processing/stream.py
+import threading
+import time
+import uuid
+
+from config import Config
+from face_processing.inference import get_engine
+from face_processing.quality import assess
+from face_processing.ingest import original_box
+from face_processing.enrol import crop_face
+from face_processing.tracker import FaceTracker
+
+class StreamSession:
+    """
+    Verification state for one camera pushing frames.
+    Detection runs every FACE_STREAM_DETECT_EVERY frames, faces are tracked
+    across detections, and each track is embedded once (again only if a
+    clearly better view turns up) until it matches someone.
+    """
+    def __init__(self, route=None, active_only=False, bus_id=None):
+        self.id = uuid.uuid4().hex
+        self.route = route
+        self.active_only = active_only
+        self.bus_id = bus_id
+        self.tracker = FaceTracker(Config.FACE_STREAM_IOU, Config.FACE_STREAM_MAX_MISSES)
+        self.frame = 0
+        self.last_used = time.time()
+        self._lock = threading.Lock()
+
+    def next_frame(self) -> tuple[int, bool]:
+        """
+        Count a new frame. Returns (frame number, whether to run detection on it);
+        skipped frames need not even be decoded.
+        """
+        with self._lock:
+            self.frame += 1
+            self.last_used = time.time()
+            return self.frame, (self.frame - 1) % max(Config.FACE_STREAM_DETECT_EVERY, 1) == 0
+
+    def process(self, image, frame: int, recognizer) -> list:
+        """
+        Detect, track and (where worthwhile) embed + match the faces in one frame.
+        Returns the tracks visible in this frame.
+        """
+        faces = get_engine().detect([image])[0]
+        with self._lock:
+            tracks = self.tracker.update(faces, frame)
+            todo, crops = [], []
+            for t in tracks:
+                if t.user_id is not None:
+                    continue
+                t.reasons, score = assess(image, t.face)
+                if t.reasons:
+                    continue
+                t.best_score = max(t.best_score, score)
+                better = score > t.embedded_score * (1 + Config.FACE_STREAM_REEMBED_GAIN)
+                if t.embeds == 0 or (t.embeds < Config.FACE_STREAM_MAX_EMBEDS and better):
+                    todo.append((t, score))
+                    crops.append(crop_face(image, t.face))
+                    t.embeds += 1  # claimed, so a concurrent frame does not embed it too
+        if crops:
+            for (t, score), emb in zip(todo, get_engine().embed(crops)):
+                if emb is None:
+                    continue
+                user_id, sim = recognizer.match_face(emb, route=self.route, active_only=self.active_only)
+                with self._lock:
+                    t.embedded_score = score
+                    t.similarity = sim
+                    t.user_id = user_id
+        return tracks
+
+    def state(self, tracks, image=None) -> list:
+        """
+        Client view of the tracks; boxes are in the uploaded frame's pixels.
+        """
+        out = []
+        for t in tracks:
+            if t.user_id is not None:
+                status = "matched"
+            elif t.reasons:
+                status = "rejected"
+            elif t.embeds >= Config.FACE_STREAM_MAX_EMBEDS and t.similarity is not None:
+                status = "unknown"
+            else:
+                status = "pending"
+            out.append({
+                "track_id": t.id,
+                "box": original_box(image, t.face),
+                "status": status,
+                "user_id": t.user_id,
+                "similarity": t.similarity,
+                "reasons": t.reasons,
+            })
+        return out
+
+class StreamSessions:
+    """
+    In-process registry of open stream sessions. Sessions live in the worker
+    that created them, so run streams with sticky routing (or one worker).
+    """
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _prune(self):
+        cutoff = time.time() - Config.FACE_STREAM_IDLE_SECONDS
+        for sid in [sid for sid, s in self._sessions.items() if s.last_used < cutoff]:
+            del self._sessions[sid]
+
+    def create(self, **kwargs) -> StreamSession:
+        session = StreamSession(**kwargs)
+        with self._lock:
+            self._prune()
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id: str):
+        with self._lock:
+            self._prune()
+            return self._sessions.get(session_id)
+
+    def close(self, session_id: str):
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+sessions = StreamSessions()
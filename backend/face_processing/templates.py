@@ -0,0 +1,41 @@
+# backend/face_processing/templates.py
+import numpy as np
+
+def _unit(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def select_templates(embeddings: list, k: int, iters: int = 10) -> list[int]:
+    """
+    Indices of at most k embeddings that best cover a user's face (k-medoids
+    on cosine similarity, seeded from the medoid then greedy farthest points).
+    Keeps every embedding when there are k or fewer.
+    """
+    n = len(embeddings)
+    if n <= k:
+        return list(range(n))
+    X = _unit(np.stack([np.asarray(e, dtype=np.float32).reshape(-1) for e in embeddings]))
+    sims = X @ X.T
+
+    medoids = [int(np.argmax(sims.sum(axis=1)))]
+    while len(medoids) < k:
+        nearest = sims[:, medoids].max(axis=1)
+        nearest[medoids] = np.inf
+        medoids.append(int(np.argmin(nearest)))
+
+    for _ in range(iters):
+        labels = np.argmax(sims[:, medoids], axis=1)
+        updated = []
+        for c in range(k):
+            members = np.flatnonzero(labels == c)
+            if not len(members):
+                updated.append(medoids[c])
+                continue
+            # The member closest to the rest of its cluster
+            updated.append(int(members[np.argmax(sims[np.ix_(members, members)].sum(axis=1))]))
+        if updated == medoids:
+            break
+        medoids = updated
+    return sorted(set(medoids))
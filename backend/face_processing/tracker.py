@@ -0,0 +1,98 @@
+# backend/face_processing/tracker.py
+import itertools
+
+def iou(a, b) -> float:
+    """
+    Intersection-over-union of two (x, y, w, h) boxes.
+    """
+    ax2, ay2 = a[0] + a[2], a[1] + a[3]
+    bx2, by2 = b[0] + b[2], b[1] + b[3]
+    iw = min(ax2, bx2) - max(a[0], b[0])
+    ih = min(ay2, by2) - max(a[1], b[1])
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    return inter / float(a[2] * a[3] + b[2] * b[3] - inter)
+
+class Track:
+    """
+    One face followed across frames. The recognition state lives here so a
+    face is embedded once, not once per frame.
+    """
+    def __init__(self, track_id: int, face, frame: int):
+        self.id = track_id
+        self.face = face
+        self.velocity = (0.0, 0.0)  # box centre motion per frame
+        self.last_frame = frame
+        self.misses = 0
+        # Recognition state, filled in by the stream session
+        self.best_score = 0.0       # best quality score seen on this track
+        self.embedded_score = 0.0   # quality of the view last embedded
+        self.embeds = 0
+        self.reasons = []
+        self.user_id = None
+        self.similarity = None
+
+    def predict(self, frame: int):
+        """
+        Box moved along its last velocity to where it should be at frame.
+        """
+        dt = frame - self.last_frame
+        x, y, w, h = self.face[:4]
+        return (x + self.velocity[0] * dt, y + self.velocity[1] * dt, w, h)
+
+    def update(self, face, frame: int):
+        dt = max(frame - self.last_frame, 1)
+        self.velocity = (
+            (face.x + face.w / 2 - self.face.x - self.face.w / 2) / dt,
+            (face.y + face.h / 2 - self.face.y - self.face.h / 2) / dt,
+        )
+        self.face = face
+        self.last_frame = frame
+        self.misses = 0
+
+class FaceTracker:
+    """
+    Greedy IoU tracker with constant-velocity box prediction. Detections are
+    matched to the predicted positions of live tracks; unmatched detections
+    start new tracks and tracks unseen for max_misses detection rounds are dropped.
+    """
+    def __init__(self, iou_threshold: float = 0.3, max_misses: int = 3):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def update(self, faces, frame: int) -> list:
+        """
+        Feed one frame's detections. Returns the tracks seen in this frame.
+        """
+        pairs = []
+        for ti, track in enumerate(self.tracks):
+            predicted = track.predict(frame)
+            for fi, face in enumerate(faces):
+                overlap = iou(predicted, face[:4])
+                if overlap >= self.iou_threshold:
+                    pairs.append((overlap, ti, fi))
+        pairs.sort(reverse=True)
+
+        used_tracks, used_faces, seen = set(), set(), []
+        for _, ti, fi in pairs:
+            if ti in used_tracks or fi in used_faces:
+                continue
+            used_tracks.add(ti)
+            used_faces.add(fi)
+            self.tracks[ti].update(faces[fi], frame)
+            seen.append(self.tracks[ti])
+
+        for ti, track in enumerate(self.tracks):
+            if ti not in used_tracks:
+                track.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        for fi, face in enumerate(faces):
+            if fi not in used_faces:
+                track = Track(next(self._ids), face, frame)
+                self.tracks.append(track)
+                seen.append(track)
+        return seen
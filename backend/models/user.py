@@ -10,6 +10,6 @@
   user_type: "student"|"employee"|"senior",
   created_at: datetime,
   face_registered: bool,
-  face_embeddings: [ [float, ...], ... ]  # latest first
+  face_embeddings: [ Binary, ... ]  # packed float16/int8, see face_processing/embedding_codec.py
 }
 """
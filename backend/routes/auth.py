@@ -5,6 +5,7 @@ from pymongo.errors import DuplicateKeyError
 import os
 from utils.database import mongo
 from utils.auth_utils import make_token, token_required
+from utils.sessions import create_session
 import datetime
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash
@@ -186,21 +187,14 @@ def login():
             "declined": True
         }), 401
 
-    # Generate token and store it in user document
-    import uuid
-    from datetime import datetime, timedelta
+    # Generate token and store it as a session (one per device)
+    from datetime import datetime
     
-    token = str(uuid.uuid4())
-    token_expiry = datetime.utcnow() + timedelta(hours=24)
+    token, token_expiry = create_session(user, "user")
     
-    # Update user with token
     db.users.update_one(
         {"_id": user["_id"]},
-        {"$set": {
-            "token": token,
-            "tokenExpiry": token_expiry,
-            "lastLogin": datetime.utcnow()
-        }}
+        {"$set": {"lastLogin": datetime.utcnow()}}
     )
 
     # Return all necessary user data for the frontend
@@ -243,21 +237,14 @@ def login_face():
     if not user:
         return jsonify({"message": "User not found"}), 404
 
-    # FIXED: Generate token and store it in user document (like email login)
-    import uuid
-    from datetime import datetime, timedelta
+    # FIXED: Generate token and store it as a session (like email login)
+    from datetime import datetime
     
-    token = str(uuid.uuid4())
-    token_expiry = datetime.utcnow() + timedelta(hours=24)
+    token, token_expiry = create_session(user, "user")
     
-    # Store token in user document (this is what your token_required expects)
     db.users.update_one(
         {"_id": user["_id"]},
-        {"$set": {
-            "token": token,
-            "tokenExpiry": token_expiry,
-            "lastLogin": datetime.utcnow()
-        }}
+        {"$set": {"lastLogin": datetime.utcnow()}}
     )
 
     return jsonify({
@@ -290,8 +277,8 @@ def get_user_profile(current_user, user_id):
                 "message": "Access denied"
             }), 403
 
-        # Fetch user from database
-        user = mongo.db.users.find_one({"_id": ObjectId(user_id)})
+        # Fetch user from database (packed face embeddings aren't JSON-serialisable)
+        user = mongo.db.users.find_one({"_id": ObjectId(user_id)}, {"face_embeddings": 0})
         if not user:
             return jsonify({
                 "success": False,
@@ -0,0 +1,60 @@
+# backend/routes/edge.py
+from flask import Blueprint, request, jsonify
+
+from utils.auth_utils import conductor_required
+from routes.face_auth import bus_route
+from face_processing.edge import build_bundle, build_delta, signing_ready
+
+edge_bp = Blueprint("edge", __name__)
+
+@edge_bp.before_request
+def require_signing_secret():
+    # A bundle signed with a missing or well-known key would let anyone forge a gallery
+    if not signing_ready():
+        return jsonify({"message": "Offline galleries are not configured on this server"}), 503
+
+def _route_arg():
+    bus_id = request.args.get("busId")
+    if not bus_id:
+        return None, (jsonify({"message": "busId is required"}), 400)
+    route = bus_route(bus_id)
+    if route is None:
+        return None, (jsonify({"message": "Unknown bus or bus has no route"}), 404)
+    return route, None
+
+@edge_bp.route("/gallery", methods=["GET"])
+@conductor_required
+def edge_gallery(conductor):
+    """
+    Full offline gallery for one bus's route.
+    Query: busId
+    Returns the signed bundle { format, kind: "full", route, version, model,
+    threshold, quantization, generated_at, entries: [{user_id, name, pass_code,
+    pass_expiry, embeddings: [base64]}], signature }.
+    """
+    route, error = _route_arg()
+    if error:
+        return error
+    return jsonify(build_bundle(route))
+
+@edge_bp.route("/gallery/delta", methods=["GET"])
+@conductor_required
+def edge_gallery_delta(conductor):
+    """
+    Changes since a device's bundle version.
+    Query: busId, since (the version the device holds)
+    Returns the signed delta { kind: "delta", since, version, upserts: [entry], revoked: [user_id], ... };
+    410 when the device must download the full bundle again.
+    """
+    route, error = _route_arg()
+    if error:
+        return error
+    try:
+        since = int(request.args.get("since", ""))
+    except ValueError:
+        return jsonify({"message": "since must be a bundle version"}), 400
+
+    delta = build_delta(route, since)
+    if delta is None:
+        return jsonify({"message": "Version too old; download the full gallery", "full_sync": True}), 410
+    return jsonify(delta)
@@ -1,38 +1,141 @@
 # backend/routes/face_auth.py
 from flask import Blueprint, request, jsonify
 from bson import ObjectId
-import os
-import cv2
-import numpy as np
+import time
 
 from utils.database import mongo
-from face_processing.detection import FaceDetector
-from face_processing.recognition import FaceRecognizer
+from face_processing.recognition import FaceRecognizer, templates
+from face_processing.inference import get_engine, detection_cache, embedding_cache
+from face_processing.gallery import route_key, _pass_expiry_ts, PASS_FIELDS
+from face_processing.batcher import InferenceBatcher
+from face_processing.quality import check_face, describe
+from face_processing.stream import sessions
+from face_processing.enrol import gated_crops, crop_face, enrol_images
+from face_processing.jobs import registration_jobs
+from face_processing.governor import governor
+from face_processing.ingest import decode_image, original_box
 from config import Config
 
 face_auth_bp = Blueprint("face_auth", __name__)
 
-# Models (loaded once)
-detector = FaceDetector()
+# Storage/search only; the models live behind get_engine() and load on first use
 recognizer = FaceRecognizer()
 
-FACE_DIR = os.path.join(os.getcwd(), "registered_faces")
-os.makedirs(FACE_DIR, exist_ok=True)
 
-def _read_image(file_storage):
+def read_image(file_storage):
+    """
+    Decode an upload at reduced resolution (see face_processing.ingest).
+    """
     try:
-        data = np.frombuffer(file_storage.read(), np.uint8)
-        img = cv2.imdecode(data, cv2.IMREAD_COLOR)
-        return img
+        return decode_image(file_storage.read())
     except Exception:
         return None
 
-def _largest_face_crop(image):
-    faces = detector.detect_faces(image)
-    if not faces:
+def bus_route(bus_id):
+    """
+    route_key() for a bus, looked up by ObjectId or busNumber. None if unknown.
+    """
+    if not bus_id:
+        return None
+    db = mongo.db
+    bus = None
+    if ObjectId.is_valid(bus_id):
+        bus = db.buses.find_one({"_id": ObjectId(bus_id)}, {"from": 1, "to": 1})
+    if not bus:
+        bus = db.buses.find_one({"busNumber": bus_id}, {"from": 1, "to": 1})
+    if not bus:
         return None
-    x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
-    return image[y:y+h, x:x+w]
+    return route_key(bus.get("from"), bus.get("to"))
+
+def _embed_largest_batch(images):
+    """
+    One detector pass + one embedding pass over a batch of decoded images.
+    Returns (embedding or None, quality reasons) per image; rejected faces
+    never reach the embedding model.
+    """
+    crops, reasons = gated_crops(images)
+    if any(c is not None for c in crops):
+        embs = get_engine().embed(crops)
+    else:
+        embs = [None] * len(crops)
+    return list(zip(embs, reasons))
+
+# Concurrent verifications in this process share forward passes
+embed_batcher = InferenceBatcher(_embed_largest_batch, name="face-verify")
+
+def embed_largest_face(image):
+    if Config.FACE_BATCHING:
+        return embed_batcher(image)
+    return _embed_largest_batch([image])[0]
+
+def claimed_user(form):
+    """
+    The identity a passenger claims (QR scan / pass code / user id), as a user_id.
+    Returns None when no hint was sent and "" when the hint matches nobody.
+    """
+    user_id = form.get("userId") or form.get("user_id")
+    if user_id:
+        return user_id if ObjectId.is_valid(user_id) else ""
+    pass_code = form.get("pass_code") or form.get("passCode")
+    if pass_code:
+        user = mongo.db.users.find_one({"pass_code": pass_code.strip().upper()}, {"_id": 1})
+        return str(user["_id"]) if user else ""
+    return None
+
+def verify_claimed_face(image, user_id, route=None, active_only=False):
+    """
+    1:1: does the largest face in the image belong to user_id?
+    Returns (matched, similarity or None, quality reasons).
+    """
+    emb, reasons = embed_largest_face(image)
+    if emb is None:
+        return False, None, reasons
+    matched, sim = recognizer.verify_claim(emb, user_id, route=route, active_only=active_only)
+    return matched, sim, []
+
+def identify_face(image, route=None, active_only=False, claim=None):
+    """
+    Detect the largest face in a decoded image and find who it is.
+    With a claim (user_id) only that user is checked (1:1); otherwise the gallery is searched.
+    Returns (user_id or None, quality reasons); reasons is non-empty when
+    the frame was rejected before embedding.
+    """
+    if claim:
+        matched, _, reasons = verify_claimed_face(image, claim, route=route, active_only=active_only)
+        return (claim if matched else None), reasons
+    emb, reasons = embed_largest_face(image)
+    if emb is None:
+        return None, reasons
+    return recognizer.verify_face(emb, route=route, active_only=active_only), []
+
+def identify_faces(image, route=None, active_only=False):
+    """
+    Every face in a decoded image: one detector pass, quality gate per face,
+    one embedding pass over the usable crops and one batched gallery search.
+    Returns a list of {box, user_id, similarity, reasons} in detection order.
+    """
+    engine = get_engine()
+    faces = engine.detect([image])[0]
+    results, crops, usable = [], [], []
+    for face in faces:
+        why = check_face(image, face)
+        crop = None if why else crop_face(image, face)
+        if crop is None and not why:
+            why = ["no_face"]
+        results.append({"box": original_box(image, face), "user_id": None, "similarity": None, "reasons": why})
+        if crop is not None:
+            crops.append(crop)
+            usable.append(results[-1])
+    if not crops:
+        return results
+
+    pairs = [(r, emb) for r, emb in zip(usable, engine.embed(crops)) if emb is not None]
+    if pairs:
+        matches = recognizer.match_faces([emb for _, emb in pairs], route=route, active_only=active_only)
+        for (r, _), (user_id, sim) in zip(pairs, matches):
+            r["user_id"] = user_id
+            r["similarity"] = sim
+    return results
 
 @face_auth_bp.route("/register", methods=["POST"])
 def register_face():
@@ -42,13 +145,15 @@ def register_face():
         - user_id: str
         - images: multiple files (images[]) OR single 'image' file
     Stores up to 5 embeddings for best robustness.
+    With FACE_REGISTRATION_ASYNC (default) the images are spooled and a job is
+    queued: returns 202 { job_id, status_url }; poll GET /register/jobs/<job_id>.
     """
     db = mongo.db
     user_id = request.form.get("user_id")
     if not user_id:
         return jsonify({"message": "user_id is required"}), 400
 
-    user = db.users.find_one({"_id": ObjectId(user_id)})
+    user = db.users.find_one({"_id": ObjectId(user_id)}, {"_id": 1})
     if not user:
         return jsonify({"message": "User not found"}), 404
 
@@ -61,49 +166,67 @@ def register_face():
     if not files:
         return jsonify({"message": "At least one image is required (images[] or image)"}), 400
 
-    embeddings = []
-    saved_any = False
+    if Config.FACE_REGISTRATION_ASYNC:
+        job_id = registration_jobs.submit(user_id, files[:5])  # limit to 5
+        return jsonify({
+            "message": "Face registration queued",
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/api/face_auth/register/jobs/{job_id}"
+        }), 202
 
-    for f in files[:5]:  # limit to 5
-        img = _read_image(f)
-        if img is None:
-            continue
-        crop = _largest_face_crop(img)
-        if crop is None:
-            continue
-
-        emb = recognizer.generate_embedding(crop)
-        if emb is None:
-            continue
-
-        embeddings.append(emb)
-        # Save last crop preview
-        fname = os.path.join(FACE_DIR, f"{user_id}.jpg")
-        cv2.imwrite(fname, crop)
-        saved_any = True
-        last_path = fname
-
-    if not embeddings:
-        return jsonify({"message": "No valid faces detected in uploads"}), 400
+    # Decode everything, then one detector pass and one embedding pass for the batch
+    images = [img for img in (read_image(f) for f in files[:5]) if img is not None]  # limit to 5
+    try:
+        result = enrol_images(user_id, images, recognizer)
+    except RuntimeError as e:
+        return jsonify({"message": str(e)}), 500
 
-    ok = recognizer.store_faces(user_id, embeddings)
-    if not ok:
-        return jsonify({"message": "Failed to store embeddings"}), 500
+    if not result["count"]:
+        rejected = result["reasons"]
+        return jsonify({
+            "message": "No valid faces detected in uploads" + (f": {describe(rejected)}" if rejected else ""),
+            "reasons": rejected
+        }), 400
 
-    db.users.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$set": {"face_registered": True, "face_path": last_path if saved_any else user.get("face_path")}}
-    )
+    return jsonify({
+        "message": f"Stored {result['count']} face embeddings",
+        "count": result["count"],
+        "rejected": result["rejected"],
+        "reasons": result["reasons"]
+    }), 200
 
-    return jsonify({"message": f"Stored {len(embeddings)} face embeddings", "count": len(embeddings)}), 200
+@face_auth_bp.route("/register/jobs/<job_id>", methods=["GET"])
+def register_job_status(job_id):
+    """
+    Returns { job_id, user_id, status (queued|running|done|failed), message?, count?, reasons? }
+    """
+    job = registration_jobs.get(job_id)
+    if not job:
+        return jsonify({"message": "Job not found"}), 404
+    return jsonify({
+        "job_id": str(job["_id"]),
+        "user_id": job["user_id"],
+        "status": job["status"],
+        "message": job.get("message"),
+        "count": job.get("count"),
+        "rejected": job.get("rejected"),
+        "reasons": job.get("reasons", []),
+        "created_at": job.get("created_at"),
+        "finished_at": job.get("finished_at")
+    })
 
 @face_auth_bp.route("/verify", methods=["POST"])
 def verify_face():
     """
     Accepts multipart/form-data:
       - image: file  (or images[] -> we’ll just use first valid)
+      - busId: optional; restricts the search to valid pass holders on that bus's route
+      - userId / user_id / pass_code: optional identity hint; switches to a 1:1
+        check against that user only (mode "1:1" in the response, with similarity)
     Returns:
-      - { success, user_id?, message }
+      - { success, user_id?, message, reasons? }
+      - 422 with quality reasons when no image had a usable face
     """
     db = mongo.db
     files = request.files.getlist("images")
@@ -115,18 +238,26 @@ def verify_face():
     if not files:
         return jsonify({"error": "No image provided"}), 400
 
+    bus_id = request.form.get("busId")
+    route = bus_route(bus_id)
+    if bus_id and route is None:
+        return jsonify({"success": False, "message": "Unknown bus or bus has no route"}), 404
+
+    claim = claimed_user(request.form)
+    if claim is not None:
+        return _verify_claim(files, claim, route, bool(bus_id))
+
+    reasons = []
+    searched = False
     for f in files:
-        img = _read_image(f)
+        img = read_image(f)
         if img is None:
             continue
-        crop = _largest_face_crop(img)
-        if crop is None:
+        user_id, why = identify_face(img, route=route, active_only=bool(bus_id))
+        if why:
+            reasons.extend(r for r in why if r not in reasons)
             continue
-        emb = recognizer.generate_embedding(crop)
-        if emb is None:
-            continue
-
-        user_id = recognizer.verify_face(emb)
+        searched = True
         if user_id:
             user = db.users.find_one({"_id": ObjectId(user_id)})
             return jsonify({
@@ -137,4 +268,165 @@ def verify_face():
                 "user_type": user["user_type"] if user else None
             })
 
+    if reasons and not searched:
+        return jsonify({"success": False, "message": describe(reasons), "reasons": reasons}), 422
     return jsonify({"success": False, "message": "No matching face found"}), 404
+
+def _verify_claim(files, user_id, route, active_only):
+    if not user_id:
+        return jsonify({"success": False, "mode": "1:1", "message": "Claimed user not found"}), 404
+
+    reasons = []
+    best = None
+    for f in files:
+        img = read_image(f)
+        if img is None:
+            continue
+        matched, sim, why = verify_claimed_face(img, user_id, route=route, active_only=active_only)
+        if why:
+            reasons.extend(r for r in why if r not in reasons)
+            continue
+        best = sim if best is None else max(best, sim)
+        if matched:
+            user = mongo.db.users.find_one(
+                {"_id": ObjectId(user_id)},
+                {"name": 1, "email": 1, "user_type": 1, "pass_code": 1, **PASS_FIELDS}
+            ) or {}
+            return jsonify({
+                "success": True,
+                "mode": "1:1",
+                "user_id": user_id,
+                "similarity": sim,
+                "threshold": Config.FACE_THRESHOLD,
+                "valid": _pass_expiry_ts(user) > time.time(),
+                "message": "Face verified",
+                "name": user.get("name"),
+                "user_type": user.get("user_type"),
+                "user": {"name": user.get("name", ""), "email": user.get("email", ""), "passId": user.get("pass_code", "")}
+            })
+
+    if reasons and best is None:
+        return jsonify({"success": False, "mode": "1:1", "message": describe(reasons), "reasons": reasons}), 422
+    return jsonify({
+        "success": False,
+        "mode": "1:1",
+        "similarity": best,
+        "threshold": Config.FACE_THRESHOLD,
+        "message": "Face does not match the claimed user"
+    }), 404
+
+@face_auth_bp.route("/verify/multi", methods=["POST"])
+def verify_faces():
+    """
+    Verify everyone in one frame (e.g. a queue at the boarding door).
+    Accepts multipart/form-data:
+      - image: file
+      - busId: optional; restricts the search to valid pass holders on that bus's route
+    Returns:
+      - { success, faces: [{box, user_id, similarity, reasons, name?, user_type?}], matched }
+    """
+    f = request.files.get("image")
+    if not f:
+        return jsonify({"error": "No image provided"}), 400
+    img = read_image(f)
+    if img is None:
+        return jsonify({"success": False, "message": "Could not decode image"}), 400
+
+    bus_id = request.form.get("busId")
+    route = bus_route(bus_id)
+    if bus_id and route is None:
+        return jsonify({"success": False, "message": "Unknown bus or bus has no route"}), 404
+
+    faces = identify_faces(img, route=route, active_only=bool(bus_id))
+    matched = [r for r in faces if r["user_id"]]
+    if matched:
+        users = {
+            str(u["_id"]): u
+            for u in mongo.db.users.find(
+                {"_id": {"$in": [ObjectId(r["user_id"]) for r in matched]}},
+                {"name": 1, "user_type": 1}
+            )
+        }
+        for r in matched:
+            user = users.get(r["user_id"], {})
+            r["name"] = user.get("name")
+            r["user_type"] = user.get("user_type")
+    return jsonify({"success": bool(matched), "faces": faces, "matched": len(matched)})
+
+@face_auth_bp.route("/stream/start", methods=["POST"])
+def stream_start():
+    """
+    Opens a streaming verification session for a conductor camera.
+    Accepts form or JSON:
+      - busId: optional; restricts matches to valid pass holders on that bus's route
+    Returns:
+      - { session_id, detect_every }
+    The client then POSTs frames to /stream/<session_id>/frame.
+    """
+    data = request.get_json(silent=True) or request.form
+    bus_id = data.get("busId")
+    route = bus_route(bus_id)
+    if bus_id and route is None:
+        return jsonify({"success": False, "message": "Unknown bus or bus has no route"}), 404
+
+    session = sessions.create(route=route, active_only=bool(bus_id), bus_id=bus_id)
+    return jsonify({"session_id": session.id, "detect_every": Config.FACE_STREAM_DETECT_EVERY}), 201
+
+@face_auth_bp.route("/stream/<session_id>/frame", methods=["POST"])
+def stream_frame(session_id):
+    """
+    Accepts multipart/form-data:
+      - image: one camera frame
+    Returns:
+      - { frame, detected, tracks: [{track_id, box, status, user_id, similarity, reasons}], matches }
+    status is pending, matched, rejected (quality) or unknown (no match after
+    FACE_STREAM_MAX_EMBEDS views). Frames between detections are not decoded.
+    """
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({"success": False, "message": "Unknown or expired stream session"}), 404
+
+    frame, due = session.next_frame()
+    if not due:
+        return jsonify({"frame": frame, "detected": False, "tracks": [], "matches": []})
+
+    f = request.files.get("image")
+    img = read_image(f) if f else None
+    if img is None:
+        return jsonify({"success": False, "message": "Could not decode image"}), 400
+
+    tracks = session.state(session.process(img, frame, recognizer), img)
+    matches = [t for t in tracks if t["status"] == "matched"]
+    if matches:
+        users = {
+            str(u["_id"]): u
+            for u in mongo.db.users.find(
+                {"_id": {"$in": [ObjectId(t["user_id"]) for t in matches]}},
+                {"name": 1, "user_type": 1, "pass_code": 1}
+            )
+        }
+        for t in matches:
+            user = users.get(t["user_id"], {})
+            t["name"] = user.get("name")
+            t["user_type"] = user.get("user_type")
+            t["passId"] = user.get("pass_code")
+    return jsonify({"frame": frame, "detected": True, "tracks": tracks, "matches": matches})
+
+@face_auth_bp.route("/stream/<session_id>", methods=["DELETE"])
+def stream_stop(session_id):
+    if sessions.close(session_id) is None:
+        return jsonify({"success": False, "message": "Unknown or expired stream session"}), 404
+    return jsonify({"success": True})
+
+@face_auth_bp.route("/metrics", methods=["GET"])
+def face_metrics():
+    """
+    Per-process inference load: governor slots, queue depth and wait times,
+    pending micro-batch items, and hit rates of the result and template caches.
+    """
+    return jsonify({
+        "inference": governor.stats(),
+        "batcher": {"pending": embed_batcher.pending(), "max_pending": embed_batcher.max_pending},
+        "result_cache": {"detect": detection_cache.stats(), "embed": embedding_cache.stats()},
+        "template_cache": templates.stats()
+    })
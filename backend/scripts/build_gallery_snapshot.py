@@ -0,0 +1,31 @@
+# backend/scripts/build_gallery_snapshot.py
+"""
+Rebuild the memory-mapped face gallery snapshot from Mongo.
+
+    cd backend && python -m scripts.build_gallery_snapshot [--dir PATH]
+
+Run it periodically (e.g. nightly cron) so workers start from a recent
+snapshot and only replay a short tail of gallery_changes.
+"""
+import argparse
+from flask import Flask
+
+from config import Config
+from utils.database import init_db
+from face_processing.gallery import FaceGallery
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a face gallery snapshot")
+    parser.add_argument("--dir", default=Config.FACE_GALLERY_SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    init_db(app)
+    with app.app_context():
+        g = FaceGallery(index_backend="exact", snapshot_dir=args.dir)
+        g.load_from_db()
+        g.save_snapshot(args.dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# backend/scripts/compact_templates.py
+"""
+Cap every user's face_embeddings at FACE_MAX_TEMPLATES (k-medoids selection).
+
+    cd backend && python -m scripts.compact_templates [--max-templates 5] [--batch 500] [--dry-run]
+
+One-off clean-up for users who re-registered before store_faces capped templates.
+Kept embeddings are written back unchanged (no re-quantisation); running workers
+pick the change up from gallery_changes.
+"""
+import argparse
+from flask import Flask
+from pymongo import UpdateOne
+
+from config import Config
+from utils.database import init_db, mongo
+from face_processing.embedding_codec import decode_embedding
+from face_processing.gallery import record_change
+from face_processing.templates import select_templates
+
+def compact(max_templates: int, batch_size: int, dry_run: bool = False):
+    db = mongo.db
+    # face_embeddings.<k> exists <=> more than k entries
+    cursor = db.users.find(
+        {f"face_embeddings.{max_templates}": {"$exists": True}},
+        {"face_embeddings": 1}
+    ).batch_size(batch_size)
+
+    ops, changed, seen, before, after = [], [], 0, 0, 0
+
+    def flush():
+        if not dry_run and ops:
+            db.users.bulk_write(ops, ordered=False)
+            for user_id in changed:
+                record_change(user_id, "upsert")
+        ops.clear()
+        changed.clear()
+
+    for u in cursor:
+        seen += 1
+        embeddings = u["face_embeddings"]
+        vectors = [decode_embedding(e) for e in embeddings]
+        usable = [i for i, v in enumerate(vectors) if v is not None and v.size]
+        if not usable:
+            continue
+        usable = [i for i in usable if vectors[i].shape == vectors[usable[0]].shape]
+        keep = [usable[i] for i in select_templates([vectors[i] for i in usable], max_templates)]
+        before += len(embeddings)
+        after += len(keep)
+        # Guard on the old value so a concurrent store_faces isn't overwritten
+        ops.append(UpdateOne(
+            {"_id": u["_id"], "face_embeddings": embeddings},
+            {"$set": {"face_embeddings": [embeddings[i] for i in keep]}}
+        ))
+        changed.append(str(u["_id"]))
+        if len(ops) >= batch_size:
+            flush()
+    flush()
+    print(f"{'Would compact' if dry_run else 'Compacted'} {seen} users: {before} -> {after} embeddings")
+
+def main():
+    parser = argparse.ArgumentParser(description="Cap stored face templates per user")
+    parser.add_argument("--max-templates", type=int, default=Config.FACE_MAX_TEMPLATES)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    init_db(app)
+    with app.app_context():
+        compact(args.max_templates, args.batch, args.dry_run)
+
+if __name__ == "__main__":
+    main()
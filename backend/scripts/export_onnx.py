@@ -0,0 +1,115 @@
+# backend/scripts/export_onnx.py
+"""
+Export the face models to ONNX for FACE_BACKEND=onnx.
+
+    cd backend && python -m scripts.export_onnx [--int8] [--verify DIR]
+
+Writes Config.FACE_ONNX_DETECTOR_PATH (from YOLO_MODEL_PATH via ultralytics)
+and Config.FACE_ONNX_EMBEDDER_PATH (from the DeepFace Keras model via tf2onnx).
+--int8 also writes dynamically quantised *.int8.onnx copies.
+--verify DIR compares native vs ONNX embeddings on the images in DIR
+(e.g. registered_faces/) and prints the cosine agreement and latency.
+"""
+import argparse
+import glob
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+from config import Config
+from face_processing.onnx_backend import model_path
+
+def export_detector(out_path: str, imgsz: int = 640):
+    from ultralytics import YOLO
+    exported = YOLO(Config.YOLO_MODEL_PATH).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    if os.path.abspath(exported) != os.path.abspath(out_path):
+        shutil.move(exported, out_path)
+    print("Detector ->", out_path)
+
+def export_embedder(out_path: str):
+    import tensorflow as tf
+    import tf2onnx
+    from deepface import DeepFace
+    client = DeepFace.build_model(Config.DEEPFACE_MODEL)
+    h, w = client.input_shape[1], client.input_shape[0]
+    spec = (tf.TensorSpec((None, h, w, 3), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(client.model, input_signature=spec, opset=13, output_path=out_path)
+    print("Embedder ->", out_path)
+
+def quantize(path: str):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    out = model_path(path, int8=True)
+    quantize_dynamic(path, out, weight_type=QuantType.QInt8)
+    print("INT8 ->", out)
+
+def _timed(fn, items, repeat=5):
+    fn(items)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(items)
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+def verify(image_dir: str, int8: bool):
+    from face_processing.detection import FaceDetector
+    from face_processing.recognition import FaceRecognizer
+    from face_processing.onnx_backend import OnnxFaceDetector, OnnxFaceEmbedder
+
+    images = [cv2.imread(p) for p in sorted(glob.glob(os.path.join(image_dir, "*.jpg")))]
+    images = [img for img in images if img is not None]
+    if not images:
+        print("No .jpg images in", image_dir)
+        return
+
+    native_det, native_emb = FaceDetector(), FaceRecognizer()
+    onnx_det, onnx_emb = OnnxFaceDetector(int8=int8), OnnxFaceEmbedder(int8=int8)
+
+    boxes_n, det_ms_n = _timed(native_det.detect_faces_batch, images)
+    boxes_o, det_ms_o = _timed(onnx_det.detect_faces_batch, images)
+    crops = []
+    for img, boxes in zip(images, boxes_n):
+        if boxes:
+            x, y, w, h = max(boxes, key=lambda b: b.w * b.h)[:4]
+            crops.append(img[max(0, y):y+h, max(0, x):x+w])
+    print(f"Detection: {len(images)} images, native {det_ms_n:.1f} ms, onnx {det_ms_o:.1f} ms; "
+          f"faces found native {sum(map(len, boxes_n))}, onnx {sum(map(len, boxes_o))}")
+    if not crops:
+        print("No faces detected; skipping embedding parity")
+        return
+
+    embs_n, emb_ms_n = _timed(native_emb.generate_embeddings, crops)
+    embs_o, emb_ms_o = _timed(onnx_emb.generate_embeddings, crops)
+    sims = []
+    for a, b in zip(embs_n, embs_o):
+        if a is not None and b is not None:
+            sims.append(float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-10)))
+    label = "onnx-int8" if int8 else "onnx"
+    print(f"Embedding: {len(crops)} crops, native {emb_ms_n:.1f} ms, {label} {emb_ms_o:.1f} ms")
+    if sims:
+        print(f"Native vs {label} cosine: min {min(sims):.4f}, mean {np.mean(sims):.4f}")
+        # Stored embeddings must stay comparable against FACE_THRESHOLD
+        if min(sims) < (0.95 if int8 else 0.99):
+            print("WARNING: ONNX embeddings drift from native; do not switch FACE_BACKEND without re-embedding")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export face models to ONNX")
+    parser.add_argument("--int8", action="store_true", help="also write dynamic INT8 quantised models")
+    parser.add_argument("--skip-export", action="store_true", help="only run --verify on existing exports")
+    parser.add_argument("--verify", metavar="DIR", help="compare native vs ONNX on the images in DIR")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(Config.FACE_ONNX_DETECTOR_PATH) or ".", exist_ok=True)
+    os.makedirs(os.path.dirname(Config.FACE_ONNX_EMBEDDER_PATH) or ".", exist_ok=True)
+    if not args.skip_export:
+        export_detector(Config.FACE_ONNX_DETECTOR_PATH)
+        export_embedder(Config.FACE_ONNX_EMBEDDER_PATH)
+        if args.int8:
+            quantize(Config.FACE_ONNX_DETECTOR_PATH)
+            quantize(Config.FACE_ONNX_EMBEDDER_PATH)
+    if args.verify:
+        verify(args.verify, args.int8)
+
+if __name__ == "__main__":
+    main()
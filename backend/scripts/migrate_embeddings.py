@@ -0,0 +1,62 @@
+# backend/scripts/migrate_embeddings.py
+"""
+Re-pack every user's face_embeddings into the configured binary format.
+
+    cd backend && python -m scripts.migrate_embeddings [--format float16|int8] [--batch 500] [--dry-run]
+
+Idempotent: users whose embeddings are already packed in the target format are skipped.
+"""
+import argparse
+from flask import Flask
+from pymongo import UpdateOne
+
+from config import Config
+from utils.database import init_db, mongo
+from face_processing.embedding_codec import encode_embedding, decode_embedding, embedding_format
+
+def _needs_migration(embeddings, fmt):
+    return any(embedding_format(e) != fmt for e in embeddings)
+
+def migrate(fmt: str, batch_size: int, dry_run: bool = False):
+    db = mongo.db
+    cursor = db.users.find(
+        {"face_embeddings": {"$exists": True, "$ne": []}},
+        {"face_embeddings": 1}
+    ).batch_size(batch_size)
+
+    ops, seen, migrated = [], 0, 0
+    for u in cursor:
+        seen += 1
+        embeddings = u.get("face_embeddings", [])
+        if not _needs_migration(embeddings, fmt):
+            continue
+        packed = [encode_embedding(decode_embedding(e), fmt) for e in embeddings]
+        # Guard on the old value so a concurrent store_faces isn't overwritten
+        ops.append(UpdateOne(
+            {"_id": u["_id"], "face_embeddings": embeddings},
+            {"$set": {"face_embeddings": packed}}
+        ))
+        migrated += 1
+        if len(ops) >= batch_size:
+            if not dry_run:
+                db.users.bulk_write(ops, ordered=False)
+            ops = []
+    if ops and not dry_run:
+        db.users.bulk_write(ops, ordered=False)
+    print(f"Scanned {seen} users, {'would migrate' if dry_run else 'migrated'} {migrated} to {fmt}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack stored face embeddings as BSON Binary")
+    parser.add_argument("--format", default=Config.FACE_EMBEDDING_FORMAT, choices=["float16", "int8", "float32"])
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    init_db(app)
+    with app.app_context():
+        migrate(args.format, args.batch, args.dry_run)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# backend/scripts/migrate_sessions.py
+"""
+Move login tokens stored on users/conductors (token, tokenExpiry) into the
+sessions collection, and remove the old fields.
+
+    cd backend && python -m scripts.migrate_sessions [--dry-run]
+
+Expired tokens are dropped rather than copied. Safe to re-run: only documents
+that still carry a token field are touched, and a token already in sessions
+is not inserted twice.
+"""
+import argparse
+from datetime import datetime
+from flask import Flask
+
+from config import Config
+from utils.database import init_db, mongo
+from utils.sessions import hash_token, _snapshot
+
+def migrate(dry_run: bool = False):
+    db = mongo.db
+    now = datetime.utcnow()
+    for role, collection in (("user", db.users), ("conductor", db.conductors)):
+        moved = dropped = 0
+        for doc in collection.find({"token": {"$exists": True}}):
+            expiry = doc.get("tokenExpiry")
+            if doc.get("token") and expiry and expiry > now:
+                moved += 1
+                if not dry_run:
+                    db.sessions.update_one(
+                        {"token_hash": hash_token(doc["token"])},
+                        {"$setOnInsert": {
+                            "principal_id": doc["_id"],
+                            "role": role,
+                            "principal": _snapshot(doc),
+                            "created_at": now,
+                            "expires_at": expiry,
+                        }},
+                        upsert=True
+                    )
+            else:
+                dropped += 1
+            if not dry_run:
+                collection.update_one({"_id": doc["_id"]}, {"$unset": {"token": "", "tokenExpiry": ""}})
+        print(f"{collection.name}: {'would move' if dry_run else 'moved'} {moved} live tokens, dropped {dropped} expired")
+
+def main():
+    parser = argparse.ArgumentParser(description="Move stored login tokens into the sessions collection")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    init_db(app)
+    with app.app_context():
+        migrate(args.dry_run)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# backend/scripts/reembed_faces.py
+"""
+Re-derive every user's face embeddings with the configured model (FACE_MODEL_TAG).
+
+    cd backend && python -m scripts.reembed_faces [--workers 4] [--chunk 64] [--restart] [--dry-run]
+
+Sources per user: the registered_faces/<user_id>.jpg preview crop and the
+uploads/applicantPhotos/ photo. Each worker process loads the models once and
+runs one detector pass and one embedding pass per chunk of users; results are
+written with bulk_write and tagged with face_model. Progress is checkpointed
+after every chunk, so an interrupted run picks up where it stopped (users
+already on the current tag are skipped anyway). Rebuild the gallery snapshot
+afterwards (python -m scripts.build_gallery_snapshot).
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from bson import ObjectId
+from flask import Flask
+from pymongo import UpdateOne
+
+from config import Config
+from utils.database import init_db, mongo
+from face_processing.embedding_codec import encode_embedding
+from face_processing.enrol import FACE_DIR, largest_face, crop_face
+from face_processing.ingest import read_file
+from face_processing.gallery import record_changes
+from face_processing.templates import select_templates
+
+PHOTO_DIR = os.path.join(Config.UPLOAD_FOLDER, "applicantPhotos")
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reembed_checkpoint.json")
+
+_engine = None
+
+def _init_worker(threads: int):
+    global _engine
+    # The pool supplies the parallelism; keep each process's math libraries narrow
+    from face_processing.governor import configure_threads
+    configure_threads(threads, 1, frameworks=Config.FACE_BACKEND != "onnx")
+    from face_processing.inference import LocalEngine
+    _engine = LocalEngine()
+
+def _embed_chunk(chunk):
+    """
+    chunk: [(user_id, [(path, is_crop), ...]), ...]
+    Returns [(user_id, [embedding, ...]), ...] for every user in the chunk.
+    """
+    images, owners, is_crops = [], [], []
+    for user_id, sources in chunk:
+        for path, is_crop in sources:
+            img = read_file(path)
+            if img is not None:
+                images.append(img)
+                owners.append(user_id)
+                is_crops.append(is_crop)
+
+    crops, crop_owners = [], []
+    for img, faces, owner, is_crop in zip(images, _engine.detect(images) if images else [], owners, is_crops):
+        face = largest_face(faces)
+        crop = crop_face(img, face) if face is not None else None
+        if crop is None and is_crop:
+            crop = img  # previews are already tight face crops
+        if crop is not None:
+            crops.append(crop)
+            crop_owners.append(owner)
+
+    found = {user_id: [] for user_id, _ in chunk}
+    for owner, emb in zip(crop_owners, _engine.embed(crops) if crops else []):
+        if emb is not None:
+            found[owner].append(np.asarray(emb, dtype=np.float32))
+    return list(found.items())
+
+def _sources(user):
+    user_id = str(user["_id"])
+    out = []
+    preview = os.path.join(FACE_DIR, f"{user_id}.jpg")
+    if os.path.exists(preview):
+        out.append((preview, True))
+    photo = user.get("applicant_photo_filename")
+    if photo and os.path.exists(os.path.join(PHOTO_DIR, photo)):
+        out.append((os.path.join(PHOTO_DIR, photo), False))
+    return user_id, out
+
+def _chunks(cursor, size):
+    chunk = []
+    for user in cursor:
+        chunk.append(_sources(user))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _load_checkpoint(path, restart):
+    if restart or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        state = json.load(f)
+    if state.get("model") != Config.FACE_MODEL_TAG:
+        print(f"Ignoring checkpoint for model {state.get('model')}")
+        return {}
+    return state
+
+def _save_checkpoint(path, state):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+def _write(results):
+    """
+    Store one chunk's embeddings. Returns (changed, skipped); users that were
+    re-registered with the current model while we worked are left alone and
+    count as skipped.
+    """
+    db = mongo.db
+    ops, written, skipped = [], {}, 0
+    for user_id, embeddings in results:
+        if not embeddings:
+            skipped += 1
+            continue
+        keep = select_templates(embeddings, Config.FACE_MAX_TEMPLATES)
+        packed = [encode_embedding(embeddings[i]) for i in keep]
+        # Same guard as the cursor: a concurrent store_faces already wrote current-model faces
+        ops.append(UpdateOne(
+            {"_id": ObjectId(user_id), "face_model": {"$ne": Config.FACE_MODEL_TAG}},
+            {"$set": {
+                "face_embeddings": packed,
+                "face_model": Config.FACE_MODEL_TAG,
+                "face_registered": True
+            }}
+        ))
+        written[user_id] = packed
+    if not ops:
+        return 0, skipped
+    result = db.users.bulk_write(ops, ordered=False)
+    changed = list(written)
+    if result.matched_count < len(ops):
+        # bulk_write only reports counts: find the users holding exactly what we wrote
+        hits = db.users.find(
+            {"$or": [{"_id": ObjectId(u), "face_embeddings": p} for u, p in written.items()]}, {"_id": 1}
+        )
+        changed = [str(u["_id"]) for u in hits]
+    if changed:
+        record_changes(changed, "upsert")
+    return len(changed), skipped + len(written) - len(changed)
+
+def reembed(workers: int, threads: int, chunk_size: int, checkpoint: str,
+            restart: bool = False, dry_run: bool = False):
+    db = mongo.db
+    state = _load_checkpoint(checkpoint, restart)
+    query = {
+        "face_model": {"$ne": Config.FACE_MODEL_TAG},
+        "$or": [{"face_registered": True}, {"applicant_photo_filename": {"$nin": [None, ""]}}],
+    }
+    if state.get("last_id"):
+        query["_id"] = {"$gt": ObjectId(state["last_id"])}
+    if dry_run:
+        print(f"Would re-embed {db.users.count_documents(query)} users with {Config.FACE_MODEL_TAG}")
+        return
+
+    state.setdefault("model", Config.FACE_MODEL_TAG)
+    state.setdefault("updated", 0)
+    state.setdefault("skipped", 0)
+    cursor = db.users.find(query, {"applicant_photo_filename": 1}).sort("_id", 1).batch_size(chunk_size * 4)
+
+    # Spawned (not forked) workers: the parent holds a Mongo client and no models
+    ctx = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(threads,)) as pool:
+        pending = deque()
+        chunks = _chunks(cursor, chunk_size)
+        for chunk in chunks:
+            pending.append((chunk, pool.submit(_embed_chunk, chunk)))
+            if len(pending) < workers * 2:
+                continue
+            # Results are consumed in submission order so the checkpoint only moves forward
+            done_chunk, future = pending.popleft()
+            _record(done_chunk, future.result(), state, checkpoint)
+        while pending:
+            done_chunk, future = pending.popleft()
+            _record(done_chunk, future.result(), state, checkpoint)
+
+    print(f"Re-embedded {state['updated']} users with {Config.FACE_MODEL_TAG}; "
+          f"{state['skipped']} skipped (no usable face image, or re-registered meanwhile)")
+
+def _record(chunk, results, state, checkpoint):
+    updated, skipped = _write(results)
+    state["updated"] += updated
+    state["skipped"] += skipped
+    state["last_id"] = chunk[-1][0]
+    _save_checkpoint(checkpoint, state)
+    print(f"... {state['updated']} updated, {state['skipped']} skipped (last {state['last_id']})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed stored faces with the configured model")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--threads", type=int, default=2, help="math-library threads per worker process")
+    parser.add_argument("--chunk", type=int, default=64, help="users per inference batch")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    init_db(app)
+    with app.app_context():
+        reembed(args.workers, args.threads, args.chunk, args.checkpoint, args.restart, args.dry_run)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# backend/tests/conftest.py
+"""
+Shared fixtures: a mongomock database behind utils.database.mongo and a seeded RNG
+(embedding and user helpers are in helpers.py).
+
+    cd backend && python -m pytest -q tests
+"""
+import os
+import sys
+
+import mongomock
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from utils.database import mongo
+
+@pytest.fixture
+def db(monkeypatch):
+    database = mongomock.MongoClient().db
+    monkeypatch.setattr(mongo, "db", database, raising=False)
+    # Replay the change log on every call instead of every few seconds
+    monkeypatch.setattr(Config, "FACE_GALLERY_SYNC_SECONDS", 0)
+    return database
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(1234)
+
+@pytest.fixture
+def fresh_gallery(db, monkeypatch):
+    """
+    An empty exact-search FaceGallery (no snapshot dir) in place of the
+    module singletons used by recognition.
+    """
+    from face_processing import gallery as gallery_module, recognition
+    g = gallery_module.FaceGallery(index_backend="exact", snapshot_dir=None)
+    g.subscribe(lambda user_id: recognition.templates.clear() if user_id is None else recognition.templates.pop(user_id))
+    monkeypatch.setattr(gallery_module, "gallery", g)
+    monkeypatch.setattr(recognition, "gallery", g)
+    recognition.templates.clear()
+    monkeypatch.setitem(recognition._template_sync, "seq", None)
+    monkeypatch.setitem(recognition._template_sync, "checked", 0.0)
+    return g
@@ -0,0 +1,38 @@
+# backend/tests/helpers.py
+"""
+Random unit embeddings and enrolled users for the face tests.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from config import Config
+
+DIM = 64
+
+def unit(vectors) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def near(rng, center, n: int, noise: float = 0.05) -> np.ndarray:
+    """
+    n unit vectors close to center (same person, different photos).
+    """
+    center = unit(center)[0]
+    return unit(center + noise * rng.standard_normal((n, len(center))))
+
+def insert_user(db, embeddings, route=("Hyderabad", "Warangal"), active=True, **fields) -> str:
+    """
+    A user with a pass on route and stored float32 embeddings; returns the id as str.
+    """
+    doc = {
+        "name": fields.pop("name", "user"),
+        "From": route[0] if route else None,
+        "To": route[1] if route else None,
+        "Pass_Status": active,
+        "pass_expiry": datetime.utcnow() + timedelta(days=30),
+        "face_embeddings": [np.asarray(e, dtype=np.float32).tolist() for e in embeddings],
+        "face_model": Config.FACE_MODEL_TAG,
+        **fields,
+    }
+    return str(db.users.insert_one(doc).inserted_id)
@@ -0,0 +1,60 @@
+# backend/tests/test_ann_index.py
+"""
+ANN candidate generators: IVF recall against brute force.
+"""
+import numpy as np
+
+from face_processing.ann_index import IVFIndex, CentroidIndex, make_index
+from helpers import unit
+
+def _gallery_and_queries(rng, n=4000, dim=64, queries=300):
+    gallery = unit(rng.standard_normal((n, dim)))
+    picks = rng.choice(n, queries, replace=False)
+    # A second photo of an enrolled face: close to its row, not identical
+    return gallery, unit(gallery[picks] + 0.08 * rng.standard_normal((queries, dim)))
+
+def _top1(gallery, rows, q):
+    return rows[int(np.argmax(gallery[rows] @ q))]
+
+def test_ivf_recall_against_brute_force(rng):
+    gallery, queries = _gallery_and_queries(rng)
+    rows = np.arange(len(gallery))
+    index = IVFIndex(nlist=0, nprobe=8)
+    index.build(gallery, rows)
+    assert len(index.lists) == int(np.sqrt(len(gallery)))
+    assert sorted(np.concatenate(index.lists).tolist()) == rows.tolist()
+
+    hits = scanned = 0
+    for q in queries:
+        cand = index.candidates(q, 32)
+        scanned += len(cand)
+        hits += _top1(gallery, cand, q) == _top1(gallery, rows, q)
+    assert hits / len(queries) >= 0.95
+    # ...while scoring a fraction of the gallery
+    assert scanned / len(queries) < 0.5 * len(gallery)
+
+def test_ivf_add_and_remove(rng):
+    gallery, _ = _gallery_and_queries(rng, n=500)
+    index = IVFIndex(nlist=10, nprobe=10)
+    index.build(gallery[:400], np.arange(400))
+    index.add(gallery[400:], np.arange(400, 500))
+    index.remove(np.arange(0, 500, 2))
+    # nprobe == nlist: every live row is a candidate
+    assert sorted(index.candidates(gallery[1], 1).tolist()) == list(range(1, 500, 2))
+
+def test_centroid_index_returns_whole_users(rng):
+    gallery = unit(rng.standard_normal((30, 16)))
+    ids = np.repeat([f"u{i}" for i in range(10)], 3)
+    index = CentroidIndex()
+    index.build(gallery, np.arange(30), ids)
+    cand = index.candidates(gallery[4], 2)
+    assert set(range(3, 6)) <= set(cand.tolist())
+    assert len(cand) == 6
+
+    index.remove(np.arange(3, 6))
+    assert not set(range(3, 6)) & set(index.candidates(gallery[4], 10).tolist())
+
+def test_make_index_backends():
+    assert make_index("exact") is None
+    assert isinstance(make_index("ivf"), IVFIndex)
+    assert isinstance(make_index("centroid"), CentroidIndex)
@@ -0,0 +1,49 @@
+# backend/tests/test_embedding_codec.py
+"""
+Packed embedding storage: round-trip error bounds and format detection.
+"""
+import numpy as np
+import pytest
+from bson.binary import Binary
+
+from face_processing.embedding_codec import encode_embedding, decode_embedding, embedding_format, is_packed
+from helpers import unit
+
+@pytest.fixture
+def embeddings(rng):
+    # ArcFace-sized, unit-norm and raw-scale vectors
+    return list(unit(rng.standard_normal((50, 512)))) + list(rng.standard_normal((50, 512)) * 20)
+
+def test_float16_round_trip(embeddings):
+    for e in embeddings:
+        packed = encode_embedding(e, "float16")
+        assert isinstance(packed, Binary) and is_packed(packed)
+        assert embedding_format(packed) == "float16"
+        assert len(packed) == 8 + 2 * e.size
+        out = decode_embedding(packed)
+        assert out.dtype == np.float32
+        # half precision: 11 significant bits
+        assert np.all(np.abs(out - e) <= np.abs(e) * 2 ** -11 + 1e-7)
+
+def test_int8_round_trip(embeddings):
+    for e in embeddings:
+        packed = encode_embedding(e, "int8")
+        assert embedding_format(packed) == "int8"
+        assert len(packed) == 8 + e.size
+        out = decode_embedding(packed)
+        step = np.abs(e).max() / 127.0
+        # Rounding to the nearest step, plus float32 slack
+        assert np.max(np.abs(out - e)) <= step / 2 + 1e-6
+        cos = float(out @ e / (np.linalg.norm(out) * np.linalg.norm(e)))
+        assert cos > 0.999
+
+def test_float32_is_a_plain_list(embeddings):
+    e = embeddings[0]
+    stored = encode_embedding(e, "float32")
+    assert isinstance(stored, list) and not is_packed(stored)
+    assert embedding_format(stored) == "float32"
+    assert np.array_equal(decode_embedding(stored), e.astype(np.float32))
+
+def test_zero_vector_int8():
+    out = decode_embedding(encode_embedding(np.zeros(8), "int8"))
+    assert np.array_equal(out, np.zeros(8, dtype=np.float32))
@@ -0,0 +1,146 @@
+# backend/tests/test_gallery.py
+"""
+Resident face gallery: edits, compaction, scoping, snapshots + change-log replay.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import ObjectId
+
+from face_processing.gallery import FaceGallery, route_key
+from helpers import DIM, unit, near, insert_user
+
+def _gallery(db, **kwargs):
+    g = FaceGallery(index_backend=kwargs.pop("index_backend", "exact"), snapshot_dir=kwargs.pop("snapshot_dir", None))
+    g.load_from_db()
+    return g
+
+def test_add_replace_remove(db, rng):
+    a, b = unit(rng.standard_normal((2, DIM)))
+    user_a = insert_user(db, near(rng, a, 2))
+    g = _gallery(db)
+    assert len(g) == 2
+    assert g.search(a)[0] == user_a
+
+    user_b = insert_user(db, [])
+    g.add(user_b, list(near(rng, b, 3)))
+    assert len(g) == 5
+    assert g.search(b)[0] == user_b
+
+    # A new face for a replaces the old one entirely
+    c = unit(rng.standard_normal(DIM))[0]
+    g.replace(user_a, list(near(rng, c, 2)))
+    assert len(g) == 5
+    assert g.search(c)[0] == user_a
+    assert g.search(a)[1] < 0.5  # a's old rows are gone
+
+    g.remove(user_b)
+    assert len(g) == 2
+    assert g.search(b)[0] == user_a  # only a is left
+    assert db.gallery_changes.count_documents({}) == 3
+
+def test_tombstones_are_compacted(db, rng):
+    ids = [insert_user(db, near(rng, p, 2)) for p in unit(rng.standard_normal((8, DIM)))]
+    g = _gallery(db)
+    assert len(g._alive) == 16
+
+    g.remove(ids[0])
+    assert len(g._alive) == 16  # 2/16 dead: below COMPACT_FRACTION
+    g.remove(ids[1])
+    g.remove(ids[2])
+    # 6/16 dead crossed the threshold: rows were dropped, not just masked
+    assert len(g._alive) < 16
+    assert g._alive.all()
+    assert len(g) == 10
+    assert set(g._base_ids.tolist()) == set(ids[3:])
+
+def test_route_and_active_scoping(db, rng):
+    p = unit(rng.standard_normal(DIM))[0]
+    on_route = insert_user(db, near(rng, p, 2, noise=0.2), route=("Hyderabad", "Warangal"))
+    other_route = insert_user(db, near(rng, p, 2, noise=0.01), route=("Nellore", "Guntur"))
+    expired = insert_user(db, near(rng, p, 2, noise=0.01), route=("Hyderabad", "Warangal"),
+                          pass_expiry=datetime.utcnow() - timedelta(days=1))
+    inactive = insert_user(db, near(rng, p, 2, noise=0.01), route=("Hyderabad", "Warangal"), active=False)
+    g = _gallery(db)
+
+    route = route_key(" hyderabad", "WARANGAL ")
+    assert g.search(p, route=route, active_only=True)[0] == on_route
+    assert g.search(p, route=route)[0] in {expired, inactive}
+    assert g.search(p, route=route_key("Nellore", "Guntur"))[0] == other_route
+    assert g.search(p, route=route_key("Nowhere", "Else")) == (None, -1.0)
+
+    # Renewing the pass brings the user back into active-only results
+    db.users.update_one({"_id": ObjectId(expired)}, {"$set": {"pass_expiry": datetime.utcnow() + timedelta(days=30)}})
+    g.refresh_pass(expired)
+    assert g.search(p, route=route, active_only=True)[0] == expired
+    assert [u for u, _ in g.search_many([p, p], route=route, active_only=True)] == [expired, expired]
+
+def test_snapshot_round_trip_then_change_log_replay(db, rng, tmp_path):
+    people = unit(rng.standard_normal((5, DIM)))
+    ids = [insert_user(db, near(rng, p, 2)) for p in people]
+    writer = _gallery(db, snapshot_dir=str(tmp_path))
+    writer.save_snapshot(str(tmp_path))
+
+    # Edits after the snapshot go to Mongo + the change log
+    newcomer = unit(rng.standard_normal(DIM))[0]
+    new_id = insert_user(db, near(rng, newcomer, 2))
+    writer.add(new_id, list(near(rng, newcomer, 2)))
+    db.users.delete_one({"_id": ObjectId(ids[0])})
+    writer.remove(ids[0])
+
+    reader = FaceGallery(index_backend="exact", snapshot_dir=str(tmp_path))
+    reader.load()
+    assert isinstance(reader._base, np.memmap)
+    assert reader.version == writer.version
+    assert reader.search(newcomer)[0] == new_id
+    assert reader.search(people[0])[0] != ids[0]
+    for user_id, p in zip(ids[1:], people[1:]):
+        assert reader.search(p)[0] == user_id
+    assert len(reader) == len(writer)
+
+def test_sync_reloads_when_the_log_was_pruned(db, rng, tmp_path):
+    ids = [insert_user(db, near(rng, p, 2)) for p in unit(rng.standard_normal((3, DIM)))]
+    writer = _gallery(db)
+    writer.save_snapshot(str(tmp_path))
+    db.users.delete_one({"_id": ObjectId(ids[0])})
+    writer.remove(ids[0])
+    db.gallery_changes.delete_many({})  # TTL index pruned everything
+
+    reader = FaceGallery(index_backend="exact", snapshot_dir=str(tmp_path))
+    assert reader.load_snapshot(str(tmp_path))
+    reader.sync(force=True)
+    assert len(reader) == 4
+    assert ids[0] not in reader._base_ids.tolist()
+
+def test_stale_snapshot_is_rewritten_after_a_full_reload(db, rng, tmp_path, capsys):
+    ids = [insert_user(db, near(rng, p, 2)) for p in unit(rng.standard_normal((3, DIM)))]
+    writer = _gallery(db)
+    old = writer.save_snapshot(str(tmp_path))
+    with open(os.path.join(old, "meta.json")) as f:
+        meta = json.load(f)
+    meta["created_at"] = (datetime.utcnow() - timedelta(days=30)).isoformat()
+    with open(os.path.join(old, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    db.users.delete_one({"_id": ObjectId(ids[0])})
+    writer.remove(ids[0])
+    db.gallery_changes.delete_many({})
+
+    reader = FaceGallery(index_backend="exact", snapshot_dir=str(tmp_path))
+    reader.load()
+    assert "past the change-log TTL" in capsys.readouterr().out
+    with open(os.path.join(str(tmp_path), "CURRENT")) as f:
+        assert os.path.join(str(tmp_path), f.read().strip()) != old
+
+    # The next worker maps the fresh snapshot and has nothing to reload
+    late = FaceGallery(index_backend="exact", snapshot_dir=str(tmp_path))
+    late.load()
+    assert "reloading" not in capsys.readouterr().out
+    assert len(late) == 4
+    assert late.version == reader.version
+
+def test_other_model_embeddings_are_not_loaded(db, rng):
+    insert_user(db, unit(rng.standard_normal((2, DIM))), face_model="SomethingElse@0")
+    insert_user(db, unit(rng.standard_normal((2, DIM))))
+    assert len(_gallery(db)) == 2
@@ -0,0 +1,82 @@
+# backend/tests/test_recognition.py
+"""
+FaceRecognizer: 1:N matching against the resident gallery, 1:1 claims.
+"""
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from face_processing.gallery import route_key, record_change
+from face_processing.recognition import FaceRecognizer, templates
+from helpers import DIM, unit, near, insert_user
+
+def test_verify_face_finds_the_enrolled_user(db, rng, fresh_gallery):
+    people = unit(rng.standard_normal((20, DIM)))
+    ids = [insert_user(db, near(rng, p, 3)) for p in people]
+    recognizer = FaceRecognizer()
+
+    for user_id, p in zip(ids, people):
+        assert recognizer.verify_face(near(rng, p, 1)[0]) == user_id
+    assert fresh_gallery.loaded
+
+def test_match_face_reports_similarity_below_threshold(db, rng, fresh_gallery):
+    insert_user(db, unit(rng.standard_normal((2, DIM))))
+    recognizer = FaceRecognizer()
+    stranger = unit(rng.standard_normal(DIM))[0]
+
+    user_id, sim = recognizer.match_face(stranger)
+    assert user_id is None
+    assert -1.0 <= sim < recognizer.threshold
+    assert recognizer.verify_face(stranger) is None
+
+def test_match_faces_gives_each_user_to_one_face(db, rng, fresh_gallery):
+    p = unit(rng.standard_normal(DIM))[0]
+    user_id = insert_user(db, near(rng, p, 3))
+    recognizer = FaceRecognizer()
+
+    first, second = recognizer.match_faces([near(rng, p, 1, noise=0.01)[0], near(rng, p, 1, noise=0.2)[0]])
+    assert first[0] == user_id
+    assert second[0] is None
+
+def test_verify_claim_checks_only_the_claimed_user(db, rng, fresh_gallery):
+    p, q = unit(rng.standard_normal((2, DIM)))
+    user_p = insert_user(db, near(rng, p, 3))
+    user_q = insert_user(db, near(rng, q, 3))
+    recognizer = FaceRecognizer()
+
+    matched, sim = recognizer.verify_claim(near(rng, p, 1)[0], user_p)
+    assert matched and sim > recognizer.threshold
+    assert recognizer.verify_claim(near(rng, p, 1)[0], user_q)[0] is False
+    assert recognizer.verify_claim(p, str(ObjectId())) == (False, -1.0)
+    # 1:1 never loads the gallery
+    assert not fresh_gallery.loaded
+
+def test_verify_claim_scoping(db, rng, fresh_gallery):
+    p = unit(rng.standard_normal(DIM))[0]
+    user_id = insert_user(db, near(rng, p, 2), route=("Hyderabad", "Warangal"),
+                          pass_expiry=datetime.utcnow() - timedelta(days=1))
+    recognizer = FaceRecognizer()
+
+    assert recognizer.verify_claim(p, user_id, route=route_key("Hyderabad", "Warangal"))[0]
+    assert recognizer.verify_claim(p, user_id, route=route_key("Nellore", "Guntur")) == (False, -1.0)
+    assert recognizer.verify_claim(p, user_id, active_only=True) == (False, -1.0)
+
+def test_verify_claim_sees_revocations_from_other_workers(db, rng, fresh_gallery):
+    p = unit(rng.standard_normal(DIM))[0]
+    user_id = insert_user(db, near(rng, p, 2))
+    recognizer = FaceRecognizer()
+    assert recognizer.verify_claim(p, user_id, active_only=True)[0]
+    assert user_id in templates._data
+
+    # Another process revokes the pass: Mongo + change log only, nothing local
+    db.users.update_one({"_id": ObjectId(user_id)}, {"$set": {"Pass_Status": False}})
+    record_change(user_id, "upsert")
+    assert recognizer.verify_claim(p, user_id, active_only=True) == (False, -1.0)
+
+    # ...and a re-enrolment with a different face
+    other = unit(rng.standard_normal(DIM))[0]
+    db.users.update_one({"_id": ObjectId(user_id)}, {"$set": {
+        "Pass_Status": True, "face_embeddings": [e.tolist() for e in near(rng, other, 2)]}})
+    record_change(user_id, "upsert")
+    assert not recognizer.verify_claim(p, user_id)[0]
+    assert recognizer.verify_claim(other, user_id)[0]
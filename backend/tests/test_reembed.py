@@ -0,0 +1,32 @@
+# backend/tests/test_reembed.py
+"""
+Bulk re-embedding writes (scripts.reembed_faces._write).
+"""
+from bson import ObjectId
+
+from config import Config
+from face_processing.embedding_codec import decode_embedding
+from scripts.reembed_faces import _write
+from helpers import DIM, unit, near, insert_user
+
+def test_write_skips_users_re_registered_meanwhile(db, rng):
+    people = unit(rng.standard_normal((3, DIM)))
+    stale, raced, faceless = (insert_user(db, near(rng, p, 2), face_model="Old@0") for p in people)
+    # store_faces got to this user with the current model after the chunk was read
+    current = [list(map(float, e)) for e in near(rng, people[1], 2)]
+    db.users.update_one({"_id": ObjectId(raced)}, {"$set": {"face_embeddings": current, "face_model": Config.FACE_MODEL_TAG}})
+
+    changed, skipped = _write([
+        (stale, list(near(rng, people[0], 3))),
+        (raced, list(near(rng, people[1], 3))),
+        (faceless, []),
+    ])
+    assert (changed, skipped) == (1, 2)
+
+    user = db.users.find_one({"_id": ObjectId(stale)})
+    assert user["face_model"] == Config.FACE_MODEL_TAG
+    assert len(user["face_embeddings"]) == 3
+    assert all(decode_embedding(e).shape == (DIM,) for e in user["face_embeddings"])
+    assert db.users.find_one({"_id": ObjectId(raced)})["face_embeddings"] == current
+    assert db.users.find_one({"_id": ObjectId(faceless)})["face_model"] == "Old@0"
+    assert [c["user_id"] for c in db.gallery_changes.find()] == [stale]
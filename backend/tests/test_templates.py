@@ -0,0 +1,58 @@
+# backend/tests/test_templates.py
+"""
+Per-user template cap (select_templates, store_faces) and the centroid first pass.
+"""
+import numpy as np
+from bson import ObjectId
+
+from config import Config
+from face_processing.embedding_codec import decode_embedding
+from face_processing.gallery import FaceGallery
+from face_processing.recognition import FaceRecognizer
+from face_processing.templates import select_templates
+from helpers import DIM, unit, near, insert_user
+
+def test_select_templates_keeps_all_when_under_cap(rng):
+    embs = unit(rng.standard_normal((3, DIM)))
+    assert select_templates(list(embs), 5) == [0, 1, 2]
+
+def test_select_templates_caps_and_covers_every_pose(rng):
+    # Three "poses", ten photos each: the cap keeps one template per pose
+    poses = unit(rng.standard_normal((3, DIM)))
+    embs = np.concatenate([near(rng, p, 10) for p in poses])
+    keep = select_templates(list(embs), 3)
+    assert len(keep) == 3
+    assert sorted(i // 10 for i in keep) == [0, 1, 2]
+
+def test_store_faces_keeps_at_most_the_cap(db, rng, monkeypatch):
+    monkeypatch.setattr(Config, "FACE_MAX_TEMPLATES", 4)
+    user_id = str(db.users.insert_one({"name": "rider"}).inserted_id)
+    recognizer = FaceRecognizer()
+    person = rng.standard_normal(DIM)
+    for _ in range(5):
+        assert recognizer.store_faces(user_id, list(near(rng, person, 3)))
+
+    user = db.users.find_one({"_id": ObjectId(user_id)})
+    assert user["face_registered"] is True
+    assert user["face_model"] == Config.FACE_MODEL_TAG
+    assert len(user["face_embeddings"]) == 4
+    assert all(decode_embedding(e).shape == (DIM,) for e in user["face_embeddings"])
+
+def test_centroid_first_pass_matches_exact_search(db, rng, monkeypatch):
+    monkeypatch.setattr(Config, "FACE_ANN_MIN_ROWS", 1)
+    monkeypatch.setattr(Config, "FACE_ANN_RERANK_K", 4)
+    people = unit(rng.standard_normal((60, DIM)))
+    for p in people:
+        insert_user(db, near(rng, p, 4), route=None)
+
+    exact = FaceGallery(index_backend="exact", snapshot_dir=None)
+    exact.load_from_db()
+    first_pass = FaceGallery(index_backend="centroid", snapshot_dir=None)
+    first_pass.load_from_db()
+    assert type(first_pass._index).__name__ == "CentroidIndex"
+
+    queries = np.concatenate([near(rng, p, 1, noise=0.1) for p in people])
+    for q in queries:
+        (user_id, sim), (expected_id, expected_sim) = first_pass.search(q), exact.search(q)
+        assert user_id == expected_id
+        assert abs(sim - expected_sim) < 1e-5
@@ -6,7 +6,13 @@ from datetime import datetime, timedelta
 import jwt
 
 from config import Config
+from utils.cache import LRUCache
 from utils.database import mongo
+from utils.sessions import find_session, end_principal_sessions, hash_token, _snapshot, SNAPSHOT_FIELDS
+
+ROLE_COLLECTIONS = {"user": "users", "conductor": "conductors"}
+# Session token hash -> slim principal; see lookup_token()
+principals = LRUCache(Config.TOKEN_CACHE_SIZE, ttl=Config.TOKEN_CACHE_TTL)
 
 def make_token(user_id: str):
     payload = {
@@ -45,3 +51,74 @@ def token_required(f):
 
         return f(user, *args, **kwargs)
     return decorated
+
+def lookup_token(token: str):
+    """
+    Principal for a session token (see utils/sessions.py): _id as str, role
+    ("user" or "conductor"), tokenExpiry and the account's SNAPSHOT_FIELDS.
+    Cached for TOKEN_CACHE_TTL seconds; returns None for an unknown token or
+    an account that no longer exists. Callers still check tokenExpiry.
+    """
+    key = hash_token(token)
+    principal = principals.get(key)
+    if principal is not None:
+        return dict(principal)
+
+    session = find_session(token)
+    if not session:
+        return None
+    # Re-read the account so a deleted user/conductor loses access and the display fields are current
+    collection = mongo.db[ROLE_COLLECTIONS[session["role"]]]
+    account = collection.find_one({"_id": session["principal_id"]}, {f: 1 for f in SNAPSHOT_FIELDS})
+    if not account:
+        return None
+    principal = {
+        **_snapshot(account),
+        "_id": str(account["_id"]),
+        "role": session["role"],
+        "tokenExpiry": session["expires_at"],
+    }
+    principals.put(key, principal)
+    return dict(principal)
+
+def forget_token(token):
+    """
+    Drop a token from the principal cache; call wherever a token is replaced or removed.
+    """
+    if token:
+        principals.pop(hash_token(token))
+
+def revoke_principal(principal_id):
+    """
+    End every session of a deleted user or conductor and evict them from this
+    process's cache (other processes drop them within TOKEN_CACHE_TTL).
+    """
+    for key in end_principal_sessions(principal_id):
+        principals.pop(key)
+
+def token_expired(principal: dict) -> bool:
+    expiry = principal.get("tokenExpiry")
+    return bool(expiry) and expiry < datetime.utcnow()
+
+def conductor_required(f):
+    """
+    Conductor session token (see /api/auth/conductor/login).
+    Passes the conductor principal (see lookup_token) to the view.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.headers.get("Authorization", "")
+        if token.startswith("Bearer "):
+            token = token[7:]
+
+        if not token:
+            return jsonify({"message": "Token is missing"}), 401
+
+        conductor = lookup_token(token)
+        if not conductor or conductor["role"] != "conductor":
+            return jsonify({"message": "Token is invalid"}), 401
+        if token_expired(conductor):
+            return jsonify({"message": "Token expired"}), 401
+
+        return f(conductor, *args, **kwargs)
+    return decorated
@@ -23,10 +23,28 @@ def init_db(app):
                 db.users.create_index([("email", ASCENDING)], unique=True)
                 db.users.create_index([("face_registered", ASCENDING)])
                 db.users.create_index([("user_type", ASCENDING)])
+                db.users.create_index([("pass_code", ASCENDING)], sparse=True)
 
                 db.bus_passes.create_index([("user_id", ASCENDING)])
                 db.bus_passes.create_index([("status", ASCENDING)])
                 db.bus_passes.create_index([("expiry_date", ASCENDING)])
+
+                # Face gallery change log: replayed by workers, pruned by Mongo
+                db.gallery_changes.create_index([("seq", ASCENDING)], unique=True)
+                db.gallery_changes.create_index(
+                    [("ts", ASCENDING)], expireAfterSeconds=app.config.get("FACE_GALLERY_CHANGELOG_TTL", 7 * 24 * 3600)
+                )
+
+                # Login sessions: looked up by token hash, removed by Mongo once expired
+                db.sessions.create_index([("token_hash", ASCENDING)], unique=True)
+                db.sessions.create_index([("principal_id", ASCENDING)])
+                db.sessions.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+
+                # Face registration jobs: claimed oldest-first, finished ones expire
+                db.face_jobs.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+                db.face_jobs.create_index(
+                    [("finished_at", ASCENDING)], expireAfterSeconds=app.config.get("FACE_JOB_TTL", 7 * 24 * 3600)
+                )
                 
                 return mongo
         except Exception as e:
@@ -0,0 +1,88 @@
+# backend/utils/sessions.py
+"""
+Login sessions: one document per issued token in the `sessions` collection.
+
+    {token_hash, principal_id, role: "user" | "conductor", principal: {...},
+     created_at, expires_at}
+
+Only the SHA-256 of a token is stored (unique index), so one indexed lookup
+resolves users and conductors alike, and an account can hold a session per
+device. `principal` is a snapshot of the few fields auth views show (name,
+email, user_type, conductorId, depot). Mongo's TTL monitor deletes sessions
+after expires_at; it runs about once a minute, so readers still check expiry.
+"""
+import hashlib
+import uuid
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from config import Config
+from utils.database import mongo
+
+SNAPSHOT_FIELDS = ("name", "email", "user_type", "conductorId", "depot")
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def _snapshot(doc: dict) -> dict:
+    return {k: doc[k] for k in SNAPSHOT_FIELDS if k in doc}
+
+def create_session(doc: dict, role: str, hours: float = None):
+    """
+    Issue a token for a user or conductor document. Returns (token, expires_at).
+    """
+    token = str(uuid.uuid4())
+    now = datetime.utcnow()
+    expires_at = now + timedelta(hours=hours or Config.SESSION_HOURS)
+    mongo.db.sessions.insert_one({
+        "token_hash": hash_token(token),
+        "principal_id": doc["_id"],
+        "role": role,
+        "principal": _snapshot(doc),
+        "created_at": now,
+        "expires_at": expires_at,
+    })
+    return token, expires_at
+
+def find_session(token: str):
+    """
+    Session document for a token, or None. May be past expires_at.
+    """
+    if not token:
+        return None
+    return mongo.db.sessions.find_one({"token_hash": hash_token(token)})
+
+def session_expired(session: dict) -> bool:
+    return session["expires_at"] < datetime.utcnow()
+
+def rotate_session(token: str, hours: float = None):
+    """
+    Replace a live session's token (refresh). Returns (token, expires_at), or
+    None when the token is unknown, expired or was rotated concurrently.
+    """
+    new_token = str(uuid.uuid4())
+    now = datetime.utcnow()
+    expires_at = now + timedelta(hours=hours or Config.SESSION_HOURS)
+    session = mongo.db.sessions.find_one_and_update(
+        {"token_hash": hash_token(token), "expires_at": {"$gt": now}},
+        {"$set": {"token_hash": hash_token(new_token), "expires_at": expires_at, "refreshed_at": now}},
+        return_document=ReturnDocument.AFTER
+    )
+    return (new_token, expires_at) if session else None
+
+def end_session(token: str) -> bool:
+    return mongo.db.sessions.delete_one({"token_hash": hash_token(token)}).deleted_count > 0
+
+def end_principal_sessions(principal_id) -> list:
+    """
+    Delete every session of a user or conductor (e.g. the account was deleted).
+    Returns the token hashes that were removed.
+    """
+    db = mongo.db
+    principal_id = ObjectId(principal_id) if isinstance(principal_id, str) else principal_id
+    hashes = [s["token_hash"] for s in db.sessions.find({"principal_id": principal_id}, {"token_hash": 1})]
+    if hashes:
+        db.sessions.delete_many({"principal_id": principal_id})
+    return hashes